@@ -0,0 +1,132 @@
+"""
+Benchmark alert-threshold backtesting over a synthetic semester
+
+Builds --sessions sessions of --students students sending a frame every
+--interval seconds for --minutes minutes (engagement is a random walk, so
+students drift in and out of the alert zone), then times:
+  scalar  LSTMPredictor + AlertManager frame by frame, on one session, scaled up
+  sweep   AlertBacktester.sweep() over a 3x3x3x3 grid of thresholds
+
+Usage:
+    python benchmarks/bench_alert_backtest.py [--sessions 150] [--students 30] [--minutes 45]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import services.alert_manager as alert_manager
+from models.lstm_predictor import LSTMPredictor
+from services.alert_backtest import AlertBacktester, AlertParams, ReplayFrames
+
+EMOTIONS = np.array(['neutral', 'happy', 'sad', 'surprise', 'angry', 'fear', 'No Face'], dtype=object)
+EMOTION_P = [0.45, 0.2, 0.1, 0.08, 0.05, 0.07, 0.05]
+
+GRID = {
+    'critical_below': [0.25, 0.3, 0.35],
+    'slope_threshold': [0.03, 0.05, 0.08],
+    'window_size': [6, 10, 15],
+    'cooldown_seconds': [30, 60, 120]
+}
+
+
+def build_streams(sessions: int, students: int, minutes: float, interval: float, start: float):
+    rng = np.random.default_rng(7)
+    steps = int(minutes * 60 / interval)
+    streams = []
+    for session in range(sessions):
+        begin = start + session * 86400 / 4
+        for _ in range(students):
+            timestamps = begin + np.arange(steps) * interval + rng.uniform(0, interval, steps)
+            engagement = np.clip(0.6 + np.cumsum(rng.normal(0, 0.04, steps)), 0, 1)
+            emotions = EMOTIONS[rng.choice(len(EMOTIONS), steps, p=EMOTION_P)]
+            engagement[emotions == 'No Face'] = 0.0
+            streams.append((np.sort(timestamps), engagement, emotions))
+    return streams
+
+
+def scalar_replay(streams, params: AlertParams, interval: float) -> int:
+    """What tuning by replaying through the live classes costs, per configuration"""
+    clock = [None]
+
+    class ReplayClock(datetime):
+        @classmethod
+        def now(cls):
+            return clock[0]
+
+    alert_manager.datetime = ReplayClock
+    alerts = 0
+    for timestamps, engagement, emotions in streams:
+        manager = alert_manager.AlertManager()
+        manager.cooldown_seconds = params.cooldown_seconds
+        manager.critical_below = params.critical_below
+        predictor = LSTMPredictor(params.window_size, params.slope_threshold, params.critical_below,
+                                  params.warning_minutes, interval)
+        for ts, score, emotion in zip(timestamps.tolist(), engagement.tolist(), emotions.tolist()):
+            clock[0] = ReplayClock.fromtimestamp(ts)
+            prediction = None
+            if emotion != 'No Face':
+                predictor.add_datapoint(score, emotion)
+                prediction = predictor.predict_trend()
+            frame = SimpleNamespace(prediction=prediction, engagement_score=score, emotion=emotion)
+            alerts += manager.check_and_create_alert('student', frame) is not None
+    alert_manager.datetime = datetime
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=150)
+    parser.add_argument('--students', type=int, default=30)
+    parser.add_argument('--minutes', type=float, default=45.0)
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between frames per student')
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 5, 9, 0).timestamp()
+    build_start = time.perf_counter()
+    streams = build_streams(args.sessions, args.students, args.minutes, args.interval, start)
+    frames = ReplayFrames.from_streams(streams)
+    backtester = AlertBacktester(frames, frame_seconds=args.interval)
+    configs = int(np.prod([len(values) for values in GRID.values()]))
+    print("=" * 60)
+    print(f"ALERT BACKTEST ({args.sessions} sessions x {args.students} students, {len(frames):,} frames)")
+    print(f"built in {time.perf_counter() - build_start:.1f}s")
+    print("=" * 60)
+
+    session = streams[:args.students]
+    begin = time.perf_counter()
+    scalar_alerts = scalar_replay(session, AlertParams(), args.interval)
+    scalar = (time.perf_counter() - begin) * args.sessions
+    single = AlertBacktester(ReplayFrames.from_streams(session), frame_seconds=args.interval).run()
+    assert single['alerts']['total'] == scalar_alerts, (single['alerts'], scalar_alerts)
+
+    begin = time.perf_counter()
+    results = backtester.sweep(GRID)
+    sweep = time.perf_counter() - begin
+
+    print(f"{'path':<28} {'seconds':>10}")
+    print(f"{'scalar, 1 config (est.)':<28} {scalar:>10.1f}")
+    print(f"{f'scalar, {configs} configs (est.)':<28} {scalar * configs:>10.1f}")
+    print(f"{f'sweep, {configs} configs':<28} {sweep:>10.2f}   ({scalar * configs / sweep:,.0f}x)")
+    print()
+
+    print(f"{'crit':>5} {'slope':>6} {'win':>4} {'cool':>5} {'alerts/h':>9} {'warned':>7} {'lead s':>7} {'flap':>6}")
+    for result in sorted(results, key=lambda r: r['alerts_per_student_hour'])[:10]:
+        params = result['params']
+        warned = result['onsets_warned']
+        lead = result['lead_seconds']['median']
+        print(
+            f"{params['critical_below']:>5} {params['slope_threshold']:>6} {params['window_size']:>4} "
+            f"{params['cooldown_seconds']:>5} {result['alerts_per_student_hour']:>9} "
+            f"{warned if warned is not None else '-':>7} {lead if lead is not None else '-':>7} {result['flap_rate']:>6}"
+        )
+
+
+if __name__ == '__main__':
+    main()
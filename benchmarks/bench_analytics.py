@@ -0,0 +1,170 @@
+"""
+Benchmark session analytics on a large synthetic class
+
+Builds one session of --students students sending a frame every --interval
+seconds for --hours hours, then times:
+  legacy   the original dict-per-frame AnalyticsEngine (models/lstm_predictor.py)
+  separate the four generate_* calls the end-of-session endpoint used to make
+  fused    generate_session_analytics(), with and without topic difficulty
+  cached   generate_session_analytics() again with no new frames (cache hit)
+
+Usage:
+    python benchmarks/bench_analytics.py [--students 200] [--hours 3] [--interval 5] [--topics 50]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from models.frame_result import FrameResult
+from models.lstm_predictor import AnalyticsEngine as LegacyAnalyticsEngine
+from services.analytics_engine import AnalyticsEngine
+from services.session_manager import SessionManager
+
+SESSION_ID = 'bench-session'
+EMOTIONS = ['neutral', 'happy', 'sad', 'surprise', 'angry', 'fear']
+
+
+class LegacySessionView:
+    """The dict-per-frame session manager interface the legacy engine expects"""
+
+    def __init__(self, session, frames):
+        self.session = session
+        self.frames = frames
+
+    def get_session_data(self, session_id):
+        return self.session
+
+    def get_student_session_data(self, session_id, student_id):
+        return self.frames.get(student_id, [])
+
+
+def build_session(students: int, hours: float, interval: float, start: float) -> SessionManager:
+    manager = SessionManager(rollup_interval=float('inf'))  # keep every frame in the raw tier
+    manager.create_session(SESSION_ID, 'teacher', 'bench')
+    for i in range(students):
+        manager.add_student_to_session(SESSION_ID, f'student-{i}')
+
+    rng = np.random.default_rng(7)
+    steps = int(hours * 3600 / interval)
+    for step in range(steps):
+        ts = start + step * interval
+        engagement = rng.random(students)
+        emotion = rng.integers(0, len(EMOTIONS), students)
+        for i in range(students):
+            manager.log_frame_data(SESSION_ID, f'student-{i}', FrameResult(
+                f'student-{i}',
+                SESSION_ID,
+                emotion=EMOTIONS[emotion[i]],
+                confidence=0.9,
+                engagement_score=float(engagement[i]),
+                timestamp=ts + i * interval / students
+            ))
+    return manager
+
+
+def legacy_view(manager: SessionManager) -> LegacySessionView:
+    session = manager.get_session_data(SESSION_ID)
+    frames = {}
+    for student_id in session['students']:
+        columns = manager.get_student_session_data(SESSION_ID, student_id)
+        frames[student_id] = [
+            {
+                'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                'engagement_score': float(eng),
+                'emotion': manager.emotion_label(code)
+            }
+            for ts, eng, code in zip(columns.timestamps.tolist(), columns.engagement.tolist(), columns.emotion.tolist())
+        ]
+    return LegacySessionView(session, frames)
+
+
+def topic_list(start: float, hours: float, count: int):
+    span = hours * 3600 / count
+    return [
+        {
+            'name': f'topic-{t}',
+            'start_time': datetime.fromtimestamp(start + t * span).isoformat(),
+            'end_time': datetime.fromtimestamp(start + (t + 1) * span).isoformat()
+        }
+        for t in range(count)
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--hours', type=float, default=3.0)
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between frames per student')
+    parser.add_argument('--topics', type=int, default=50, help='topic segments for topic difficulty')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 5, 9, 0).timestamp()
+    build_start = time.perf_counter()
+    manager = build_session(args.students, args.hours, args.interval, start)
+    frames = manager.frame_store.frame_count(SESSION_ID)
+    print("=" * 60)
+    print(f"SESSION ANALYTICS ({args.students} students, {args.hours:g}h, {frames:,} frames)")
+    print(f"built in {time.perf_counter() - build_start:.1f}s")
+    print("=" * 60)
+
+    engine = AnalyticsEngine(manager, cache_size=0)  # time the computation itself
+    cached_engine = AnalyticsEngine(manager)
+    cached_engine.generate_session_analytics(SESSION_ID)
+    topics = topic_list(start, args.hours, args.topics)
+
+    separate_engine = AnalyticsEngine(manager)
+
+    def separate():
+        # First call computes, the other three hit the cache
+        separate_engine.cache.clear()
+        separate_engine.generate_emotion_distribution(SESSION_ID)
+        separate_engine.generate_engagement_timeline(SESSION_ID)
+        separate_engine.generate_student_comparison(SESSION_ID)
+        separate_engine.generate_attention_heatmap(SESSION_ID)
+
+    results = []
+    legacy_times = {}
+    if not args.skip_legacy:
+        legacy = LegacyAnalyticsEngine(legacy_view(manager))
+
+        def legacy_run():
+            legacy.generate_emotion_distribution(SESSION_ID)
+            legacy.generate_engagement_timeline(SESSION_ID)
+            legacy.generate_student_comparison(SESSION_ID)
+            legacy.generate_attention_heatmap(SESSION_ID)
+
+        charts = timed(legacy_run, 1)
+        legacy_times = {False: charts, True: charts + timed(lambda: legacy.generate_topic_difficulty(SESSION_ID, topics), 1)}
+        results.append(('legacy', False, legacy_times[False]))
+        results.append(('legacy + topics', True, legacy_times[True]))
+    results.append(('separate', False, timed(separate, args.repeat)))
+    results.append(('fused', False, timed(lambda: engine.generate_session_analytics(SESSION_ID), args.repeat)))
+    results.append(('fused + topics', True, timed(lambda: engine.generate_session_analytics(SESSION_ID, topics), args.repeat)))
+    results.append(('cached', False, timed(lambda: cached_engine.generate_session_analytics(SESSION_ID), args.repeat)))
+
+    print(f"{'path':<18} {'ms':>10} {'vs legacy':>10}")
+    for name, with_topics, seconds in results:
+        speedup = f"{legacy_times[with_topics] / seconds:.1f}x" if legacy_times else '-'
+        print(f"{name:<18} {seconds * 1000:>10.3f} {speedup:>10}")
+    print(f"cache: {cached_engine.get_cache_stats()}")
+
+
+if __name__ == '__main__':
+    main()
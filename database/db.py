@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from utils.logger import logger
 
@@ -54,10 +55,107 @@ def init_db():
             )
         ''')
         
+        # Create classroom session archive tables (filled by SessionArchiver)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS classroom_sessions (
+                session_id VARCHAR(100) PRIMARY KEY,
+                teacher_id VARCHAR(100),
+                subject VARCHAR(255),
+                start_time TIMESTAMPTZ,
+                end_time TIMESTAMPTZ,
+                average_engagement DOUBLE PRECISION DEFAULT 0,
+                total_frames INTEGER DEFAULT 0,
+                metadata JSONB,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frame_data (
+                id BIGSERIAL PRIMARY KEY,
+                session_id VARCHAR(100) NOT NULL,
+                student_id VARCHAR(100) NOT NULL,
+                timestamp TIMESTAMPTZ NOT NULL,
+                emotion VARCHAR(50),
+                confidence REAL,
+                engagement_score REAL,
+                prediction_status VARCHAR(20),
+                trend VARCHAR(20),
+                attention_score REAL,
+                attention_level VARCHAR(20),
+                source VARCHAR(100) NOT NULL DEFAULT ''
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frame_rollups (
+                session_id VARCHAR(100) NOT NULL,
+                student_id VARCHAR(100) NOT NULL,
+                minute TIMESTAMPTZ NOT NULL,
+                frame_count INTEGER NOT NULL,
+                engagement_sum DOUBLE PRECISION NOT NULL,
+                engagement_sumsq DOUBLE PRECISION NOT NULL,
+                engagement_min REAL,
+                engagement_max REAL,
+                emotion_counts JSONB,
+                source VARCHAR(100) NOT NULL DEFAULT '',
+                PRIMARY KEY (session_id, student_id, minute, source)
+            )
+        ''')
+        
+        # Archives created before the columns were TIMESTAMPTZ: frames and
+        # rollups were written in UTC, session times in the server's local time
+        local_offset = datetime.now().astimezone().utcoffset()
+        _use_timestamptz(cursor, 'classroom_sessions', 'start_time', local_offset)
+        _use_timestamptz(cursor, 'classroom_sessions', 'end_time', local_offset)
+        _use_timestamptz(cursor, 'frame_data', 'timestamp', timedelta(0))
+        _use_timestamptz(cursor, 'frame_rollups', 'minute', timedelta(0))
+        
+        # Archives from before several workers could each archive their share of a session
+        if _add_source_column(cursor, 'frame_data'):
+            logger.info('🗂️ frame_data.source added')
+        if _add_source_column(cursor, 'frame_rollups'):
+            cursor.execute('ALTER TABLE frame_rollups DROP CONSTRAINT IF EXISTS frame_rollups_pkey')
+            cursor.execute('ALTER TABLE frame_rollups ADD PRIMARY KEY (session_id, student_id, minute, source)')
+            logger.info('🗂️ frame_rollups.source added to the primary key')
+        
+        # Cross-session rollups (filled by SessionRollups when sessions end)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS engagement_daily (
+                dimension VARCHAR(20) NOT NULL,
+                key VARCHAR(255) NOT NULL,
+                day DATE NOT NULL,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                frames BIGINT NOT NULL DEFAULT 0,
+                engagement_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, key, day)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS engagement_hour_of_week (
+                dimension VARCHAR(20) NOT NULL,
+                key VARCHAR(255) NOT NULL,
+                hour_of_week SMALLINT NOT NULL,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                frames BIGINT NOT NULL DEFAULT 0,
+                engagement_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, key, hour_of_week)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_sessions (
+                session_id VARCHAR(100) PRIMARY KEY,
+                rolled_up_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # Create indexes
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_student_id ON sessions(student_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions(start_time DESC)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_score ON leaderboard(total_score DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_frame_data_session ON frame_data(session_id, student_id, timestamp)')
         
         conn.commit()
         cursor.close()
@@ -68,3 +166,30 @@ def init_db():
     except Exception as e:
         logger.error(f'❌ Database initialization error: {e}')
         raise
+
+
+def _use_timestamptz(cursor, table: str, column: str, offset: timedelta):
+    """Convert a TIMESTAMP column to TIMESTAMPTZ, reading old values at the given UTC offset"""
+    cursor.execute('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+    ''', (table, column))
+    row = cursor.fetchone()
+    if row and row['data_type'] == 'timestamp without time zone':
+        cursor.execute(
+            f'ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMPTZ USING {column} AT TIME ZONE %s',
+            (offset,)
+        )
+        logger.info(f'🕒 {table}.{column} converted to TIMESTAMPTZ')
+
+
+def _add_source_column(cursor, table: str) -> bool:
+    """Add the archiving worker's source column to an archive table; False if it was there"""
+    cursor.execute('''
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = 'source'
+    ''', (table,))
+    if cursor.fetchone():
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN source VARCHAR(100) NOT NULL DEFAULT ''")
+    return True
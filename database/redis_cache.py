@@ -55,3 +55,10 @@ class RedisCache:
             return bool(self.client.exists(key))
         else:
             return key in self.memory_cache
+    
+    def pipeline(self):
+        """Batch several commands into a single round trip (None without Redis)"""
+        if self.enabled:
+            return self.client.pipeline(transaction=False)
+        else:
+            return None
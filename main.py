@@ -1,24 +1,35 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import json
-from datetime import datetime
+import os
+from datetime import date, datetime, timedelta
 from typing import Optional
 
 # Import all services
 from models.emotion_detector import EmotionDetector
 from services.frame_processor import FrameProcessor
 from services.session_manager import SessionManager
+from services.session_journal import SessionJournal, claim_worker_dir
+from services.session_archiver import SessionArchiver, ArchivePending
+from services.session_rollups import SessionRollups, DIMENSIONS, TREND_GRAINS
+from services.shared_session_state import SharedSessionState
 from services.analytics_engine import AnalyticsEngine
+from services.class_ticker import ClassTicker
 from services.report_generator import ReportGenerator
+from services.report_jobs import ReportJobs
 from services.gemini_advisor import GeminiAdvisor
 from services.alert_manager import AlertManager
+from services.alert_backtest import backtest_archive
+from services.admission_controller import AdmissionController
 from utils.websocket_manager import ConnectionManager
 from utils.config import Config
 from utils.logger import logger
 from database.db import init_db, get_db_connection  # ← Add get_db_connection
+from database.redis_cache import RedisCache
 
 
 # ============================================================================
@@ -35,13 +46,48 @@ async def lifespan(app: FastAPI):
     init_db()
     
     # Initialize services
-    app.state.frame_processor = FrameProcessor()
-    app.state.session_manager = SessionManager()
+    app.state.alert_manager = AlertManager()
+    app.state.frame_processor = FrameProcessor(app.state.alert_manager)
+    app.state.frame_processor.start()
+    app.state.admission_controller = AdmissionController(
+        app.state.frame_processor.emotion_detector.max_throughput
+    )
+    # Several workers share DATA_DIR; each journals and spills under a slot of its own
+    data_dir = claim_worker_dir(Config.DATA_DIR) if Config.SHARED_STATE_ENABLED else Config.DATA_DIR
+    shared_state = None
+    if Config.SHARED_STATE_ENABLED:
+        cache = RedisCache()
+        if cache.enabled:
+            # Frames are held per slot, so a restarted worker archives its predecessor's
+            shared_state = SharedSessionState(cache, holder=os.path.basename(data_dir))
+            if not Config.ARCHIVE_ENABLED:
+                logger.warning("⚠️ SHARED_STATE_ENABLED without ARCHIVE_ENABLED: frame-level analytics are unavailable")
+        else:
+            logger.warning("⚠️ SHARED_STATE_ENABLED but Redis is unavailable; session state stays local")
+    app.state.shared_state = shared_state
+    
+    app.state.session_manager = SessionManager(
+        journal=SessionJournal(data_dir) if Config.JOURNAL_ENABLED else None,
+        shared=shared_state,
+        data_dir=data_dir
+    )
+    app.state.session_manager.recover()
+    app.state.session_manager.start_compaction()
+    app.state.session_archiver = SessionArchiver(app.state.session_manager)
+    app.state.session_rollups = SessionRollups(app.state.session_manager)
     app.state.analytics_engine = AnalyticsEngine(app.state.session_manager)
     app.state.report_generator = ReportGenerator(app.state.analytics_engine)
+    app.state.report_jobs = ReportJobs(
+        app.state.session_manager,
+        app.state.analytics_engine,
+        app.state.report_generator
+    )
     app.state.gemini_advisor = GeminiAdvisor()
-    app.state.alert_manager = AlertManager()
-    app.state.connection_manager = ConnectionManager()
+    app.state.connection_manager = ConnectionManager(shared_state)
+    if shared_state:
+        shared_state.start(on_shared_event)
+    app.state.class_ticker = ClassTicker(app.state.session_manager.frame_store.emotions)
+    app.state.class_ticker.start(app.state.connection_manager.send_to_session_teachers, shared_state)
     
     logger.success("✅ All services initialized!")
     logger.info(f"🌐 Server running on {Config.HOST}:{Config.PORT}")
@@ -50,6 +96,34 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("👋 Shutting down AI Classroom Backend...")
+    await app.state.frame_processor.stop()
+    await app.state.class_ticker.stop()
+    if app.state.shared_state:
+        await app.state.shared_state.stop()
+    app.state.session_archiver.close()
+    app.state.session_rollups.close()
+    app.state.report_jobs.close()
+    app.state.session_manager.close()
+
+
+async def on_shared_event(event: dict):
+    """Handle an event published by another worker"""
+    if event.get('target') != 'workers':
+        await app.state.connection_manager.deliver(event)
+        return
+    
+    if event['type'] == 'class_window':
+        app.state.class_ticker.receive(event)
+    elif event['type'] == 'session_ended':
+        # Ended elsewhere: archive this worker's share of the frames
+        session_id = event['session_id']
+        session = await asyncio.to_thread(app.state.session_manager.end_local_share, session_id)
+        if session is None:
+            return
+        app.state.class_ticker.drop(session_id)
+        app.state.frame_processor.drop_session(session_id)
+        if Config.ARCHIVE_ENABLED:
+            app.state.session_archiver.schedule(session_id)
 
 
 # ============================================================================
@@ -65,6 +139,12 @@ app = FastAPI(
 )
 
 
+@app.exception_handler(ArchivePending)
+async def archive_pending_handler(request, exc: ArchivePending):
+    """Frame-level analytics of a multi-worker session before its shares are merged"""
+    return JSONResponse(status_code=409, content={'detail': str(exc)})
+
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -108,6 +188,120 @@ async def health_check():
     }
 
 
+@app.get("/api/pipeline/stats")
+async def get_pipeline_stats():
+    """Per-stage metrics of the frame processing pipeline"""
+    return app.state.frame_processor.get_pipeline_stats()
+
+
+@app.get("/api/admission/stats")
+async def get_admission_stats():
+    """Current load versus measured capacity"""
+    return app.state.admission_controller.get_stats()
+
+
+@app.get("/api/live/stats")
+async def get_live_class_stats():
+    """Sessions with live class metrics and ticks sent"""
+    return app.state.class_ticker.get_stats()
+
+
+@app.get("/api/archive/stats")
+async def get_archive_stats():
+    """Archived sessions, rows copied to Postgres and rows/second"""
+    return app.state.session_archiver.get_stats()
+
+
+@app.get("/api/analytics/cache/stats")
+async def get_analytics_cache_stats():
+    """Hit/miss counts of the versioned analytics cache"""
+    return app.state.analytics_engine.get_cache_stats()
+
+
+@app.get("/api/reports/stats")
+async def get_report_stats():
+    """Report jobs by status, files reused and average generation time"""
+    return app.state.report_jobs.get_stats()
+
+
+@app.get("/api/rollups/stats")
+async def get_rollup_stats():
+    """Sessions added to the cross-session rollup tables"""
+    return app.state.session_rollups.get_stats()
+
+
+@app.get("/api/rollups/{dimension}/{key}/trend")
+async def get_engagement_trend(dimension: str, key: str, start: Optional[str] = None,
+                               end: Optional[str] = None, grain: str = 'day'):
+    """
+    Engagement trend of a teacher or subject across sessions
+    
+    Query: start/end as YYYY-MM-DD (default: the last 180 days), grain day|week|month
+    """
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {', '.join(DIMENSIONS)}")
+    if grain not in TREND_GRAINS:
+        raise HTTPException(status_code=400, detail=f"grain must be one of {', '.join(TREND_GRAINS)}")
+    
+    try:
+        end_day = date.fromisoformat(end) if end else date.today()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=180)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    
+    return {
+        'dimension': dimension,
+        'key': key,
+        'grain': grain,
+        'trend': await app.state.session_rollups.trend(dimension, key, start_day, end_day, grain)
+    }
+
+
+@app.get("/api/rollups/{dimension}/{key}/hour-of-week")
+async def get_engagement_by_hour_of_week(dimension: str, key: str):
+    """Engagement of a teacher or subject by hour of the week (0 = Monday 00:00)"""
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {', '.join(DIMENSIONS)}")
+    
+    return {
+        'dimension': dimension,
+        'key': key,
+        'hours': await app.state.session_rollups.hour_of_week(dimension, key)
+    }
+
+
+@app.get("/api/session/{session_id}/live")
+async def get_live_student_stats(session_id: str):
+    """Rolling per-student aggregates across every worker (shared state)"""
+    if not app.state.shared_state:
+        raise HTTPException(status_code=404, detail="Shared session state is not enabled")
+    return {
+        'students': await asyncio.to_thread(app.state.session_manager.get_live_student_stats, session_id),
+        'shared_state': app.state.shared_state.get_stats()
+    }
+
+
+@app.get("/api/scheduler/sessions")
+async def get_scheduler_sessions():
+    """Per-session share of inference capacity: queue depth, served rate, drops"""
+    return app.state.frame_processor.get_session_stats()
+
+
+@app.put("/api/scheduler/sessions/{session_id}/weight")
+async def set_session_weight(session_id: str, body: dict):
+    """
+    Set a session's fair-share weight
+    
+    Body: {"weight": 2.0}
+    """
+    try:
+        app.state.frame_processor.set_session_weight(session_id, float(body['weight']))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {'session_id': session_id, 'weight': float(body['weight'])}
+
+
 # ============================================================================
 # SESSION ENDPOINTS - Updated with DB Integration
 # ============================================================================
@@ -136,22 +330,80 @@ async def create_session(session_data: dict):
 @app.post("/api/session/{session_id}/end")
 async def end_session(session_id: str):
     """End a session and generate analytics"""
-    session = app.state.session_manager.end_session(session_id)
+    session = await asyncio.to_thread(app.state.session_manager.end_session, session_id)
     
     if 'error' in session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    app.state.class_ticker.drop(session_id)
+    app.state.frame_processor.drop_session(session_id)
+    
+    if app.state.shared_state:
+        return await end_shared_session(session_id, session)
+    
+    archiver = app.state.session_archiver
+    # Ending an archived session again only reports on it
+    archived = session.get('archived')
+    if archived:
+        await archiver.ensure_loaded(session_id)
+    
     # Generate analytics
-    analytics = {
-        'emotion_distribution': app.state.analytics_engine.generate_emotion_distribution(session_id),
-        'engagement_timeline': app.state.analytics_engine.generate_engagement_timeline(session_id),
-        'student_comparison': app.state.analytics_engine.generate_student_comparison(session_id),
-        'attention_heatmap': app.state.analytics_engine.generate_attention_heatmap(session_id)
-    }
+    analytics = app.state.analytics_engine.generate_session_analytics(session_id)
     
     # Generate AI suggestions
     suggestions = app.state.gemini_advisor.generate_teaching_suggestions(session, analytics)
     
+    if Config.SESSION_ROLLUPS_ENABLED and not archived:
+        app.state.session_rollups.schedule(session_id)
+    if Config.ARCHIVE_ENABLED and not archived:
+        archiver.schedule(session_id)
+    
+    logger.success(f"✅ Session ended: {session_id}")
+    
+    return {
+        'session': session,
+        'analytics': analytics,
+        'ai_suggestions': suggestions
+    }
+
+
+async def end_shared_session(session_id: str, session: dict):
+    """
+    Analytics of a session whose frames are spread over several workers
+    
+    Every worker archives its share when the session ends; analytics (and
+    the cross-session rollups) use the merged archive. If the merge takes
+    longer than SHARED_ARCHIVE_WAIT_SECONDS the session is returned without
+    analytics, which GET /api/session/{id}/analytics serves once it is done.
+    """
+    archiver = app.state.session_archiver
+    if not Config.ARCHIVE_ENABLED:
+        raise ArchivePending(f"Session {session_id} has frames on several workers and archival is disabled")
+    
+    if not session.get('archived'):
+        archiver.schedule(session_id)
+    merged = archiver.merge(session_id)
+    if Config.SESSION_ROLLUPS_ENABLED and not session.get('archived'):
+        # Rolled up from the merged frames, even if this request stops waiting
+        merged.add_done_callback(
+            lambda task: not task.cancelled() and task.result() and app.state.session_rollups.schedule(session_id)
+        )
+    
+    try:
+        loaded = await asyncio.wait_for(asyncio.shield(merged), Config.SHARED_ARCHIVE_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        loaded = False
+    if not loaded:
+        logger.warning(f"⚠️ Session ended: {session_id} (analytics pending the archive merge)")
+        return {
+            'session': session,
+            'analytics': None,
+            'ai_suggestions': None,
+            'analytics_pending': True
+        }
+    
+    analytics = app.state.analytics_engine.generate_session_analytics(session_id)
+    suggestions = app.state.gemini_advisor.generate_teaching_suggestions(session, analytics)
     logger.success(f"✅ Session ended: {session_id}")
     
     return {
@@ -164,18 +416,120 @@ async def end_session(session_id: str):
 @app.get("/api/session/{session_id}/analytics")
 async def get_analytics(session_id: str):
     """Get real-time analytics for a session"""
+    await app.state.session_archiver.ensure_loaded(session_id)
+    session = app.state.session_manager.get_session_data(session_id)
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    analytics = app.state.analytics_engine.generate_session_analytics(session_id)
+    
+    return {
+        'emotion_distribution': analytics['emotion_distribution'],
+        'engagement_timeline': analytics['engagement_timeline'],
+        'student_comparison': analytics['student_comparison']
+    }
+
+
+@app.get("/api/session/{session_id}/timeline")
+async def get_engagement_timeline(session_id: str, points: Optional[int] = None,
+                                  resolution: Optional[int] = None):
+    """
+    Class engagement over time, optionally downsampled for dashboards
+    
+    Query: points (keep at most N points, LTTB) and/or resolution (seconds per bucket, >= 60)
+    """
+    await app.state.session_archiver.ensure_loaded(session_id)
+    session = app.state.session_manager.get_session_data(session_id)
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        return app.state.analytics_engine.generate_engagement_timeline(session_id, points, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/session/{session_id}/heatmap")
+async def get_attention_heatmap(session_id: str, encoding: str = 'json'):
+    """
+    Students x minutes attention heatmap on the session's time axis
+    
+    encoding=base64 returns the matrix as little-endian float32 bytes
+    (NaN where a student sent no frames that minute) for large classes.
+    """
+    await app.state.session_archiver.ensure_loaded(session_id)
     session = app.state.session_manager.get_session_data(session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    analytics = {
-        'emotion_distribution': app.state.analytics_engine.generate_emotion_distribution(session_id),
-        'engagement_timeline': app.state.analytics_engine.generate_engagement_timeline(session_id),
-        'student_comparison': app.state.analytics_engine.generate_student_comparison(session_id)
+    try:
+        return app.state.analytics_engine.generate_attention_heatmap(session_id, encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/session/{session_id}/percentiles")
+async def get_engagement_percentiles(session_id: str, percentiles: str = '10,25,50,75,90', bottom: float = 0.1):
+    """Engagement percentiles of the class and each student, plus the lowest-engaged students"""
+    await app.state.session_archiver.ensure_loaded(session_id)
+    if not app.state.session_manager.get_session_data(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        requested = [float(p) for p in percentiles.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    
+    # Sketches are read from Redis with shared state, so off the event loop
+    engine = app.state.analytics_engine
+    result = await asyncio.to_thread(engine.generate_engagement_percentiles, session_id, requested)
+    result['bottom_students'] = await asyncio.to_thread(engine.generate_bottom_students, session_id, bottom)
+    return result
+
+
+@app.get("/api/percentiles/{scope}/{key}")
+async def get_cross_session_percentiles(scope: str, key: str, percentiles: str = '10,25,50,75,90'):
+    """Engagement percentiles over every ended session of a subject or student"""
+    if scope not in ('subject', 'student'):
+        raise HTTPException(status_code=400, detail="scope must be 'subject' or 'student'")
+    
+    try:
+        requested = [float(p) for p in percentiles.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    
+    return await asyncio.to_thread(app.state.analytics_engine.generate_sketch_percentiles, f'{scope}:{key}', requested)
+
+
+@app.post("/api/session/{session_id}/topics")
+async def get_topic_difficulty(session_id: str, timeline: dict):
+    """
+    Difficulty score per topic or slide from the dashboard's timeline
+    
+    Body: {
+        "topics": [
+            {"name": "Binary Trees", "start_time": "2026-01-05T09:00:00", "end_time": "2026-01-05T09:20:00"},
+            {"name": "Slide 2", "start_time": 1767603600.0}
+        ]
     }
+    Times are ISO strings or epoch seconds; without an end_time a topic runs
+    until the next one starts (slide timelines).
+    """
+    await app.state.session_archiver.ensure_loaded(session_id)
+    session = app.state.session_manager.get_session_data(session_id)
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        difficulty = app.state.analytics_engine.generate_topic_difficulty(session_id, timeline.get('topics', []))
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid topic timeline: {e}")
     
-    return analytics
+    return {'topic_difficulty': difficulty}
 
 
 # ============================================================================
@@ -485,26 +839,76 @@ async def update_leaderboard_score(leaderboard_data: dict):
 @app.get("/api/session/{session_id}/report/pdf")
 async def download_pdf_report(session_id: str):
     """Download PDF report"""
+    await app.state.session_archiver.ensure_loaded(session_id)
     session = app.state.session_manager.get_session_data(session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    analytics = {
-        'emotion_distribution': app.state.analytics_engine.generate_emotion_distribution(session_id),
-        'student_comparison': app.state.analytics_engine.generate_student_comparison(session_id),
-        'peak_engagement': 95.0
-    }
-    
-    pdf_path = app.state.report_generator.generate_pdf_report(session_id, session, analytics)
+    # Rendered on the report workers; reused while the session is unchanged
+    job = app.state.report_jobs.submit(session_id, session, 'pdf')
+    job = await app.state.report_jobs.wait(job['job_id'])
+    if job['status'] != 'done':
+        raise HTTPException(status_code=500, detail=f"Report generation failed: {job.get('error')}")
     
     return FileResponse(
-        pdf_path,
+        job['path'],
         media_type='application/pdf',
         filename=f"session_{session_id}_report.pdf"
     )
 
 
+@app.post("/api/session/{session_id}/report")
+async def request_report(session_id: str, format: str = 'pdf'):
+    """
+    Start generating a report (pdf or json) and return its job
+    
+    Poll /api/reports/{job_id} until status is 'done', then fetch download_url.
+    Requests for a report already being generated join that job; an
+    unchanged session returns the finished job straight away.
+    """
+    await app.state.session_archiver.ensure_loaded(session_id)
+    session = app.state.session_manager.get_session_data(session_id)
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        job = app.state.report_jobs.submit(session_id, session, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return app.state.report_jobs.describe(job)
+
+
+@app.get("/api/reports/{job_id}")
+async def get_report_job(job_id: str):
+    """Status of a report job: queued, running, done or failed"""
+    job = app.state.report_jobs.get_job(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    
+    return app.state.report_jobs.describe(job)
+
+
+@app.get("/api/reports/{job_id}/download")
+async def download_report(job_id: str):
+    """Download a finished report"""
+    job = app.state.report_jobs.get_job(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+    
+    return FileResponse(
+        job['path'],
+        media_type='application/pdf' if job['format'] == 'pdf' else 'application/json',
+        filename=f"session_{job['session_id']}_report.{job['format']}"
+    )
+
+
 @app.post("/api/quiz/generate")
 async def generate_quiz(quiz_request: dict):
     """
@@ -531,6 +935,38 @@ async def get_recent_alerts(limit: int = 10):
     }
 
 
+@app.post("/api/alerts/backtest")
+async def backtest_alert_thresholds(request: dict):
+    """
+    Replay archived sessions through the alert rules for a grid of thresholds
+    
+    Body: {
+        "start": "2026-01-05", "end": "2026-05-29",
+        "grid": {"critical_below": [0.25, 0.3], "slope_threshold": [0.03, 0.05], "cooldown_seconds": [30, 60]}
+    }
+    Sessions that started between start and end (inclusive, default: the
+    last 180 days) are replayed; grid keys are critical_below,
+    warning_minutes, emotion_below, cooldown_seconds, window_size and
+    slope_threshold, and unlisted ones keep their live value.
+    """
+    try:
+        end_day = date.fromisoformat(request['end']) if request.get('end') else date.today()
+        start_day = date.fromisoformat(request['start']) if request.get('start') else end_day - timedelta(days=180)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    grid = request.get('grid') or {}
+    if not isinstance(grid, dict) or not all(isinstance(values, list) and values for values in grid.values()):
+        raise HTTPException(status_code=400, detail="grid must map parameter names to non-empty lists")
+    
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, backtest_archive, start, end, grid)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid grid: {e}")
+
+
 # ============================================================================
 # WebSocket Endpoints
 # ============================================================================
@@ -540,6 +976,19 @@ async def get_recent_alerts(limit: int = 10):
 async def student_websocket(websocket: WebSocket):
     student_id = None
     session_id = "default_session"
+    connection_key = id(websocket)
+    
+    retry_after = app.state.admission_controller.try_admit(connection_key)
+    if retry_after is not None:
+        await websocket.accept()
+        await websocket.send_text(json.dumps({
+            'type': 'rejected',
+            'reason': 'Server at capacity',
+            'retry_after_seconds': retry_after
+        }))
+        await websocket.close(code=1013)  # Try Again Later
+        logger.warning(f"Student connection rejected, retry in {retry_after}s")
+        return
     
     try:
         await app.state.connection_manager.connect_student(websocket, "temp", session_id)
@@ -547,44 +996,45 @@ async def student_websocket(websocket: WebSocket):
         while True:
             data = await websocket.receive_text()
             json_data = json.loads(data)
+            app.state.admission_controller.record_frame()
             
             student_id = json_data.get('student_id', 'unknown')
+            session_id = json_data.get('session_id', session_id)
             image_b64 = json_data.get('image')
             
             app.state.session_manager.add_student_to_session(session_id, student_id)
             
             result = await app.state.frame_processor.process_student_frame(
                 student_id,
-                image_b64
+                image_b64,
+                session_id
             )
             
-            app.state.session_manager.log_frame_data(session_id, student_id, result)
+            skipped = result.status in ('sampled_out', 'dropped')
+            if not skipped:
+                app.state.session_manager.log_frame_data(session_id, student_id, result)
+                app.state.class_ticker.record(session_id, student_id, result)
             
-            alert = app.state.alert_manager.check_and_create_alert(student_id, result)
-            if alert:
+            if result.alert:
                 await app.state.connection_manager.broadcast_to_teachers({
                     'type': 'alert',
-                    'data': alert
+                    'data': result.alert
                 })
             
-            # Ensure proper data types for Flutter
-            response = {
-                'emotion': str(result.get('emotion', 'neutral')),
-                'engagement_score': float(result.get('engagement_score', 0.0)),
-                'focus_score': int(result.get('focus_score', 0)),
-                'recommendation': str(result.get('recommendation', 'Keep learning!')),
-                'timestamp': str(result.get('timestamp', datetime.now().isoformat()))
-            }
+            await websocket.send_text(json.dumps(result.to_student_message()))
             
-            await websocket.send_text(json.dumps(response))
+            control = app.state.admission_controller.control_message(connection_key)
+            if control:
+                await websocket.send_text(json.dumps(control))
             
-            await app.state.connection_manager.broadcast_to_teachers({
-                'type': 'student_update',
-                'student_id': student_id,
-                'data': result
-            })
+            if not skipped:
+                await app.state.connection_manager.broadcast_to_teachers({
+                    'type': 'student_update',
+                    'student_id': student_id,
+                    'data': result.to_dict()
+                })
             
-            logger.debug(f"📸 Processed frame for {student_id}: {result.get('emotion')}")
+            logger.debug(f"📸 Processed frame for {student_id}: {result.emotion}")
             
     except WebSocketDisconnect:
         if student_id:
@@ -594,6 +1044,8 @@ async def student_websocket(websocket: WebSocket):
         logger.error(f"❌ WebSocket error: {e}")
         if student_id:
             app.state.connection_manager.disconnect_student(student_id)
+    finally:
+        app.state.admission_controller.release(connection_key)
 
 
 @app.websocket("/ws/dashboard")
@@ -625,6 +1077,18 @@ async def dashboard_websocket(websocket: WebSocket):
                     'data': quiz
                 })
             
+            elif command == 'subscribe_session':
+                # Live class_tick messages for this session, starting with the current one
+                session_id = json_data.get('session_id', 'default_session')
+                app.state.connection_manager.subscribe_teacher(websocket, session_id)
+                tick = app.state.class_ticker.tick_message(session_id)
+                if tick:
+                    await websocket.send_text(json.dumps(tick))
+            
+            elif command == 'unsubscribe_session':
+                session_id = json_data.get('session_id', 'default_session')
+                app.state.connection_manager.unsubscribe_teacher(websocket, session_id)
+            
             elif command == 'get_stats':
                 session_id = json_data.get('session_id', 'default_session')
                 session_data = app.state.session_manager.get_session_data(session_id)
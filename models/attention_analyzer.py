@@ -12,18 +12,17 @@ class AttentionAnalyzer:
         self.blink_count = 0
         self.distraction_events = []
     
-    def analyze_attention(self, emotion_data: Dict) -> Dict:
+    def analyze_attention(self, frame_result) -> Dict:
         """
         Analyze attention level from emotion and facial features
         
         Args:
-            emotion_data: Output from emotion_detector
+            frame_result: FrameResult with the classified emotion
             
         Returns:
             Attention metrics
         """
-        engagement = emotion_data.get('engagement_score', 0.5)
-        emotion = emotion_data.get('emotion', 'neutral')
+        engagement = frame_result.engagement_score
         
         # Track gaze (simplified - in production use eye tracking)
         self.gaze_history.append(engagement)
@@ -38,7 +37,7 @@ class AttentionAnalyzer:
             if len(recent_engagement) >= 2:
                 if recent_engagement[-1] < recent_engagement[-2] - 0.3:
                     self.distraction_events.append({
-                        'timestamp': emotion_data.get('timestamp'),
+                        'timestamp': frame_result.timestamp,
                         'drop': recent_engagement[-2] - recent_engagement[-1]
                     })
         else:
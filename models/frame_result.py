@@ -0,0 +1,86 @@
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Dict, Optional
+
+
+def iso_timestamp(ts: float) -> str:
+    """Format an epoch timestamp the way the API always has (local ISO 8601)"""
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+def minute_key(ts: float) -> str:
+    """Minute bucket label (YYYY-MM-DDTHH:MM) for an epoch timestamp"""
+    return time.strftime('%Y-%m-%dT%H:%M', time.localtime(ts))
+
+
+@dataclass(slots=True)
+class FrameResult:
+    """
+    Result of processing one student frame
+
+    A single instance is created per frame and filled in by each pipeline
+    stage. The timestamp stays numeric (epoch seconds) and the object is only
+    turned into a JSON-ready dict once, at the API edge.
+    """
+
+    student_id: str
+    session_id: str = "default_session"
+    status: str = 'success'  # success / no_face / sampled_out / dropped
+    face_detected: bool = False
+    emotion: str = 'neutral'
+    confidence: float = 0.0
+    engagement_score: float = 0.0
+    face_location: Optional[tuple] = None  # (x, y, w, h)
+    prediction: Optional[Dict] = None
+    attention: Optional[Dict] = None
+    alert_needed: bool = False
+    recommendation: str = 'Keep learning!'
+    message: Optional[str] = None
+    error: Optional[str] = None
+    alert: Optional[Dict] = None
+    timestamp: float = field(default_factory=time.time)
+    _payload: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def focus_score(self) -> int:
+        return int(self.engagement_score * 100)
+
+    def repeat(self, status: str) -> 'FrameResult':
+        """Copy of this result re-stamped for a frame that skipped inference"""
+        return replace(self, status=status, alert_needed=False, alert=None, timestamp=time.time())
+
+    def to_dict(self) -> Dict:
+        """JSON-ready dict for dashboards (built once, then cached)"""
+        if self._payload is None:
+            payload = {
+                'student_id': self.student_id,
+                'session_id': self.session_id,
+                'status': self.status,
+                'emotion': self.emotion,
+                'confidence': self.confidence,
+                'engagement_score': self.engagement_score,
+                'focus_score': self.focus_score,
+                'alert_needed': self.alert_needed,
+                'recommendation': self.recommendation,
+                'timestamp': iso_timestamp(self.timestamp)
+            }
+            if self.prediction is not None:
+                payload['prediction'] = self.prediction
+            if self.attention is not None:
+                payload['attention'] = self.attention
+            if self.message:
+                payload['message'] = self.message
+            self._payload = payload
+        return self._payload
+
+    def to_student_message(self) -> Dict:
+        """Compact response for the student app"""
+        payload = self.to_dict()
+        return {
+            'emotion': payload['emotion'],
+            'engagement_score': payload['engagement_score'],
+            'focus_score': payload['focus_score'],
+            'recommendation': payload['recommendation'],
+            'timestamp': payload['timestamp']
+        }
@@ -189,8 +189,13 @@ class AnalyticsEngine:
         return difficulty_scores
     
 class LSTMPredictor:
-    def __init__(self, window_size=10):
+    def __init__(self, window_size=10, slope_threshold=0.05, critical_below=0.3,
+                 warning_minutes=5.0, frame_seconds=2.0):
         self.window_size = window_size
+        self.slope_threshold = slope_threshold
+        self.critical_below = critical_below
+        self.warning_minutes = warning_minutes
+        self.frame_seconds = frame_seconds
         self.engagement_history = deque(maxlen=window_size)
         self.emotion_history = deque(maxlen=window_size)
     
@@ -212,19 +217,19 @@ class LSTMPredictor:
         x = np.arange(n)
         slope = np.polyfit(x, history, 1)[0]
         current_avg = np.mean(history[-3:])
-        if slope < -0.05:
+        if slope < -self.slope_threshold:
             trend = 'declining'
-        elif slope > 0.05:
+        elif slope > self.slope_threshold:
             trend = 'improving'
         else:
             trend = 'stable'
         time_to_critical_min = None
-        if trend == 'declining' and current_avg > 0.3 and slope != 0:
-            time_to_critical = (0.3 - current_avg) / slope
-            time_to_critical_min = abs(time_to_critical * 2 / 60)
-        if current_avg < 0.3:
+        if trend == 'declining' and current_avg > self.critical_below and slope != 0:
+            time_to_critical = (self.critical_below - current_avg) / slope
+            time_to_critical_min = abs(time_to_critical * self.frame_seconds / 60)
+        if current_avg < self.critical_below:
             prediction = 'critical'
-        elif trend == 'declining' and time_to_critical_min and time_to_critical_min < 5:
+        elif trend == 'declining' and time_to_critical_min and time_to_critical_min < self.warning_minutes:
             prediction = 'warning'
         else:
             prediction = 'normal'
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+import time
+from typing import Dict, Optional
+
+from utils.config import Config
+
+
+class _StudentSampling:
+    __slots__ = ('interval', 'last_processed_at', 'reference', 'processed', 'skipped')
+
+    def __init__(self):
+        self.interval = 0.0  # seconds between processed frames, 0 = every frame
+        self.last_processed_at = 0.0
+        self.reference = None  # signature of the last processed frame
+        self.processed = 0
+        self.skipped = 0
+
+
+class AdaptiveSampler:
+    """
+    Per-student adaptive frame sampling
+
+    Students whose engagement has been stable (flat trend, low variance, high
+    predictor confidence) are processed less often, backing off exponentially
+    up to SAMPLER_MAX_INTERVAL seconds. Sampling snaps back to every frame as
+    soon as the trend declines, an alert state is predicted, the face is lost,
+    or the incoming frame differs noticeably from the last processed one.
+    """
+
+    SIGNATURE_SIZE = (32, 32)
+
+    def __init__(self):
+        self.enabled = Config.SAMPLER_ENABLED
+        self.base_interval = Config.SAMPLER_BASE_INTERVAL
+        self.max_interval = Config.SAMPLER_MAX_INTERVAL
+        self.min_confidence = Config.SAMPLER_MIN_CONFIDENCE
+        self.max_std = Config.SAMPLER_MAX_STD
+        self.diff_threshold = Config.SAMPLER_DIFF_THRESHOLD
+        self.students: Dict[str, _StudentSampling] = {}
+
+    def signature(self, frame) -> Optional[np.ndarray]:
+        """Tiny grayscale thumbnail used to detect scene changes (thread-safe)"""
+        if not self.enabled or frame is None:
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def should_process(self, student_id: str, signature: Optional[np.ndarray]) -> bool:
+        """Decide whether this frame needs full inference"""
+        if not self.enabled:
+            return True
+
+        state = self.students.get(student_id)
+        if state is None:
+            state = self.students[student_id] = _StudentSampling()
+
+        now = time.monotonic()
+        changed = self._changed(state.reference, signature)
+        if changed:
+            state.interval = 0.0
+
+        process = state.interval <= 0 or now - state.last_processed_at >= state.interval
+
+        if process:
+            state.last_processed_at = now
+            state.reference = signature
+            state.processed += 1
+        else:
+            state.skipped += 1
+
+        return process
+
+    def update(self, student_id: str, prediction: Dict, engagement_std: float):
+        """Adjust the student's sampling interval from the latest trend prediction"""
+        state = self.students.get(student_id)
+        if state is None:
+            return
+
+        stable = (
+            prediction.get('prediction') == 'normal'
+            and prediction.get('trend') == 'stable'
+            and prediction.get('confidence', 0.0) >= self.min_confidence
+            and engagement_std <= self.max_std
+        )
+
+        if stable:
+            state.interval = min(self.max_interval, max(self.base_interval, state.interval * 2))
+        else:
+            state.interval = 0.0
+
+    def reset(self, student_id: str):
+        """Return a student to full-rate processing"""
+        state = self.students.get(student_id)
+        if state is not None:
+            state.interval = 0.0
+
+    def get_stats(self) -> Dict:
+        processed = sum(s.processed for s in self.students.values())
+        skipped = sum(s.skipped for s in self.students.values())
+        total = processed + skipped
+
+        return {
+            'enabled': self.enabled,
+            'frames_processed': processed,
+            'frames_skipped': skipped,
+            'skip_ratio': round(skipped / total, 3) if total else 0.0,
+            'students_backed_off': sum(1 for s in self.students.values() if s.interval > 0),
+            'intervals': {
+                student_id: round(s.interval, 1)
+                for student_id, s in self.students.items()
+            }
+        }
+
+    def _changed(self, reference: Optional[np.ndarray], signature: Optional[np.ndarray]) -> bool:
+        if reference is None or signature is None:
+            return False
+        return float(np.mean(np.abs(signature - reference))) > self.diff_threshold
@@ -0,0 +1,134 @@
+import random
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from utils.config import Config
+from utils.logger import logger
+
+
+class AdmissionController:
+    """
+    Admission control and backpressure for student frame streams
+
+    Compares the aggregate incoming frame rate with the capacity measured by
+    the emotion detector benchmark. While over budget, every student client is
+    advised to send one frame every N seconds so the total fits the budget, and
+    once the worst case (every client at ADMISSION_MAX_INTERVAL) no longer fits,
+    new connections are turned away with a retry hint. The worst case is scaled
+    by how fast clients actually send compared with what they were advised, so
+    clients that ignore the advice fill the budget sooner.
+    """
+
+    RATE_WINDOW_SECONDS = 10.0
+
+    def __init__(self, measured_fps: float):
+        """
+        Args:
+            measured_fps: Frames/second the server can process (from the benchmark)
+        """
+        capacity = Config.ADMISSION_CAPACITY_FPS or measured_fps
+        self.capacity_fps = max(capacity * Config.ADMISSION_TARGET_UTILIZATION, 0.01)
+        self.base_interval = float(Config.FRAME_PROCESSING_INTERVAL)
+        self.max_interval = max(Config.ADMISSION_MAX_INTERVAL, self.base_interval)
+        self.retry_after = Config.ADMISSION_RETRY_SECONDS
+        self.max_clients = max(1, int(self.capacity_fps * self.max_interval))
+
+        self.clients: Dict[int, float] = {}  # connection key -> interval last advised
+        self.arrivals = deque()
+        self.rejected = 0
+        self.throttling = False
+
+        logger.info(
+            f"Admission control: {self.capacity_fps:.1f} frames/s budget, "
+            f"up to {self.max_clients} students"
+        )
+
+    def try_admit(self, key: int) -> Optional[float]:
+        """
+        Register a new student connection
+
+        Returns:
+            None when admitted, otherwise seconds the client should wait before retrying
+        """
+        if len(self.clients) >= self.max_clients or self._projected_rate() > self.capacity_fps:
+            self.rejected += 1
+            # Jitter so rejected clients don't all come back at once
+            return round(self.retry_after * random.uniform(1.0, 1.5), 1)
+
+        self.clients[key] = self.base_interval
+        return None
+
+    def release(self, key: int):
+        """Forget a disconnected student connection"""
+        self.clients.pop(key, None)
+
+    def record_frame(self):
+        """Count an incoming student frame toward the aggregate rate"""
+        now = time.monotonic()
+        self.arrivals.append(now)
+        self._trim(now)
+
+    def current_rate(self) -> float:
+        """Aggregate incoming frames/second over the recent window"""
+        self._trim(time.monotonic())
+        return len(self.arrivals) / self.RATE_WINDOW_SECONDS
+
+    def advised_interval(self) -> float:
+        """Seconds/frame each client should use so the total stays within budget"""
+        rate = self.current_rate()
+
+        # Hysteresis: start throttling above budget, stop once well below it
+        if rate > self.capacity_fps:
+            self.throttling = True
+        elif rate < self.capacity_fps * 0.8:
+            self.throttling = False
+
+        return self._interval(self.throttling)
+
+    def control_message(self, key: int) -> Optional[Dict]:
+        """Control message for this client if its advised interval changed"""
+        if key not in self.clients:
+            return None
+
+        interval = self.advised_interval()
+        if abs(interval - self.clients[key]) < 0.5:
+            return None
+
+        self.clients[key] = interval
+        return {
+            'type': 'control',
+            'action': 'slow_down' if interval > self.base_interval else 'resume',
+            'frame_interval_seconds': interval
+        }
+
+    def get_stats(self) -> Dict:
+        # Read-only: polling stats must not move the throttling hysteresis
+        throttling = self.throttling
+        return {
+            'capacity_fps': round(self.capacity_fps, 2),
+            'current_fps': round(self.current_rate(), 2),
+            'throttling': throttling,
+            'advised_interval_seconds': self._interval(throttling),
+            'connected_students': len(self.clients),
+            'max_students': self.max_clients,
+            'rejected_connections': self.rejected
+        }
+
+    def _interval(self, throttling: bool) -> float:
+        if not throttling:
+            return self.base_interval
+
+        needed = len(self.clients) / self.capacity_fps
+        return round(min(self.max_interval, max(self.base_interval, needed)), 1)
+
+    def _projected_rate(self) -> float:
+        """Frames/second with one more client once all are at max_interval, at their measured compliance"""
+        advised = sum(1.0 / interval for interval in self.clients.values())
+        compliance = self.current_rate() / advised if advised else 1.0
+        return compliance * (len(self.clients) + 1) / self.max_interval
+
+    def _trim(self, now: float):
+        cutoff = now - self.RATE_WINDOW_SECONDS
+        while self.arrivals and self.arrivals[0] < cutoff:
+            self.arrivals.popleft()
@@ -0,0 +1,433 @@
+import csv
+import io
+import itertools
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from database.db import get_db_connection
+from utils.config import Config
+
+
+DISTRESS_EMOTIONS = ('sad', 'fear')
+NO_FACE = 'No Face'
+
+# Alert type codes
+NONE, CRITICAL, WARNING, EMOTION = 0, 1, 2, 3
+ALERT_TYPES = {CRITICAL: 'critical', WARNING: 'warning', EMOTION: 'emotion'}
+
+COPY_ARCHIVE_SQL = '''
+    COPY (
+        SELECT f.session_id, f.student_id, EXTRACT(EPOCH FROM f.timestamp), f.engagement_score, f.emotion
+        FROM frame_data f JOIN classroom_sessions s USING (session_id)
+        WHERE s.start_time >= {start} AND s.start_time < {end}
+        ORDER BY f.session_id, f.student_id, f.timestamp
+    ) TO STDOUT WITH (FORMAT csv)
+'''
+
+
+@dataclass(frozen=True)
+class AlertParams:
+    """One alerting configuration (the live defaults come from Config)"""
+
+    critical_below: float = Config.ALERT_CRITICAL_ENGAGEMENT
+    warning_minutes: float = Config.ALERT_WARNING_MINUTES
+    emotion_below: float = Config.ALERT_EMOTION_ENGAGEMENT
+    cooldown_seconds: float = Config.ALERT_COOLDOWN_SECONDS
+    window_size: int = Config.PREDICTOR_WINDOW
+    slope_threshold: float = Config.PREDICTOR_SLOPE_THRESHOLD
+
+
+class ReplayFrames:
+    """
+    Recorded frames laid out for replay: one contiguous, time-ordered run
+    per (session, student) stream, as flat columns
+    """
+
+    def __init__(self, timestamps: np.ndarray, engagement: np.ndarray, emotions: np.ndarray, starts: np.ndarray):
+        """
+        Args:
+            timestamps: Epoch seconds, sorted within each stream
+            engagement: Engagement scores
+            emotions: Emotion labels (object array)
+            starts: Offset of each stream's first frame
+        """
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.engagement = np.asarray(engagement, dtype=np.float64)
+        self.face = emotions != NO_FACE
+        self.distressed = np.isin(emotions, DISTRESS_EMOTIONS)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], len(self.timestamps)) if len(self.starts) else self.starts
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def streams(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_streams(cls, streams: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> 'ReplayFrames':
+        """Build from (timestamps, engagement, emotion labels) per stream; empty streams are skipped"""
+        streams = [stream for stream in streams if len(stream[0])]
+        if not streams:
+            empty = np.empty(0)
+            return cls(empty, empty, np.empty(0, dtype=object), np.empty(0, dtype=np.int64))
+        sizes = np.array([len(stream[0]) for stream in streams], dtype=np.int64)
+        return cls(
+            np.concatenate([stream[0] for stream in streams]),
+            np.concatenate([stream[1] for stream in streams]),
+            np.concatenate([np.asarray(stream[2], dtype=object) for stream in streams]),
+            np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        )
+
+    @classmethod
+    def from_session_manager(cls, session_manager, session_ids: Iterable[str]) -> 'ReplayFrames':
+        """
+        The raw frames of sessions held in memory (ensure_loaded() archived ones first)
+
+        Only the raw tier can be replayed: frames already compacted into
+        minute rollups (older than RAW_RETENTION_SECONDS while the session
+        ran) are not part of the replay.
+        """
+        labels = np.array(session_manager.frame_store.emotions.labels, dtype=object)
+        streams = []
+        for session_id in session_ids:
+            session = session_manager.get_session_data(session_id)
+            if not session:
+                continue
+            for student_id in session['students']:
+                view = session_manager.get_student_session_data(session_id, student_id)
+                streams.append((view.timestamps.copy(), view.engagement, labels[view.emotion]))
+        return cls.from_streams(streams)
+
+    @classmethod
+    def from_archive(cls, start: datetime, end: datetime) -> 'ReplayFrames':
+        """
+        Archived raw frames of every session that started in [start, end), in one COPY
+
+        Naive bounds are local time, like the session start times.
+        """
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            sql = COPY_ARCHIVE_SQL.format(
+                start=cursor.mogrify('%s', (start.astimezone(),)).decode(),
+                end=cursor.mogrify('%s', (end.astimezone(),)).decode()
+            )
+            buffer = io.StringIO()
+            cursor.copy_expert(sql, buffer)
+            cursor.close()
+        finally:
+            conn.close()
+
+        buffer.seek(0)
+        rows = list(csv.reader(buffer))
+        if not rows:
+            return cls.from_streams([])
+        session_ids, student_ids, timestamps, engagement, emotions = zip(*rows)
+        session_ids = np.array(session_ids, dtype=object)
+        student_ids = np.array(student_ids, dtype=object)
+        # Rows arrive sorted by session and student, so each stream is one contiguous run
+        changed = (session_ids[1:] != session_ids[:-1]) | (student_ids[1:] != student_ids[:-1])
+        return cls(
+            np.array(timestamps, dtype=np.float64),
+            np.array(engagement, dtype=np.float64),
+            np.array(emotions, dtype=object),
+            np.flatnonzero(np.r_[True, changed])
+        )
+
+
+class AlertBacktester:
+    """
+    Replays recorded frames through the trend predictor and alert rules
+
+    Reproduces what LSTMPredictor and AlertManager would have done frame by
+    frame, for every stream at once:
+
+    - The predictor's polyfit slope over its last window_size face frames
+      is a closed-form rolling least-squares slope from two prefix sums,
+      and the 3-frame current average is a prefix-sum difference, so the
+      trend of every frame comes from a few whole-array operations.
+    - The alert rules (critical, else warning, else distressed emotion)
+      are boolean masks over all frames.
+    - The per-student cooldown is the only sequential part: from each
+      alert, the next is the first candidate more than cooldown_seconds
+      later. All streams advance together, one searchsorted per step, so
+      the loop runs once per alert of the busiest stream, not per frame.
+
+    Slopes and averages are cached per window size, and everything but
+    the cooldown pass is reused between consecutive configurations that
+    differ only in cooldown_seconds (sweep() varies it last).
+
+    Reported per configuration: alert counts by type, lead time (how long
+    before a critical onset - the 3-frame average dropping below
+    critical_below - the stream's first warning since the previous onset
+    fired, within horizon_seconds), and flapping (re-alerts within
+    flap_seconds of the previous alert with a frame in between that would
+    not have alerted, and alerting/quiet state flips per student-hour).
+    """
+
+    def __init__(self, frames: ReplayFrames, frame_seconds: float = Config.FRAME_PROCESSING_INTERVAL,
+                 horizon_seconds: float = 600.0, flap_seconds: float = 120.0):
+        self.frames = frames
+        self.frame_seconds = frame_seconds
+        self.horizon_seconds = horizon_seconds
+        self.flap_seconds = flap_seconds
+
+        n = len(frames)
+        self.stream = np.repeat(np.arange(frames.streams), frames.ends - frames.starts)
+
+        # Predictor input: face frames only (no-face frames never reach it)
+        self.face_index = np.flatnonzero(frames.face)
+        face_stream = self.stream[self.face_index]
+        face_counts = np.bincount(face_stream, minlength=frames.streams)
+        face_starts = np.concatenate(([0], np.cumsum(face_counts)[:-1]))
+        self.face_position = np.arange(len(self.face_index)) - face_starts[face_stream]
+        face_engagement = frames.engagement[self.face_index]
+        self.prefix = np.concatenate(([0.0], np.cumsum(face_engagement)))
+        self.weighted_prefix = np.concatenate(([0.0], np.cumsum(self.face_position * face_engagement)))
+
+        # Stream-local times offset so streams never overlap when searched as one array
+        if n:
+            first = frames.timestamps[frames.starts]
+            local = frames.timestamps - first[self.stream]
+            span = float(local.max()) + self.horizon_seconds + self.flap_seconds + 1.0
+            self.span = span
+            self.keys = local + self.stream * span
+            durations = frames.timestamps[frames.ends - 1] - first + self.frame_seconds
+            self.student_hours = float(durations.sum()) / 3600
+        else:
+            self.span = 1.0
+            self.keys = np.empty(0)
+            self.student_hours = 0.0
+
+        self.same_stream = self.stream[1:] == self.stream[:-1]
+        self.distressed_index = np.flatnonzero(frames.distressed)
+        self._trends: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._rules_cache: Optional[Tuple[Tuple, Dict]] = None
+
+    def run(self, params: Optional[AlertParams] = None) -> Dict:
+        """
+        Replay every frame under one configuration
+
+        Returns:
+            {params, alerts: {critical, warning, emotion, total}, alerts_per_student_hour,
+             critical_onsets, onsets_warned, warnings_followed, lead_seconds: {mean, median},
+             flaps, flap_rate, state_flips_per_student_hour}
+        """
+        params = params or AlertParams()
+        rules = self._rules(params)
+        fired = self._apply_cooldown(rules['keys'], rules['streams'], params.cooldown_seconds)
+        alerts = rules['index'][fired]
+        alert_types = rules['types'][fired]
+
+        counts = {name: int((alert_types == code).sum()) for code, name in ALERT_TYPES.items()}
+        counts['total'] = len(alerts)
+        hours = self.student_hours or 1.0
+        return {
+            'params': asdict(params),
+            'alerts': counts,
+            'alerts_per_student_hour': round(len(alerts) / hours, 3),
+            **self._lead_times(rules, rules['keys'][fired[alert_types == WARNING]]),
+            **self._flapping(rules, fired, alerts)
+        }
+
+    def sweep(self, grid: Dict[str, Iterable], base: Optional[AlertParams] = None) -> List[Dict]:
+        """
+        run() for every combination of a parameter grid
+
+        Args:
+            grid: {AlertParams field: [values]}; unlisted fields keep base's value
+            base: Starting configuration (the live one by default)
+
+        Returns:
+            One run() result per combination, with 'seconds' spent on it
+        """
+        base = base or AlertParams()
+        unknown = set(grid) - set(asdict(base))
+        if unknown:
+            raise ValueError(f"Unknown alert parameters: {sorted(unknown)}")
+        # Cooldown varies fastest: the other parameters' replay is reused across it
+        names = sorted(grid, key=lambda name: name == 'cooldown_seconds')
+
+        results = []
+        for values in itertools.product(*(list(grid[name]) for name in names)):
+            start = time.perf_counter()
+            result = self.run(replace(base, **dict(zip(names, values))))
+            result['seconds'] = round(time.perf_counter() - start, 4)
+            results.append(result)
+        return results
+
+    # ------------------------------------------------------------------
+    # Predictor and alert rules
+    # ------------------------------------------------------------------
+
+    def _trend(self, window: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per face frame: predictor slope and 3-frame average, and whether it had 3 frames"""
+        cached = self._trends.get(window)
+        if cached is not None:
+            return cached
+
+        position = self.face_position
+        end = np.arange(1, len(position) + 1)
+        size = np.minimum(position + 1, window)  # frames in the predictor's window
+        sums = self.prefix[end] - self.prefix[end - size]
+        weighted = self.weighted_prefix[end] - self.weighted_prefix[end - size]
+        # Least-squares slope against x = 0..size-1 (x shifted from stream positions)
+        first = position - size + 1
+        centered = weighted - first * sums - (size - 1) / 2 * sums
+        spread = size * (size * size - 1) / 12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(size > 1, centered / spread, 0.0)
+
+        ready = position >= 2
+        last3 = np.maximum(end - 3, 0)
+        average = (self.prefix[end] - self.prefix[last3]) / 3
+
+        self._trends[window] = (slope, average, ready)
+        return slope, average, ready
+
+    def _predictions(self, params: AlertParams) -> Tuple[np.ndarray, np.ndarray]:
+        """Face frames where the predictor said 'warning' (positions), and where the average was critical (mask)"""
+        slope, average, ready = self._trend(params.window_size)
+        critical = ready & (average < params.critical_below)
+        declining = np.flatnonzero(ready & (slope < -params.slope_threshold) & (average > params.critical_below))
+        minutes = np.abs((params.critical_below - average[declining]) / slope[declining] * self.frame_seconds / 60)
+        return declining[minutes < params.warning_minutes], critical
+
+    def _rules(self, params: AlertParams) -> Dict:
+        """
+        Everything about a configuration except its cooldown: the alert type
+        each frame would raise with no cooldown in the way, and the critical
+        onsets (cached for the last configuration)
+        """
+        key = (params.critical_below, params.warning_minutes, params.emotion_below,
+               params.window_size, params.slope_threshold)
+        if self._rules_cache is not None and self._rules_cache[0] == key:
+            return self._rules_cache[1]
+
+        frames = self.frames
+        warning, critical = self._predictions(params)
+
+        # AlertManager's elif chain, lowest priority written first
+        types = np.zeros(len(frames), dtype=np.int8)
+        distressed = self.distressed_index
+        types[distressed[frames.engagement[distressed] < params.emotion_below]] = EMOTION
+        types[self.face_index[warning]] = WARNING
+        types[frames.engagement < params.critical_below] = CRITICAL
+
+        alerting = types != NONE
+        index = np.flatnonzero(alerting)
+        flips = int(((alerting[1:] != alerting[:-1]) & self.same_stream).sum())
+
+        # Critical onsets: the 3-frame average crossing below critical_below
+        face_stream = self.stream[self.face_index]
+        previous = np.r_[False, critical[:-1] & (face_stream[1:] == face_stream[:-1])]
+        onsets = self.face_index[critical & ~previous]
+        onset_keys = self.keys[onsets]
+        onset_streams = self.stream[onsets]
+        # Warnings since the stream's previous onset (or its start) count toward an onset
+        previous_onset = np.r_[-np.inf, np.where(onset_streams[1:] == onset_streams[:-1], onset_keys[:-1], -np.inf)]
+        since = np.maximum(np.maximum(onset_keys - self.horizon_seconds, previous_onset), onset_streams * self.span)
+
+        rules = {
+            'index': index,
+            'types': types[index],
+            'keys': self.keys[index],
+            'streams': self.stream[index],
+            'flips': flips,
+            'onset_keys': onset_keys,
+            'onset_since': since
+        }
+        self._rules_cache = (key, rules)
+        return rules
+
+    @staticmethod
+    def _apply_cooldown(keys: np.ndarray, streams: np.ndarray, cooldown: float) -> np.ndarray:
+        """Positions of the candidate alerts that fire once the per-stream cooldown is applied"""
+        if not len(keys):
+            return np.empty(0, dtype=np.int64)
+        # Every stream's first candidate fires
+        pointer = np.flatnonzero(np.r_[True, streams[1:] != streams[:-1]])
+        stream_end = np.append(pointer[1:], len(keys))
+
+        fired = []
+        while len(pointer):
+            fired.append(pointer)
+            following = np.searchsorted(keys, keys[pointer] + cooldown, side='right')
+            live = following < stream_end
+            pointer = following[live]
+            stream_end = stream_end[live]
+        return np.sort(np.concatenate(fired))
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def _lead_times(self, rules: Dict, warning_keys: np.ndarray) -> Dict:
+        """Critical onsets, and how far ahead warnings fired for them"""
+        onset_keys = rules['onset_keys']
+        first = np.searchsorted(warning_keys, rules['onset_since'], side='right')
+        warned = first < np.searchsorted(warning_keys, onset_keys, side='left')
+        lead = onset_keys[warned] - warning_keys[first[warned]]
+
+        # Warnings with an onset after them, within the horizon
+        following = np.searchsorted(onset_keys, warning_keys, side='right')
+        has_onset = following < len(onset_keys)
+        followed = np.zeros(len(warning_keys), dtype=bool)
+        followed[has_onset] = onset_keys[following[has_onset]] - warning_keys[has_onset] <= self.horizon_seconds
+
+        return {
+            'critical_onsets': len(onset_keys),
+            'onsets_warned': round(float(warned.mean()), 4) if len(onset_keys) else None,
+            'warnings_followed': round(float(followed.mean()), 4) if len(warning_keys) else None,
+            'lead_seconds': {
+                'mean': round(float(lead.mean()), 1) if len(lead) else None,
+                'median': round(float(np.median(lead)), 1) if len(lead) else None
+            }
+        }
+
+    def _flapping(self, rules: Dict, fired: np.ndarray, alerts: np.ndarray) -> Dict:
+        """Re-alerts after a brief recovery, and alerting/quiet flips"""
+        keys = rules['keys'][fired]
+        same_stream = rules['streams'][fired[1:]] == rules['streams'][fired[:-1]]
+        soon = keys[1:] - keys[:-1] < self.flap_seconds
+        # Fewer candidates than frames between two alerts: some frame in between was quiet
+        recovered = alerts[1:] - alerts[:-1] > fired[1:] - fired[:-1]
+        flaps = int((same_stream & soon & recovered).sum())
+
+        hours = self.student_hours or 1.0
+        return {
+            'flaps': flaps,
+            'flap_rate': round(flaps / len(alerts), 4) if len(alerts) else 0.0,
+            'state_flips_per_student_hour': round(rules['flips'] / hours, 3)
+        }
+
+
+def backtest_archive(start: datetime, end: datetime, grid: Dict[str, Iterable]) -> Dict:
+    """
+    Sweep a parameter grid over the archived sessions that started in [start, end)
+
+    Returns:
+        {frames, streams, student_hours, load_seconds, sweep_seconds, live: run() with the live
+         configuration, results: [run() per combination]}
+    """
+    begin = time.perf_counter()
+    frames = ReplayFrames.from_archive(start, end)
+    backtester = AlertBacktester(frames)
+    loaded = time.perf_counter()
+    live = backtester.run()
+    results = backtester.sweep(grid)
+    return {
+        'frames': len(frames),
+        'streams': frames.streams,
+        'student_hours': round(backtester.student_hours, 1),
+        'load_seconds': round(loaded - begin, 3),
+        'sweep_seconds': round(time.perf_counter() - loaded, 3),
+        'live': live,
+        'results': results
+    }
@@ -2,6 +2,8 @@ from datetime import datetime
 from typing import Dict, List
 from collections import deque
 
+from utils.config import Config
+
 class AlertManager:
     """
     Manage real-time alerts for teacher dashboard
@@ -10,27 +12,30 @@ class AlertManager:
     def __init__(self):
         self.alert_history = deque(maxlen=100)
         self.alert_cooldown = {}  # student_id -> last_alert_time
-        self.cooldown_seconds = 30  # Don't spam same alert
+        self.cooldown_seconds = Config.ALERT_COOLDOWN_SECONDS  # Don't spam same alert
+        self.critical_below = Config.ALERT_CRITICAL_ENGAGEMENT
+        self.warning_minutes = Config.ALERT_WARNING_MINUTES
+        self.emotion_below = Config.ALERT_EMOTION_ENGAGEMENT
     
-    def check_and_create_alert(self, student_id: str, frame_data: Dict) -> Dict | None:
+    def check_and_create_alert(self, student_id: str, frame_result) -> Dict | None:
         """
         Determine if an alert should be generated
         
         Args:
             student_id: Student identifier
-            frame_data: Processed frame data
+            frame_result: Processed FrameResult
             
         Returns:
             Alert dict or None
         """
-        prediction = frame_data.get('prediction', {})
-        engagement = frame_data.get('engagement_score', 1.0)
-        emotion = frame_data.get('emotion', 'neutral')
+        prediction = frame_result.prediction or {}
+        engagement = frame_result.engagement_score
+        emotion = frame_result.emotion
         
         alert = None
         
         # Critical: Very low engagement
-        if engagement < 0.3:
+        if engagement < self.critical_below:
             if self._should_alert(student_id, 'critical'):
                 alert = {
                     'type': 'critical',
@@ -44,7 +49,7 @@ class AlertManager:
         # Warning: Declining trend
         elif prediction.get('prediction') == 'warning':
             time_to_critical = prediction.get('time_to_critical_minutes')
-            if time_to_critical and time_to_critical < 5:
+            if time_to_critical and time_to_critical < self.warning_minutes:
                 if self._should_alert(student_id, 'warning'):
                     alert = {
                         'type': 'warning',
@@ -56,7 +61,7 @@ class AlertManager:
                     }
         
         # Emotion: Confused/Sad
-        elif emotion in ['sad', 'fear'] and engagement < 0.5:
+        elif emotion in ['sad', 'fear'] and engagement < self.emotion_below:
             if self._should_alert(student_id, 'emotion'):
                 alert = {
                     'type': 'emotion',
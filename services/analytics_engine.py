@@ -1,85 +1,150 @@
+import base64
 import numpy as np
-from typing import Dict, List
-from collections import Counter
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
 from datetime import datetime
+from models.frame_result import minute_key
+from services.downsampling import lttb
+from services.quantile_sketch import QuantileSketch
+from utils.config import Config
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
 
 class AnalyticsEngine:
     """
     Generate analytics data for charts and reports
+    
+    Distribution, timeline, comparison and heatmap are read from the running
+    aggregates SessionManager maintains as frames are logged, so they cost
+    O(students + minutes) however many frames a session has. Topic difficulty
+    uses a time-sorted index of the frames (raw tier plus minute rollups).
+    
+    generate_session_analytics() produces all of them from one read of the
+    session, for callers that need several at once.
+    
+    Results are cached per session (and topic list or heatmap encoding)
+    together with the session's version, which SessionManager bumps on every logged frame, so
+    endpoints and dashboards polling an unchanged session get the cached
+    result. At most ANALYTICS_CACHE_SIZE results are kept (least recently
+    used evicted first).
     """
     
-    def __init__(self, session_manager):
+    def __init__(self, session_manager, cache_size: int = Config.ANALYTICS_CACHE_SIZE):
         self.session_manager = session_manager
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (session_id, variant) -> (version, result)
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
     
-    def generate_emotion_distribution(self, session_id: str) -> Dict:
+    def generate_session_analytics(self, session_id: str, topics: Optional[List[Dict]] = None) -> Dict:
         """
-        Generate data for pie chart showing emotion distribution
+        Compute every chart for a session in one pass (cached per version)
+        
+        Args:
+            topics: Optional topic list for generate_topic_difficulty()
         
         Returns:
-            {emotion: percentage}
+            {emotion_distribution, engagement_timeline, student_comparison,
+             attention_heatmap[, topic_difficulty]}
         """
-        session = self.session_manager.get_session_data(session_id)
-        if not session:
-            return {}
-        
-        all_emotions = []
-        for student_id in session['students']:
-            frames = self.session_manager.get_student_session_data(session_id, student_id)
-            all_emotions.extend([f.get('emotion', 'neutral') for f in frames])
+        return dict(self._cached(
+            session_id,
+            ('analytics', self._topics_key(topics)),
+            lambda: self._compute_session_analytics(session_id, topics)
+        ))
+    
+    def _cached(self, session_id: str, variant, compute):
+        """Result of compute() for the session's current version, from the cache if possible"""
+        # Read the version first: a frame logged while computing makes the
+        # stored result stale rather than silently included
+        version = self.session_manager.session_version(session_id)
+        if version is None or not self.cache_size:
+            return compute()
         
-        if not all_emotions:
-            return {}
+        key = (session_id, variant)
+        with self._cache_lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] == version:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
         
-        emotion_counts = Counter(all_emotions)
-        total = len(all_emotions)
+        result = compute()
         
+        with self._cache_lock:
+            self.cache[key] = (version, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+        return result
+    
+    def get_cache_stats(self) -> Dict:
+        """Analytics cache hits, misses, hit rate and size"""
+        lookups = self.hits + self.misses
         return {
-            emotion: round((count / total) * 100, 2)
-            for emotion, count in emotion_counts.items()
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.cache),
+            'capacity': self.cache_size
+        }
+    
+    def _compute_session_analytics(self, session_id: str, topics: Optional[List[Dict]]) -> Dict:
+        session = self.session_manager.get_session_data(session_id)
+        aggregates = self.session_manager.read_aggregates(session_id) if session else None
+        
+        analytics = {
+            'emotion_distribution': self._emotion_distribution(aggregates),
+            'engagement_timeline': self._engagement_timeline(aggregates),
+            'student_comparison': self._student_comparison(session, aggregates),
+            'attention_heatmap': self._attention_heatmap(session, aggregates)
         }
+        if topics is not None:
+            analytics['topic_difficulty'] = self._topic_difficulty(session_id, session, topics)
+        return analytics
     
-    def generate_engagement_timeline(self, session_id: str) -> Dict:
+    def generate_emotion_distribution(self, session_id: str) -> Dict:
+        """
+        Generate data for pie chart showing emotion distribution
+        
+        Returns:
+            {emotion: percentage}
+        """
+        return self.generate_session_analytics(session_id)['emotion_distribution']
+    
+    def generate_engagement_timeline(self, session_id: str, points: Optional[int] = None,
+                                     resolution: Optional[int] = None) -> Dict:
         """
         Generate time-series data for engagement over time
         
+        One point per minute by default, so the series grows with the session.
+        
+        Args:
+            points: Downsample to at most this many points (LTTB, keeps peaks and dips)
+            resolution: Average into buckets of this many seconds (at least 60) first
+        
         Returns:
             {timestamps: [], engagement_scores: []}
         """
-        session = self.session_manager.get_session_data(session_id)
-        if not session:
-            return {'timestamps': [], 'engagement_scores': []}
+        if points is None and resolution is None:
+            return self.generate_session_analytics(session_id)['engagement_timeline']
+        if points is not None and points < 3:
+            raise ValueError("points must be at least 3")
+        if resolution is not None and resolution < 60:
+            raise ValueError("resolution must be at least 60 seconds")
         
-        # Collect all data points with timestamps
-        timeline_data = []
-        for student_id in session['students']:
-            frames = self.session_manager.get_student_session_data(session_id, student_id)
-            for frame in frames:
-                timeline_data.append({
-                    'timestamp': frame.get('timestamp'),
-                    'engagement': frame.get('engagement_score', 0)
-                })
-        
-        # Sort by timestamp
-        timeline_data.sort(key=lambda x: x['timestamp'])
-        
-        # Group by minute and average
-        minute_buckets = {}
-        for data in timeline_data:
-            minute = data['timestamp'][:16]  # YYYY-MM-DDTHH:MM
-            if minute not in minute_buckets:
-                minute_buckets[minute] = []
-            minute_buckets[minute].append(data['engagement'])
-        
-        timestamps = sorted(minute_buckets.keys())
-        engagement_scores = [
-            round(np.mean(minute_buckets[ts]) * 100, 1)
-            for ts in timestamps
-        ]
+        def compute():
+            session = self.session_manager.get_session_data(session_id)
+            aggregates = self.session_manager.read_aggregates(session_id) if session else None
+            return self._downsampled_timeline(aggregates, points, resolution)
         
-        return {
-            'timestamps': timestamps,
-            'engagement_scores': engagement_scores
-        }
+        return dict(self._cached(session_id, ('timeline', points, resolution), compute))
     
     def generate_student_comparison(self, session_id: str) -> Dict:
         """
@@ -88,64 +153,42 @@ class AnalyticsEngine:
         Returns:
             {student_id: {metric: score}}
         """
-        session = self.session_manager.get_session_data(session_id)
-        if not session:
-            return {}
-        
-        comparison = {}
-        for student_id in session['students']:
-            frames = self.session_manager.get_student_session_data(session_id, student_id)
-            
-            if not frames:
-                continue
-            
-            engagements = [f.get('engagement_score', 0) for f in frames]
-            emotions = [f.get('emotion', 'neutral') for f in frames]
-            
-            # Calculate metrics
-            comparison[student_id] = {
-                'average_engagement': round(np.mean(engagements) * 100, 1),
-                'consistency': round((1 - np.std(engagements)) * 100, 1),
-                'peak_focus': round(np.max(engagements) * 100, 1),
-                'participation': len(frames),
-                'positive_emotions': sum([1 for e in emotions if e in ['happy', 'surprise']]) / len(emotions) * 100
-            }
-        
-        return comparison
+        return self.generate_session_analytics(session_id)['student_comparison']
     
-    def generate_attention_heatmap(self, session_id: str) -> List[List[float]]:
+    def generate_attention_heatmap(self, session_id: str, encoding: str = 'json') -> Dict:
         """
         Generate minute-by-minute heatmap of class attention
         
+        Rows follow the session roster and columns every minute from the
+        session's first frame to its last, so cells line up in time; a minute
+        without frames from a student is null (NaN in the binary form).
+        
+        Args:
+            encoding: 'json' for nested lists, 'base64' for the raw
+                      little-endian float32 matrix (row-major)
+        
         Returns:
-            2D array [students][minutes] with engagement scores
+            {students: [], minutes: [], values: [[score or None]]} or
+            {students: [], minutes: [], shape: [rows, cols], dtype: 'float32', data: base64}
         """
-        session = self.session_manager.get_session_data(session_id)
-        if not session:
-            return []
+        if encoding == 'json':
+            return self.generate_session_analytics(session_id)['attention_heatmap']
+        if encoding != 'base64':
+            raise ValueError(f"Unknown heatmap encoding: {encoding}")
+        
+        def compute():
+            session = self.session_manager.get_session_data(session_id)
+            aggregates = self.session_manager.read_aggregates(session_id) if session else None
+            students, minutes, cells = self._heatmap_matrix(session, aggregates)
+            return {
+                'students': students,
+                'minutes': minutes,
+                'shape': list(cells.shape),
+                'dtype': 'float32',
+                'data': base64.b64encode(cells.astype('<f4').tobytes()).decode('ascii')
+            }
         
-        # Get minute-wise data for each student
-        heatmap = []
-        for student_id in session['students']:
-            frames = self.session_manager.get_student_session_data(session_id, student_id)
-            
-            # Group by minute
-            minute_buckets = {}
-            for frame in frames:
-                minute = frame.get('timestamp', '')[:16]
-                if minute not in minute_buckets:
-                    minute_buckets[minute] = []
-                minute_buckets[minute].append(frame.get('engagement_score', 0))
-            
-            # Average per minute
-            student_timeline = [
-                round(np.mean(scores) * 100, 1)
-                for scores in minute_buckets.values()
-            ]
-            
-            heatmap.append(student_timeline)
-        
-        return heatmap
+        return dict(self._cached(session_id, ('heatmap', encoding), compute))
     
     def generate_topic_difficulty(self, session_id: str, topics: List[Dict]) -> Dict:
         """
@@ -153,34 +196,292 @@ class AnalyticsEngine:
         
         Args:
             topics: [{'name': 'Binary Trees', 'start_time': '...', 'end_time': '...'}]
+                    end_time may be left out to treat the list as a slide timeline
+        
+        Frames are indexed by time once per session version, so each topic
+        costs two binary searches. Rolled-up minutes count toward a topic
+        when the minute starts inside it.
         
         Returns:
             {topic_name: difficulty_score}
         """
+        return dict(self._cached(
+            session_id,
+            ('topics', self._topics_key(topics)),
+            lambda: self._topic_difficulty(session_id, self.session_manager.get_session_data(session_id), topics)
+        ))
+    
+    def generate_engagement_percentiles(self, session_id: str, percentiles=DEFAULT_PERCENTILES) -> Dict:
+        """
+        Engagement percentiles of the class and of each student
+        
+        Read from the per-student quantile sketches, so the cost does not
+        depend on how many frames the session has.
+        
+        Returns:
+            {frames, class: {p10: score, ...}, students: {student_id: {p10: score, ...}}}
+        """
+        sketches = self.session_manager.read_sketches(session_id)
+        class_sketch = QuantileSketch()
+        for sketch in sketches.values():
+            class_sketch.merge(sketch)
+        
+        return {
+            'frames': class_sketch.count,
+            'class': self._percentile_scores(class_sketch, percentiles),
+            'students': {
+                student_id: self._percentile_scores(sketch, percentiles)
+                for student_id, sketch in sketches.items()
+            }
+        }
+    
+    def generate_bottom_students(self, session_id: str, fraction: float = 0.1) -> List[Dict]:
+        """
+        Students whose median engagement is in the lowest fraction of the class
+        
+        Returns:
+            [{student_id, median_engagement}] lowest first (at least one student)
+        """
+        sketches = [(sid, s) for sid, s in self.session_manager.read_sketches(session_id).items() if s.count]
+        if not sketches:
+            return []
+        
+        medians = np.array([sketch.quantile(0.5) for _, sketch in sketches])
+        order = np.argsort(medians, kind='stable')
+        keep = max(1, int(np.ceil(len(sketches) * fraction)))
+        return [
+            {'student_id': sketches[i][0], 'median_engagement': round(float(medians[i]) * 100, 1)}
+            for i in order[:keep].tolist()
+        ]
+    
+    def generate_sketch_percentiles(self, name: str, percentiles=DEFAULT_PERCENTILES) -> Dict:
+        """
+        Engagement percentiles over every ended session of a subject or student
+        
+        Args:
+            name: 'subject:{subject}' or 'student:{student_id}'
+        
+        Returns:
+            {frames, percentiles: {p10: score, ...}}
+        """
+        sketch = self.session_manager.read_sketch(name)
+        return {'frames': sketch.count, 'percentiles': self._percentile_scores(sketch, percentiles)}
+    
+    @staticmethod
+    def _percentile_scores(sketch: QuantileSketch, percentiles) -> Dict:
+        values = sketch.quantiles(p / 100 for p in percentiles)
+        return {
+            f'p{p:g}': None if np.isnan(v) else round(float(v) * 100, 1)
+            for p, v in zip(percentiles, values.tolist())
+        }
+    
+    # ------------------------------------------------------------------
+    # Computation on one read of the session
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _topics_key(topics: Optional[List[Dict]]):
+        if topics is None:
+            return None
+        return tuple((t['name'], t['start_time'], t.get('end_time')) for t in topics)
+    
+    def _emotion_distribution(self, aggregates: Optional[Dict]) -> Dict:
+        if aggregates is None:
+            return {}
+        
+        emotion_counts = aggregates['emotion_counts']
+        total = int(emotion_counts.sum())
+        if not total:
+            return {}
+        
+        return {
+            self.session_manager.emotion_label(code): round((int(count) / total) * 100, 2)
+            for code, count in enumerate(emotion_counts.tolist()) if count
+        }
+    
+    @staticmethod
+    def _engagement_timeline(aggregates: Optional[Dict]) -> Dict:
+        if aggregates is None:
+            return {'timestamps': [], 'engagement_scores': []}
+        
+        minutes, counts, sums = aggregates['minutes']
+        
+        return {
+            'timestamps': [minute_key(m * 60) for m in minutes.tolist()],
+            'engagement_scores': [round(v * 100, 1) for v in (sums / np.maximum(counts, 1)).tolist()]
+        }
+    
+    @staticmethod
+    def _downsampled_timeline(aggregates: Optional[Dict], points: Optional[int],
+                              resolution: Optional[int]) -> Dict:
+        if aggregates is None:
+            return {'timestamps': [], 'engagement_scores': []}
+        
+        minutes, counts, sums = aggregates['minutes']
+        seconds = minutes * 60
+        if resolution is not None:
+            # Frame-weighted average per resolution bucket
+            buckets, inverse = np.unique(seconds // resolution, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts, minlength=len(buckets))
+            sums = np.bincount(inverse, weights=sums, minlength=len(buckets))
+            seconds = buckets * resolution
+        
+        scores = sums / np.maximum(counts, 1)
+        if points is not None:
+            kept = lttb(seconds, scores, points)
+            seconds = seconds[kept]
+            scores = scores[kept]
+        
+        return {
+            'timestamps': [minute_key(ts) for ts in seconds.tolist()],
+            'engagement_scores': [round(v * 100, 1) for v in scores.tolist()]
+        }
+    
+    @staticmethod
+    def _student_comparison(session: Optional[Dict], aggregates: Optional[Dict]) -> Dict:
+        if not session or aggregates is None:
+            return {}
+        
+        students = [
+            (student_id, aggregates['students'][student_id])
+            for student_id in session['students']
+            if student_id in aggregates['students'] and aggregates['students'][student_id]['count']
+        ]
+        if not students:
+            return {}
+        
+        # Moments of every student at once
+        count = np.array([s['count'] for _, s in students], dtype=np.float64)
+        mean = np.array([s['sum'] for _, s in students]) / count
+        variance = np.array([s['sumsq'] for _, s in students]) / count - mean * mean
+        std = np.sqrt(np.maximum(variance, 0.0))
+        positive = np.array([s['positive'] for _, s in students]) / count * 100
+        
+        mean = mean.tolist()
+        std = std.tolist()
+        positive = positive.tolist()
+        
+        return {
+            student_id: {
+                'average_engagement': round(mean[i] * 100, 1),
+                'consistency': round((1 - std[i]) * 100, 1),
+                'peak_focus': round(s['peak'] * 100, 1),
+                'participation': s['count'],
+                'positive_emotions': positive[i]
+            }
+            for i, (student_id, s) in enumerate(students)
+        }
+    
+    @staticmethod
+    def _heatmap_matrix(session: Optional[Dict], aggregates: Optional[Dict]):
+        """Roster, minute labels and the dense students x minutes matrix (NaN gaps)"""
+        if not session or aggregates is None or not len(aggregates['minutes'][0]):
+            students = list(session['students']) if session else []
+            return students, [], np.full((len(students), 0), np.nan)
+        
+        students = list(session['students'])
+        class_minutes = aggregates['minutes'][0]
+        first = int(class_minutes[0])
+        width = int(class_minutes[-1]) - first + 1
+        
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+        rows = [
+            aggregates['students'][student_id]['minutes'] if student_id in aggregates['students'] else empty
+            for student_id in students
+        ]
+        
+        # Scatter every (student, minute) cell into the grid in one assignment
+        cells = np.full((len(students), width), np.nan)
+        if rows:
+            row_index = np.repeat(np.arange(len(rows)), [len(row[0]) for row in rows])
+            minutes = np.concatenate([row[0] for row in rows])
+            counts = np.concatenate([row[1] for row in rows])
+            sums = np.concatenate([row[2] for row in rows])
+            cells[row_index, minutes - first] = sums / np.maximum(counts, 1) * 100
+        
+        labels = [minute_key(m * 60) for m in range(first, first + width)]
+        return students, labels, cells
+    
+    @classmethod
+    def _attention_heatmap(cls, session: Optional[Dict], aggregates: Optional[Dict]) -> Dict:
+        students, minutes, cells = cls._heatmap_matrix(session, aggregates)
+        values = cells.round(1)
+        return {
+            'students': students,
+            'minutes': minutes,
+            'values': np.where(np.isnan(values), None, values).tolist()
+        }
+    
+    def _topic_difficulty(self, session_id: str, session: Optional[Dict], topics: List[Dict]) -> Dict:
         difficulty_scores = {}
+        if not session or not topics:
+            return difficulty_scores
         
-        for topic in topics:
-            topic_name = topic['name']
-            start = topic['start_time']
-            end = topic['end_time']
-            
-            # Get engagement during this topic
-            session = self.session_manager.get_session_data(session_id)
-            if not session:
-                continue
-            
-            topic_engagements = []
-            for student_id in session['students']:
-                frames = self.session_manager.get_student_session_data(session_id, student_id)
-                for frame in frames:
-                    ts = frame.get('timestamp', '')
-                    if start <= ts <= end:
-                        topic_engagements.append(frame.get('engagement_score', 0))
-            
-            if topic_engagements:
-                avg_engagement = np.mean(topic_engagements)
+        timestamps, frame_prefix, engagement_prefix = self._cached(
+            session_id, ('topic_index',), lambda: self._build_topic_index(session_id, session)
+        )
+        starts, ends = self._topic_bounds(topics)
+        
+        # Binary search each topic's frame range, then read its totals off the prefix sums
+        lo = np.searchsorted(timestamps, starts, side='left')
+        hi = np.searchsorted(timestamps, ends, side='right')
+        topic_counts = (frame_prefix[hi] - frame_prefix[lo]).tolist()
+        topic_sums = (engagement_prefix[hi] - engagement_prefix[lo]).tolist()
+        
+        for topic, topic_count, topic_sum in zip(topics, topic_counts, topic_sums):
+            if topic_count:
+                avg_engagement = topic_sum / topic_count
                 # Invert score: low engagement = high difficulty
                 difficulty = (1 - avg_engagement) * 100
-                difficulty_scores[topic_name] = round(difficulty, 1)
+                difficulty_scores[topic['name']] = round(difficulty, 1)
         
         return difficulty_scores
+    
+    def _build_topic_index(self, session_id: str, session: Dict):
+        """
+        Time-sorted frames of the session with prefix sums of frame counts and
+        engagement, so any time range's totals are two lookups
+        
+        Raw frames count one each at their timestamp; rolled-up minutes count
+        their frames at the start of the minute.
+        """
+        views, student_rollups = self.session_manager.read_session_frames(session_id)
+        frames = [views[student_id] for student_id in session['students'] if student_id in views]
+        rollups = [student_rollups[student_id] for student_id in session['students'] if student_id in student_rollups]
+        timestamps = np.concatenate([np.empty(0)] + [f.timestamps for f in frames] + [r.minute * 60.0 for r in rollups])
+        counts = np.concatenate([np.empty(0)] + [np.ones(len(f)) for f in frames] + [r.count for r in rollups])
+        sums = np.concatenate([np.empty(0)] + [f.engagement.astype(np.float64) for f in frames] + [r.sum for r in rollups])
+        
+        order = np.argsort(timestamps, kind='stable')
+        frame_prefix = np.concatenate(([0.0], np.cumsum(counts[order])))
+        engagement_prefix = np.concatenate(([0.0], np.cumsum(sums[order])))
+        return timestamps[order], frame_prefix, engagement_prefix
+    
+    @staticmethod
+    def _topic_bounds(topics: List[Dict]):
+        """
+        Start and end times (epoch seconds) of each topic
+        
+        Times may be ISO strings or epoch seconds. A topic without an
+        end_time (a slide timeline) runs until the next topic starts, or to
+        the end of the session for the last one.
+        """
+        def seconds(value) -> float:
+            if isinstance(value, (int, float)):
+                return float(value)
+            return datetime.fromisoformat(value).timestamp()
+        
+        starts = np.array([seconds(topic['start_time']) for topic in topics])
+        ends = np.array([
+            seconds(topic['end_time']) if topic.get('end_time') is not None else np.nan
+            for topic in topics
+        ])
+        
+        open_ended = np.isnan(ends)
+        if open_ended.any():
+            # Next start in time order; the end is just before it so adjacent slides don't share frames
+            sorted_starts = np.sort(starts)
+            following = np.searchsorted(sorted_starts, starts, side='right')
+            next_start = np.append(sorted_starts, np.inf)[following]
+            ends[open_ended] = np.nextafter(next_start[open_ended], -np.inf)
+        return starts, ends
@@ -0,0 +1,299 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.frame_store import EmotionCodes
+from utils.config import Config
+from utils.logger import logger
+
+
+class ClassWindow:
+    """
+    Sliding window of one session's frames in one-second ring buffer slots
+
+    Slot i holds the frames whose second % window == i, together with the
+    second it was last written for; a slot left over from an earlier lap is
+    cleared before reuse and ignored by reads, so nothing has to be expired
+    as time passes.
+    """
+
+    __slots__ = ('window', 'seconds', 'frames', 'sums', 'emotions',
+                 'student_index', 'student_frames', 'student_sums', 'last_frame')
+
+    def __init__(self, window: int, emotion_width: int = 16, students: int = 32):
+        self.window = window
+        self.seconds = np.full(window, -1, dtype=np.int64)
+        self.frames = np.zeros(window, dtype=np.int64)
+        self.sums = np.zeros(window, dtype=np.float64)
+        self.emotions = np.zeros((window, emotion_width), dtype=np.int64)
+        self.student_index: Dict[str, int] = {}
+        self.student_frames = np.zeros((students, window), dtype=np.int64)
+        self.student_sums = np.zeros((students, window), dtype=np.float64)
+        self.last_frame = 0.0
+
+    def add(self, student_id: str, timestamp: float, engagement: float, emotion: int):
+        second = int(timestamp)
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            if self.seconds[slot] > second:
+                return  # older than the window
+            self.seconds[slot] = second
+            self.frames[slot] = 0
+            self.sums[slot] = 0.0
+            self.emotions[slot] = 0
+            self.student_frames[:, slot] = 0
+            self.student_sums[:, slot] = 0.0
+
+        row = self.student_index.get(student_id)
+        if row is None:
+            row = self.student_index[student_id] = len(self.student_index)
+            if row >= len(self.student_frames):
+                self.student_frames = np.concatenate([self.student_frames, np.zeros_like(self.student_frames)])
+                self.student_sums = np.concatenate([self.student_sums, np.zeros_like(self.student_sums)])
+        if emotion >= self.emotions.shape[1]:
+            grown = np.zeros((self.window, emotion + 1), dtype=np.int64)
+            grown[:, :self.emotions.shape[1]] = self.emotions
+            self.emotions = grown
+
+        self.frames[slot] += 1
+        self.sums[slot] += engagement
+        self.emotions[slot, emotion] += 1
+        self.student_frames[row, slot] += 1
+        self.student_sums[row, slot] += engagement
+        self.last_frame = max(self.last_frame, timestamp)
+
+    def totals(self, now: float) -> Optional[Dict]:
+        """
+        Sums over the last `window` seconds, or None without frames
+
+        Returns:
+            {frames, sum, emotions (counts by code), student_frames, student_sums}
+            with student rows in student_index order
+        """
+        current = self.seconds > int(now) - self.window
+        frames = int(self.frames[current].sum())
+        if not frames:
+            return None
+
+        rows = len(self.student_index)
+        return {
+            'frames': frames,
+            'sum': float(self.sums[current].sum()),
+            'emotions': self.emotions[current].sum(axis=0),
+            'student_frames': self.student_frames[:rows, current].sum(axis=1),
+            'student_sums': self.student_sums[:rows, current].sum(axis=1)
+        }
+
+    def metrics(self, now: float, at_risk_below: float) -> Optional[Dict]:
+        """Class metrics over the last `window` seconds, or None without frames"""
+        totals = self.totals(now)
+        if totals is None:
+            return None
+
+        active = totals['student_frames'] > 0
+        student_means = totals['student_sums'][active] / totals['student_frames'][active]
+        return {
+            'frames': totals['frames'],
+            'engagement': totals['sum'] / totals['frames'],
+            'emotions': totals['emotions'],
+            'active_students': int(active.sum()),
+            'at_risk_students': int((student_means < at_risk_below).sum())
+        }
+
+
+class ClassTicker:
+    """
+    Live class-level metrics per session, pushed to dashboards once per tick
+
+    Frames are folded into each session's ClassWindow as they are logged
+    (O(1) per frame); every CLASS_TICK_INTERVAL the ticker reads each
+    session's window - mean engagement, emotion mix and students whose
+    window mean is below CLASS_TICK_AT_RISK - and sends one compact
+    'class_tick' message per session, however many students it has.
+
+    Runs on the event loop thread. With shared state a session's students
+    may be connected to several workers: each tick, every worker publishes
+    its share of each window (sums keyed by emotion label and student id,
+    as emotion codes are per process) and ticks its own dashboards with
+    its window merged with the other workers' latest shares.
+    """
+
+    def __init__(self, emotions: EmotionCodes,
+                 window: int = Config.CLASS_TICK_WINDOW_SECONDS,
+                 interval: float = Config.CLASS_TICK_INTERVAL,
+                 at_risk_below: float = Config.CLASS_TICK_AT_RISK):
+        self.emotions = emotions
+        self.window = window
+        self.interval = interval
+        self.at_risk_below = at_risk_below
+        self.sessions: Dict[str, ClassWindow] = {}
+        self.remote: Dict[str, Dict[str, tuple]] = {}  # session_id -> worker -> (received, share)
+        self.remote_ttl = 2 * interval + 1.0  # a worker's share is replaced every tick
+        self.shared = None  # SharedSessionState or None
+        self.ticks = 0
+        self._task = None
+
+    def record(self, session_id: str, student_id: str, frame_result):
+        """Fold one logged frame into its session's window"""
+        window = self.sessions.get(session_id)
+        if window is None:
+            window = self.sessions[session_id] = ClassWindow(self.window)
+        window.add(
+            student_id,
+            frame_result.timestamp,
+            frame_result.engagement_score,
+            self.emotions.encode(frame_result.emotion)
+        )
+
+    def drop(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self.remote.pop(session_id, None)
+
+    def receive(self, event: Dict, now: Optional[float] = None):
+        """Keep another worker's share of a session's window (a 'class_window' event)"""
+        self.remote.setdefault(event['session_id'], {})[event['worker']] = (now or time.time(), event['share'])
+
+    def share(self, session_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        This worker's share of a session's window, or None without recent frames
+
+        Returns:
+            {frames, sum, emotions: {label: frames}, students: {student_id: [frames, sum]}}
+        """
+        window = self.sessions.get(session_id)
+        totals = window.totals(now or time.time()) if window else None
+        if totals is None:
+            return None
+        return {
+            'frames': totals['frames'],
+            'sum': totals['sum'],
+            'emotions': {
+                self.emotions.decode(code): count
+                for code, count in enumerate(totals['emotions'].tolist()) if count
+            },
+            'students': {
+                student_id: [frames, total]
+                for student_id, frames, total in zip(
+                    window.student_index, totals['student_frames'].tolist(), totals['student_sums'].tolist()
+                ) if frames
+            }
+        }
+
+    def tick_message(self, session_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        """The class_tick message for a session, or None without recent frames"""
+        now = now or time.time()
+        remote = self._remote_shares(session_id, now)
+        if remote:
+            local = self.share(session_id, now)
+            metrics = self._merged_metrics(remote + ([local] if local else []))
+        else:
+            window = self.sessions.get(session_id)
+            metrics = window.metrics(now, self.at_risk_below) if window else None
+            if metrics is not None:
+                metrics['emotions'] = {
+                    self.emotions.decode(code): count
+                    for code, count in enumerate(metrics['emotions'].tolist()) if count
+                }
+        if metrics is None:
+            return None
+
+        frames = metrics['frames']
+        return {
+            'type': 'class_tick',
+            'session_id': session_id,
+            'timestamp': round(now, 3),
+            'window_seconds': self.window,
+            'engagement': round(metrics['engagement'] * 100, 1),
+            'emotions': {
+                label: round(count / frames * 100, 1) for label, count in metrics['emotions'].items()
+            },
+            'active_students': metrics['active_students'],
+            'at_risk_students': metrics['at_risk_students']
+        }
+
+    def _remote_shares(self, session_id: str, now: float) -> List[Dict]:
+        shares = self.remote.get(session_id)
+        if not shares:
+            return []
+        for worker, (received, _) in list(shares.items()):
+            if received < now - self.remote_ttl:
+                del shares[worker]  # that worker has no recent frames (or is gone)
+        if not shares:
+            del self.remote[session_id]
+        return [share for _, share in shares.values()]
+
+    def _merged_metrics(self, shares: List[Dict]) -> Dict:
+        """Class metrics over several workers' shares of a window"""
+        frames = sum(share['frames'] for share in shares)
+        emotions: Dict[str, int] = {}
+        students: Dict[str, List] = {}
+        for share in shares:
+            for label, count in share['emotions'].items():
+                emotions[label] = emotions.get(label, 0) + count
+            for student_id, (count, total) in share['students'].items():
+                acc = students.setdefault(student_id, [0, 0.0])
+                acc[0] += count
+                acc[1] += total
+        return {
+            'frames': frames,
+            'engagement': sum(share['sum'] for share in shares) / frames,
+            'emotions': emotions,
+            'active_students': len(students),
+            'at_risk_students': sum(1 for count, total in students.values() if total / count < self.at_risk_below)
+        }
+
+    def start(self, send: Callable[[str, Dict], Awaitable], shared=None):
+        """
+        Start ticking (call inside the event loop)
+
+        Args:
+            send: Coroutine delivering a message to one session's dashboards
+            shared: SharedSessionState to exchange window shares with the other workers
+        """
+        self.shared = shared
+        self._task = asyncio.create_task(self._tick_loop(send))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _tick_loop(self, send: Callable[[str, Dict], Awaitable]):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.time()
+            if self.shared:
+                self._publish_shares(now)
+            for session_id in list(self.sessions.keys() | self.remote.keys()):
+                message = self.tick_message(session_id, now)
+                if message is None:
+                    window = self.sessions.get(session_id)
+                    if window is not None and window.last_frame < now - self.window:
+                        self.sessions.pop(session_id)  # idle for a whole window
+                    continue
+                try:
+                    await send(session_id, message)
+                except Exception as e:
+                    logger.error(f"❌ class_tick for {session_id} failed: {e}")
+            self.ticks += 1
+
+    def _publish_shares(self, now: float):
+        for session_id in list(self.sessions):
+            share = self.share(session_id, now)
+            if share is not None:
+                self.shared.publish({
+                    'target': 'workers',
+                    'type': 'class_window',
+                    'session_id': session_id,
+                    'worker': self.shared.worker_id,
+                    'share': share
+                })
+
+    def get_stats(self) -> Dict:
+        return {
+            'ticks': self.ticks,
+            'live_sessions': len(self.sessions),
+            'remote_sessions': len(self.remote),
+            'window_seconds': self.window
+        }
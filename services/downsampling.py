@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last point and, from each of points - 2 equal-width
+    buckets in between, the point forming the largest triangle with the
+    point kept from the previous bucket and the average of the next bucket.
+    Peaks and dips survive, unlike with plain averaging or striding.
+
+    Args:
+        x: Sorted x values
+        y: y values
+        points: Number of points to keep (at least 3)
+
+    Returns:
+        Sorted indices of the kept points
+    """
+    n = len(x)
+    if points >= n or n <= 2:
+        return np.arange(n)
+    if points < 3:
+        raise ValueError("LTTB needs at least 3 points")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket i covers [edges[i], edges[i + 1]); the first and last point stand alone
+    every = (n - 2) / (points - 2)
+    edges = (np.arange(points - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Average of the following bucket for every bucket, via prefix sums
+    x_prefix = np.concatenate(([0.0], np.cumsum(x)))
+    y_prefix = np.concatenate(([0.0], np.cumsum(y)))
+    next_lo = edges[1:]
+    next_hi = np.append(edges[2:], n)
+    size = next_hi - next_lo
+    avg_x = (x_prefix[next_hi] - x_prefix[next_lo]) / size
+    avg_y = (y_prefix[next_hi] - y_prefix[next_lo]) / size
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
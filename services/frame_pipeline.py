@@ -0,0 +1,351 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from models.frame_result import FrameResult
+from services.inference_scheduler import FairShareScheduler
+from utils.config import Config
+from utils.logger import logger
+
+
+class FrameJob:
+    """A single student frame moving through the pipeline"""
+
+    __slots__ = ('student_id', 'session_id', 'base64_image', 'frame', 'signature', 'face',
+                 'result', 'ready', 'future', 'enqueued_at')
+
+    def __init__(self, student_id: str, session_id: str, base64_image: str, future: asyncio.Future):
+        self.student_id = student_id
+        self.session_id = session_id
+        self.base64_image = base64_image
+        self.frame = None
+        self.signature = None
+        self.face = None
+        self.result = FrameResult(student_id, session_id)
+        self.ready = False  # True once the result only needs the analytics stage
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class StageMetrics:
+    """Throughput and latency counters for one pipeline stage"""
+
+    def __init__(self, name: str, workers: int, queue: asyncio.Queue):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.processed = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.batches = 0
+
+    def record(self, count: int, busy: float, wait: float):
+        self.processed += count
+        self.busy_seconds += busy
+        self.wait_seconds += wait
+        self.batches += 1
+
+    def to_dict(self, elapsed: float) -> Dict:
+        capacity = self.workers * elapsed
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'errors': self.errors,
+            'avg_service_ms': round(self.busy_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            'avg_queue_wait_ms': round(self.wait_seconds / self.processed * 1000, 2) if self.processed else 0.0,
+            'avg_batch_size': round(self.processed / self.batches, 2) if self.batches else 0.0,
+            'utilization': round(self.busy_seconds / capacity, 3) if capacity > 0 else 0.0
+        }
+
+
+class FramePipeline:
+    """
+    Staged frame pipeline: decode -> face detect -> classify (batched) -> analytics
+
+    Stages are connected by bounded asyncio queues and each stage runs its own
+    pool of worker tasks. Decode and detect run OpenCV in worker threads (which
+    releases the GIL) so they overlap with model inference in the classify stage.
+    """
+
+    def __init__(self, emotion_detector, analyze: Callable[[FrameResult], FrameResult],
+                 signature: Optional[Callable] = None,
+                 admit: Optional[Callable[[str, object], Optional[FrameResult]]] = None,
+                 rank_of: Optional[Callable[[str], int]] = None,
+                 dropped: Optional[Callable[[FrameResult], FrameResult]] = None):
+        """
+        Args:
+            emotion_detector: EmotionDetector providing the per-stage operations
+            analyze: Callback completing a classified (or failed) FrameResult
+            signature: Optional cheap frame fingerprint computed in the decode thread
+            admit: Optional gate run after decode; returning a result skips inference
+            rank_of: Optional student risk rank; makes the inference queue a per-session
+                fair-share scheduler with risk-prioritized lanes
+            dropped: Result for frames shed by an overloaded session lane
+        """
+        self.emotion_detector = emotion_detector
+        self.analyze = analyze
+        self.signature = signature
+        self.admit = admit
+        self.dropped = dropped
+        self.batch_size = max(1, Config.CLASSIFY_BATCH_SIZE)
+        self.batch_wait = Config.CLASSIFY_BATCH_WAIT_MS / 1000
+
+        queue_size = Config.PIPELINE_QUEUE_SIZE
+        self.decode_queue = asyncio.Queue(maxsize=queue_size)
+        self.detect_queue = asyncio.Queue(maxsize=queue_size)
+        if rank_of:
+            self.classify_queue = FairShareScheduler(
+                rank_of,
+                Config.PRIORITY_AGING_SECONDS,
+                Config.SESSION_QUEUE_LIMIT,
+                on_drop=self._drop,
+                weights=Config.SESSION_WEIGHTS,
+                default_weight=Config.DEFAULT_SESSION_WEIGHT
+            )
+        else:
+            self.classify_queue = asyncio.Queue(maxsize=queue_size)
+        self.analytics_queue = asyncio.Queue(maxsize=queue_size)
+
+        self.stages = {
+            'decode': StageMetrics('decode', Config.PIPELINE_DECODE_WORKERS, self.decode_queue),
+            'detect': StageMetrics('detect', Config.PIPELINE_DETECT_WORKERS, self.detect_queue),
+            'classify': StageMetrics('classify', Config.PIPELINE_CLASSIFY_WORKERS, self.classify_queue),
+            'analytics': StageMetrics('analytics', Config.PIPELINE_ANALYTICS_WORKERS, self.analytics_queue)
+        }
+        self.skipped = 0
+        self.workers: List[asyncio.Task] = []
+        self.started_at = None
+
+    def start(self):
+        """Spawn the worker tasks for every stage (must run inside the event loop)"""
+        if self.workers:
+            return
+
+        loop = asyncio.get_running_loop()
+        self.started_at = time.perf_counter()
+        runners = {
+            'decode': self._decode_worker,
+            'detect': self._detect_worker,
+            'classify': self._classify_worker,
+            'analytics': self._analytics_worker
+        }
+        for name, runner in runners.items():
+            for _ in range(max(1, self.stages[name].workers)):
+                self.workers.append(loop.create_task(runner()))
+
+        logger.info(
+            "Frame pipeline started (" +
+            ", ".join(f"{name}={stage.workers}" for name, stage in self.stages.items()) + ")"
+        )
+
+    async def stop(self):
+        """Cancel all workers and fail any frames still in flight"""
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        for stage in self.stages.values():
+            while not stage.queue.empty():
+                job = stage.queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+
+    async def submit(self, student_id: str, session_id: str, base64_image: str) -> FrameResult:
+        """Queue a frame and wait for its processed result"""
+        if not self.workers:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self.decode_queue.put(FrameJob(student_id, session_id, base64_image, future))
+        return await future
+
+    def set_session_weight(self, session_id: str, weight: float):
+        """Adjust a session's share of inference throughput"""
+        if not isinstance(self.classify_queue, FairShareScheduler):
+            raise ValueError("Fair-share scheduling is not enabled")
+        self.classify_queue.set_weight(session_id, weight)
+
+    def drop_session(self, session_id: str):
+        """Release an ended session's scheduler state"""
+        if isinstance(self.classify_queue, FairShareScheduler):
+            self.classify_queue.drop_session(session_id)
+
+    def get_session_stats(self) -> Dict:
+        """Per-session queue depth, served rate and dropped frames"""
+        if not isinstance(self.classify_queue, FairShareScheduler):
+            return {}
+        return self.classify_queue.get_session_stats()
+
+    def get_stats(self) -> Dict:
+        """Per-stage metrics for spotting the bottleneck"""
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        stats = {name: stage.to_dict(elapsed) for name, stage in self.stages.items()}
+        stats['skipped_after_decode'] = self.skipped
+        if isinstance(self.classify_queue, FairShareScheduler):
+            stats['classify']['by_risk'] = self.classify_queue.get_stats()
+            stats['classify']['by_session'] = self.classify_queue.get_session_stats()
+        return stats
+
+    # ------------------------------------------------------------------
+    # Stage workers
+    # ------------------------------------------------------------------
+
+    async def _decode_worker(self):
+        stage = self.stages['decode']
+        while True:
+            job = await self.decode_queue.get()
+            wait = time.perf_counter() - job.enqueued_at
+            stage.in_flight += 1
+            start = time.perf_counter()
+            try:
+                job.frame, job.signature = await asyncio.to_thread(self._decode, job.base64_image)
+                job.base64_image = None
+            except Exception as e:
+                stage.errors += 1
+                self._fail(job, 'Processing Error', str(e))
+            finally:
+                stage.in_flight -= 1
+            stage.record(1, time.perf_counter() - start, wait)
+
+            if not job.ready and job.frame is None:
+                self._fail(job, 'Invalid Image', 'Failed to decode image')
+
+            if not job.ready and self.admit:
+                skipped = self.admit(job.student_id, job.signature)
+                job.signature = None
+                if skipped is not None:
+                    self.skipped += 1
+                    if not job.future.done():
+                        job.future.set_result(skipped)
+                    continue
+
+            await self._forward(job, self.analytics_queue if job.ready else self.detect_queue)
+
+    def _decode(self, base64_image: str):
+        frame = self.emotion_detector.decode_base64_image(base64_image)
+        signature = self.signature(frame) if self.signature and frame is not None else None
+        return frame, signature
+
+    async def _detect_worker(self):
+        stage = self.stages['detect']
+        while True:
+            job = await self.detect_queue.get()
+            wait = time.perf_counter() - job.enqueued_at
+            stage.in_flight += 1
+            start = time.perf_counter()
+            try:
+                detection = await asyncio.to_thread(self.emotion_detector.detect_face, job.frame)
+                job.frame = None
+                if detection is None:
+                    self._fail(job, 'No Face')
+                else:
+                    job.face, job.result.face_location = detection
+            except Exception as e:
+                stage.errors += 1
+                self._fail(job, 'Error', str(e))
+            finally:
+                stage.in_flight -= 1
+            stage.record(1, time.perf_counter() - start, wait)
+
+            await self._forward(job, self.analytics_queue if job.ready else self.classify_queue)
+
+    async def _classify_worker(self):
+        stage = self.stages['classify']
+        while True:
+            batch = await self._collect_batch()
+            now = time.perf_counter()
+            wait = sum(now - job.enqueued_at for job in batch)
+            stage.in_flight += len(batch)
+            try:
+                results = await asyncio.to_thread(
+                    self.emotion_detector.classify_faces,
+                    [job.face for job in batch]
+                )
+                for job, (emotion, confidence, engagement_score) in zip(batch, results):
+                    result = job.result
+                    result.face_detected = True
+                    result.emotion = emotion
+                    result.confidence = confidence
+                    result.engagement_score = engagement_score
+                    job.ready = True
+            except Exception as e:
+                stage.errors += len(batch)
+                for job in batch:
+                    self._fail(job, 'Error', str(e))
+            finally:
+                stage.in_flight -= len(batch)
+            stage.record(len(batch), time.perf_counter() - now, wait)
+
+            for job in batch:
+                job.face = None
+                await self._forward(job, self.analytics_queue)
+
+    async def _collect_batch(self) -> List[FrameJob]:
+        """Take one job, then keep filling the batch until it is full or the wait expires"""
+        batch = [await self.classify_queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.classify_queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.classify_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _analytics_worker(self):
+        stage = self.stages['analytics']
+        while True:
+            job = await self.analytics_queue.get()
+            wait = time.perf_counter() - job.enqueued_at
+            stage.in_flight += 1
+            start = time.perf_counter()
+            try:
+                result = self.analyze(job.result)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                stage.errors += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                stage.in_flight -= 1
+            stage.record(1, time.perf_counter() - start, wait)
+
+    async def _forward(self, job: FrameJob, queue: asyncio.Queue):
+        """Hand a job to the next stage (blocks while that stage is saturated)"""
+        if job.future.done():
+            return
+        job.enqueued_at = time.perf_counter()
+        await queue.put(job)
+
+    def _drop(self, job: FrameJob):
+        """Resolve a frame that the scheduler shed instead of queueing"""
+        job.face = None
+        if job.future.done():
+            return
+        job.result.status = 'dropped'
+        job.result.error = 'Server overloaded'
+        job.future.set_result(self.dropped(job.result) if self.dropped else job.result)
+
+    def _fail(self, job: FrameJob, emotion: str, error: Optional[str] = None):
+        """Mark a frame as having no usable face; it goes straight to analytics"""
+        job.result.face_detected = False
+        job.result.emotion = emotion
+        job.result.error = error
+        job.ready = True
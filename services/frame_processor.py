@@ -1,66 +1,144 @@
 from models.emotion_detector import EmotionDetector
 from models.lstm_predictor import LSTMPredictor
 from models.attention_analyzer import AttentionAnalyzer
+from services.frame_pipeline import FramePipeline
+from services.adaptive_sampler import AdaptiveSampler
+from services.inference_scheduler import risk_rank, RISK_NORMAL
+from models.frame_result import FrameResult
+from utils.config import Config
 from typing import Dict
-import asyncio
-from datetime import datetime
+import time
 
 class FrameProcessor:
-    def __init__(self):
+    def __init__(self, alert_manager=None):
         print("🔧 Initializing Frame Processor...")
         self.emotion_detector = EmotionDetector()
+        self.alert_manager = alert_manager
         self.student_predictors = {}
         self.attention_analyzers = {}
+        self.last_results = {}  # student_id -> last fully processed result
+        self.student_risk = {}  # student_id -> scheduling rank from latest prediction
+        self.sampler = AdaptiveSampler()
+        self.pipeline = FramePipeline(
+            self.emotion_detector,
+            self._analyze_frame,
+            signature=self.sampler.signature,
+            admit=self._admit_frame,
+            rank_of=self._risk_of,
+            dropped=self._dropped_frame
+        )
         print("✅ Frame Processor ready!")
     
-    async def process_student_frame(self, student_id: str, base64_image: str) -> Dict:
-        emotion_result = await asyncio.to_thread(
-            self.emotion_detector.process_base64_image,
-            base64_image
-        )
+    def start(self):
+        """Start the staged frame pipeline workers"""
+        self.pipeline.start()
+    
+    async def stop(self):
+        """Stop the pipeline and drop queued frames"""
+        await self.pipeline.stop()
+    
+    async def process_student_frame(self, student_id: str, base64_image: str,
+                                    session_id: str = "default_session") -> FrameResult:
+        """
+        Run a frame through decode -> detect -> classify -> analytics
         
-        if not emotion_result.get('face_detected', False):
-            return {
-                'student_id': student_id,
-                'status': 'no_face',
-                'emotion': 'No Face',
-                'message': 'Please position your face in camera',
-                'engagement_score': 0.0,
-                'focus_score': 0,
-                'recommendation': 'Position your face in the camera frame',
-                'timestamp': datetime.now().isoformat()
-            }
+        Returns:
+            FrameResult; its 'alert' is set when the analytics stage raised one.
+            Frames skipped by the adaptive sampler come back with status 'sampled_out',
+            frames shed by the fair-share scheduler with status 'dropped'; both
+            repeat the student's last result.
+        """
+        return await self.pipeline.submit(student_id, session_id, base64_image)
+    
+    def set_session_weight(self, session_id: str, weight: float):
+        """Give a session a larger or smaller share of inference capacity"""
+        self.pipeline.set_session_weight(session_id, weight)
+    
+    def drop_session(self, session_id: str):
+        """Forget an ended session's share of inference capacity"""
+        self.pipeline.drop_session(session_id)
+    
+    def get_session_stats(self) -> Dict:
+        """Per-session scheduler metrics"""
+        return self.pipeline.get_session_stats()
+    
+    def get_pipeline_stats(self) -> Dict:
+        """Per-stage queue depth, throughput and latency"""
+        stats = self.pipeline.get_stats()
+        stats['sampler'] = self.sampler.get_stats()
+        return stats
+    
+    def _risk_of(self, student_id: str) -> int:
+        """Inference priority: critical, then warning, then declining, then the rest"""
+        return self.student_risk.get(student_id, RISK_NORMAL)
+    
+    def _admit_frame(self, student_id: str, signature) -> FrameResult | None:
+        """Sampling gate after decode: None means run full inference"""
+        if self.sampler.should_process(student_id, signature) or student_id not in self.last_results:
+            return None
+        
+        return self.last_results[student_id].repeat('sampled_out')
+    
+    def _dropped_frame(self, result: FrameResult) -> FrameResult:
+        """Result for a frame shed by the scheduler under overload"""
+        last = self.last_results.get(result.student_id)
+        return last.repeat('dropped') if last else result
+    
+    def _analyze_frame(self, result: FrameResult) -> FrameResult:
+        """Analytics/alert stage: trend prediction, attention and alerting"""
+        student_id = result.student_id
+        self._complete_result(result)
         
+        if result.status == 'success':
+            predictor = self.student_predictors[student_id]
+            self.sampler.update(student_id, result.prediction, predictor.get_stats()['std'])
+            self.student_risk[student_id] = risk_rank(result.prediction)
+            self.last_results[student_id] = result
+        else:
+            self.sampler.reset(student_id)
+            self.last_results.pop(student_id, None)
+        
+        if self.alert_manager:
+            result.alert = self.alert_manager.check_and_create_alert(student_id, result)
+        
+        return result
+    
+    def _complete_result(self, result: FrameResult):
+        result.timestamp = time.time()
+        
+        if not result.face_detected:
+            result.status = 'no_face'
+            result.emotion = 'No Face'
+            result.engagement_score = 0.0
+            result.confidence = 0.0
+            result.message = 'Please position your face in camera'
+            result.recommendation = 'Position your face in the camera frame'
+            return
+        
+        student_id = result.student_id
         if student_id not in self.student_predictors:
-            self.student_predictors[student_id] = LSTMPredictor()
+            self.student_predictors[student_id] = LSTMPredictor(
+                window_size=Config.PREDICTOR_WINDOW,
+                slope_threshold=Config.PREDICTOR_SLOPE_THRESHOLD,
+                critical_below=Config.ALERT_CRITICAL_ENGAGEMENT,
+                warning_minutes=Config.ALERT_WARNING_MINUTES,
+                frame_seconds=Config.FRAME_PROCESSING_INTERVAL
+            )
             self.attention_analyzers[student_id] = AttentionAnalyzer()
         
         predictor = self.student_predictors[student_id]
         analyzer = self.attention_analyzers[student_id]
         
-        engagement_score = emotion_result['engagement_score']
-        emotion = emotion_result['emotion']
-        predictor.add_datapoint(engagement_score, emotion)
+        predictor.add_datapoint(result.engagement_score, result.emotion)
         
         prediction = predictor.predict_trend()
-        attention = analyzer.analyze_attention(emotion_result)
-        
-        alert_needed = prediction['prediction'] in ['warning', 'critical']
-        recommendation = self._generate_recommendation(emotion, engagement_score, prediction['trend'])
-        
-        return {
-            'student_id': student_id,
-            'status': 'success',
-            'emotion': emotion,
-            'confidence': float(emotion_result['confidence']),
-            'engagement_score': float(engagement_score),
-            'prediction': prediction,
-            'attention': attention,
-            'alert_needed': alert_needed,
-            'recommendation': recommendation,
-            'focus_score': int(engagement_score * 100),
-            'timestamp': datetime.now().isoformat()
-        }
+        result.prediction = prediction
+        result.attention = analyzer.analyze_attention(result)
+        result.alert_needed = prediction['prediction'] in ['warning', 'critical']
+        result.recommendation = self._generate_recommendation(
+            result.emotion, result.engagement_score, prediction['trend']
+        )
+        result.status = 'success'
     
     def _generate_recommendation(self, emotion: str, score: float, trend: str) -> str:
         if score > 0.8:
@@ -0,0 +1,592 @@
+import hashlib
+import numpy as np
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from utils.config import Config
+from utils.logger import logger
+
+
+# Emotion labels stored as uint8 codes; unknown labels are appended on first sight
+EMOTION_LABELS = ['neutral', 'happy', 'surprise', 'sad', 'fear', 'angry', 'disgust', 'No Face']
+POSITIVE_EMOTIONS = ('happy', 'surprise')
+
+# On-disk record layout for spilled streams (packed, 17 bytes per frame)
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('engagement', '<f4'),
+    ('confidence', '<f4'),
+    ('emotion', 'u1')
+])
+
+
+class EmotionCodes:
+    """Bidirectional label <-> uint8 code mapping (safe to share across threads)"""
+
+    def __init__(self, labels: List[str] = EMOTION_LABELS):
+        self.labels = list(labels)
+        self.codes = {label: code for code, label in enumerate(self.labels)}
+        self._lock = threading.Lock()
+
+    def encode(self, label: str, on_new=None) -> int:
+        """
+        Args:
+            on_new: Called as on_new(code, label) when a label is first seen,
+                    while the mapping is locked (so new codes are reported in order)
+        """
+        code = self.codes.get(label)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(label)
+                if code is None:
+                    if len(self.labels) >= 256:
+                        raise ValueError(f"Too many distinct emotion labels (got '{label}')")
+                    code = len(self.labels)
+                    if on_new:
+                        on_new(code, label)
+                    self.labels.append(label)
+                    self.codes[label] = code
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.labels[code]
+
+    def codes_for(self, labels) -> List[int]:
+        return [self.codes[label] for label in labels if label in self.codes]
+
+
+class FrameView:
+    """Read-only column slices of one student's frames in one session"""
+
+    __slots__ = ('timestamps', 'engagement', 'confidence', 'emotion')
+
+    def __init__(self, timestamps: np.ndarray, engagement: np.ndarray,
+                 confidence: np.ndarray, emotion: np.ndarray):
+        self.timestamps = timestamps  # float64 epoch seconds
+        self.engagement = engagement  # float32
+        self.confidence = confidence  # float32
+        self.emotion = emotion  # uint8 codes
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+EMPTY_VIEW = FrameView(
+    np.empty(0, dtype=np.float64),
+    np.empty(0, dtype=np.float32),
+    np.empty(0, dtype=np.float32),
+    np.empty(0, dtype=np.uint8)
+)
+
+
+class MinuteRollup:
+    """
+    Per-minute aggregates of one student's older frames
+
+    Row i summarizes every compacted frame with timestamp // 60 == minute[i]:
+    frame count, sum and sum of squares of engagement, min/max engagement and
+    a histogram of emotion codes. That is enough to reproduce distributions,
+    minute averages, means, standard deviations and peaks exactly.
+    """
+
+    HIST_WIDTH = 16
+
+    __slots__ = ('minute', 'count', 'sum', 'sumsq', 'min', 'max', 'hist')
+
+    def __init__(self, minute=None, count=None, total=None, sumsq=None,
+                 low=None, high=None, hist=None):
+        self.minute = np.empty(0, dtype=np.int64) if minute is None else minute
+        self.count = np.empty(0, dtype=np.int64) if count is None else count
+        self.sum = np.empty(0, dtype=np.float64) if total is None else total
+        self.sumsq = np.empty(0, dtype=np.float64) if sumsq is None else sumsq
+        self.min = np.empty(0, dtype=np.float32) if low is None else low
+        self.max = np.empty(0, dtype=np.float32) if high is None else high
+        self.hist = np.zeros((0, self.HIST_WIDTH), dtype=np.int64) if hist is None else hist
+
+    def __len__(self) -> int:
+        return len(self.minute)
+
+    @property
+    def frames(self) -> int:
+        return int(self.count.sum())
+
+    @classmethod
+    def from_frames(cls, timestamps: np.ndarray, engagement: np.ndarray, emotion: np.ndarray) -> 'MinuteRollup':
+        minutes = (timestamps // 60).astype(np.int64)
+        order = np.argsort(minutes, kind='stable')
+        minutes = minutes[order]
+        engagement = engagement[order].astype(np.float64)
+        emotion = emotion[order]
+
+        unique, starts = np.unique(minutes, return_index=True)
+        width = max(cls.HIST_WIDTH, int(emotion.max()) + 1)
+        hist = np.zeros((len(unique), width), dtype=np.int64)
+        rows = np.repeat(np.arange(len(unique)), np.diff(np.append(starts, len(minutes))))
+        np.add.at(hist, (rows, emotion), 1)
+
+        return cls(
+            unique,
+            np.diff(np.append(starts, len(minutes))).astype(np.int64),
+            np.add.reduceat(engagement, starts),
+            np.add.reduceat(engagement * engagement, starts),
+            np.minimum.reduceat(engagement, starts).astype(np.float32),
+            np.maximum.reduceat(engagement, starts).astype(np.float32),
+            hist
+        )
+
+    def merge(self, other: 'MinuteRollup') -> 'MinuteRollup':
+        """Combine two rollups (rows for the same minute are folded together)"""
+        if not len(self):
+            return other
+        if not len(other):
+            return self
+
+        minutes = np.concatenate([self.minute, other.minute])
+        unique, inverse = np.unique(minutes, return_inverse=True)
+        n = len(unique)
+
+        width = max(self.hist.shape[1], other.hist.shape[1])
+        hist = np.zeros((n, width), dtype=np.int64)
+        np.add.at(hist, inverse[:len(self)], np.pad(self.hist, ((0, 0), (0, width - self.hist.shape[1]))))
+        np.add.at(hist, inverse[len(self):], np.pad(other.hist, ((0, 0), (0, width - other.hist.shape[1]))))
+
+        low = np.full(n, np.inf, dtype=np.float32)
+        high = np.full(n, -np.inf, dtype=np.float32)
+        np.minimum.at(low, inverse, np.concatenate([self.min, other.min]))
+        np.maximum.at(high, inverse, np.concatenate([self.max, other.max]))
+
+        return MinuteRollup(
+            unique,
+            np.bincount(inverse, weights=np.concatenate([self.count, other.count]), minlength=n).astype(np.int64),
+            np.bincount(inverse, weights=np.concatenate([self.sum, other.sum]), minlength=n),
+            np.bincount(inverse, weights=np.concatenate([self.sumsq, other.sumsq]), minlength=n),
+            low,
+            high,
+            hist
+        )
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+
+EMPTY_ROLLUP = MinuteRollup()
+
+
+class FrameColumns:
+    """Growable columnar arrays for one (session_id, student_id) stream"""
+
+    INITIAL_CAPACITY = 64
+
+    __slots__ = ('timestamps', 'engagement', 'confidence', 'emotion', 'size')
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.engagement = np.empty(capacity, dtype=np.float32)
+        self.confidence = np.empty(capacity, dtype=np.float32)
+        self.emotion = np.empty(capacity, dtype=np.uint8)
+        self.size = 0
+
+    def append(self, timestamp: float, engagement: float, confidence: float, emotion: int):
+        if self.size == len(self.timestamps):
+            self._grow()
+        i = self.size
+        self.timestamps[i] = timestamp
+        self.engagement[i] = engagement
+        self.confidence[i] = confidence
+        self.emotion[i] = emotion
+        self.size = i + 1
+
+    def extend(self, timestamps: np.ndarray, engagement: np.ndarray,
+               confidence: np.ndarray, emotion: np.ndarray):
+        n = len(timestamps)
+        while self.size + n > len(self.timestamps):
+            self._grow()
+        end = self.size + n
+        self.timestamps[self.size:end] = timestamps
+        self.engagement[self.size:end] = engagement
+        self.confidence[self.size:end] = confidence
+        self.emotion[self.size:end] = emotion
+        self.size = end
+
+    def view(self) -> FrameView:
+        n = self.size
+        return FrameView(self.timestamps[:n], self.engagement[:n], self.confidence[:n], self.emotion[:n])
+
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.engagement.nbytes + self.confidence.nbytes + self.emotion.nbytes
+
+    def records(self) -> np.ndarray:
+        """Pack the stored frames into RECORD_DTYPE rows"""
+        n = self.size
+        records = np.empty(n, dtype=RECORD_DTYPE)
+        records['timestamp'] = self.timestamps[:n]
+        records['engagement'] = self.engagement[:n]
+        records['confidence'] = self.confidence[:n]
+        records['emotion'] = self.emotion[:n]
+        return records
+
+    def clear(self):
+        self.size = 0
+
+    def keep(self, mask: np.ndarray):
+        """Drop every frame whose mask entry is False (compaction)"""
+        kept = int(mask.sum())
+        capacity = max(self.INITIAL_CAPACITY, kept * 2)
+        for name in ('timestamps', 'engagement', 'confidence', 'emotion'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:kept] = old[:self.size][mask]
+            setattr(self, name, new)
+        self.size = kept
+
+    def _grow(self):
+        capacity = len(self.timestamps) * 2
+        for name in ('timestamps', 'engagement', 'confidence', 'emotion'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+
+class SpilledColumns:
+    """
+    Stream backed by an append-only file of RECORD_DTYPE rows
+
+    New frames collect in a small in-memory tail that is appended to the file
+    in chunks. Reads flush the tail and return views straight onto a read-only
+    np.memmap of the file, so nothing is loaded into Python objects.
+    """
+
+    FLUSH_RECORDS = 256
+
+    __slots__ = ('path', 'count', 'tail', '_mmap')
+
+    def __init__(self, path: str, initial: Optional[FrameColumns] = None,
+                 resume_count: Optional[int] = None):
+        """
+        Args:
+            path: Backing file
+            initial: In-memory frames to seed a new file with
+            resume_count: Adopt an existing file, truncated to this many records
+        """
+        self.path = path
+        self.count = 0
+        self.tail = FrameColumns(self.FLUSH_RECORDS)
+        self._mmap = None
+
+        if resume_count is not None:
+            with open(path, 'ab') as f:
+                f.truncate(resume_count * RECORD_DTYPE.itemsize)
+            self.count = resume_count
+            return
+
+        with open(path, 'wb') as f:
+            if initial is not None and initial.size:
+                initial.records().tofile(f)
+                self.count = initial.size
+
+    @property
+    def size(self) -> int:
+        return self.count + self.tail.size
+
+    def append(self, timestamp: float, engagement: float, confidence: float, emotion: int):
+        self.tail.append(timestamp, engagement, confidence, emotion)
+        if self.tail.size >= self.FLUSH_RECORDS:
+            self.flush()
+
+    def extend(self, timestamps: np.ndarray, engagement: np.ndarray,
+               confidence: np.ndarray, emotion: np.ndarray):
+        self.flush()
+        records = np.empty(len(timestamps), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        records['engagement'] = engagement
+        records['confidence'] = confidence
+        records['emotion'] = emotion
+        with open(self.path, 'ab') as f:
+            records.tofile(f)
+        self.count += len(records)
+
+    def flush(self, durable: bool = False):
+        if not self.tail.size and not durable:
+            return
+        with open(self.path, 'ab') as f:
+            if self.tail.size:
+                self.tail.records().tofile(f)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        self.count += self.tail.size
+        self.tail.clear()
+
+    def view(self) -> FrameView:
+        self.flush()
+        if not self.count:
+            return EMPTY_VIEW
+
+        if self._mmap is None or len(self._mmap) != self.count:
+            self._mmap = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r', shape=(self.count,))
+
+        mm = self._mmap
+        return FrameView(mm['timestamp'], mm['engagement'], mm['confidence'], mm['emotion'])
+
+    def nbytes(self) -> int:
+        return self.tail.nbytes()
+
+
+class FrameStore:
+    """
+    Per-frame session data indexed by (session_id, student_id)
+
+    Each stream is stored as columns (epoch timestamp, float32 engagement,
+    float32 confidence, uint8 emotion code), so reads are array slices rather
+    than scans over per-frame dicts.
+
+    Once a session holds more than SPILL_THRESHOLD_FRAMES frames, its streams
+    move to memory-mapped append-only files under DATA_DIR/frames, keeping
+    server memory flat however long the session runs.
+
+    compact() folds in-memory frames older than the raw retention window into
+    per-minute MinuteRollup rows, so only the recent window is kept raw.
+
+    The store does no locking of its own apart from the emotion codes: callers
+    serialize access per session (see SessionManager's lock stripes), and
+    different sessions never share a stream.
+    """
+
+    def __init__(self, data_dir: str = Config.DATA_DIR,
+                 spill_threshold: int = Config.SPILL_THRESHOLD_FRAMES):
+        self.emotions = EmotionCodes()
+        self.sessions: Dict[str, Dict[str, FrameColumns]] = {}
+        self.session_sizes: Dict[str, int] = {}
+        self.spilled = set()
+        self.spill_dir = os.path.join(data_dir, 'frames')
+        self.spill_threshold = spill_threshold
+        self.rollups: Dict[str, Dict[str, MinuteRollup]] = {}
+
+    def append(self, session_id: str, student_id: str, timestamp: float,
+               engagement: float, confidence: float, emotion: int):
+        """Append one frame; emotion is a code from self.emotions"""
+        self._stream(session_id, student_id).append(timestamp, engagement, confidence, emotion)
+        self._grew(session_id, 1)
+
+    def extend(self, session_id: str, student_id: str, timestamps: np.ndarray,
+               engagement: np.ndarray, confidence: np.ndarray, emotion: np.ndarray):
+        """Bulk-append frames (replay and loading archived sessions)"""
+        if not len(timestamps):
+            return
+        self._stream(session_id, student_id).extend(timestamps, engagement, confidence, emotion)
+        self._grew(session_id, len(timestamps))
+
+    def _stream(self, session_id: str, student_id: str):
+        students = self.sessions.get(session_id)
+        if students is None:
+            students = self.sessions[session_id] = {}
+            self.session_sizes[session_id] = 0
+
+        stream = students.get(student_id)
+        if stream is None:
+            if session_id in self.spilled:
+                stream = SpilledColumns(self._stream_path(session_id, student_id))
+            else:
+                stream = FrameColumns()
+            students[student_id] = stream
+        return stream
+
+    def _grew(self, session_id: str, count: int):
+        size = self.session_sizes[session_id] + count
+        self.session_sizes[session_id] = size
+        if size > self.spill_threshold and session_id not in self.spilled:
+            self.spill_session(session_id)
+
+    def export_state(self) -> Dict:
+        """
+        Copy-on-write capture of the store for snapshots (every session's lock held)
+
+        Stored frames are never overwritten in place (growing and compaction
+        swap in new arrays), so an in-memory stream is captured as references
+        to its columns plus its length. A spilled stream is captured as its
+        record count plus a copy of its unflushed tail. pack_state() turns
+        the capture into the persisted form without holding any lock.
+        """
+        streams = {}
+        for session_id, students in self.sessions.items():
+            for student_id, stream in students.items():
+                if isinstance(stream, SpilledColumns):
+                    streams[(session_id, student_id)] = ('spilled', (stream.count, stream.tail.records()))
+                else:
+                    streams[(session_id, student_id)] = ('memory', (
+                        stream.timestamps, stream.engagement, stream.confidence, stream.emotion, stream.size
+                    ))
+
+        return {
+            'labels': list(self.emotions.labels),
+            'spilled': set(self.spilled),
+            'streams': streams,
+            'rollups': {
+                (session_id, student_id): rollup
+                for session_id, students in self.rollups.items()
+                for student_id, rollup in students.items()
+            }
+        }
+
+    def pack_state(self, state: Dict) -> Dict:
+        """
+        Persisted form of an export_state() capture (runs off the frame path)
+
+        In-memory streams become packed records; spilled files are fsynced
+        so the record counts in the snapshot are durable.
+        """
+        streams = {}
+        for (session_id, student_id), (kind, data) in state['streams'].items():
+            if kind == 'spilled':
+                self._fsync(self._stream_path(session_id, student_id))
+                streams[(session_id, student_id)] = (kind, data)
+                continue
+            timestamps, engagement, confidence, emotion, n = data
+            records = np.empty(n, dtype=RECORD_DTYPE)
+            records['timestamp'] = timestamps[:n]
+            records['engagement'] = engagement[:n]
+            records['confidence'] = confidence[:n]
+            records['emotion'] = emotion[:n]
+            streams[(session_id, student_id)] = ('memory', records)
+        return dict(state, streams=streams)
+
+    def import_state(self, state: Dict):
+        """
+        Rebuild the store from pack_state() output
+
+        A spilled stream whose file is gone belonged to a session released
+        (archived) after the snapshot was taken; it is left out, and
+        replaying the journal drops the rest of that session.
+        """
+        self.emotions = EmotionCodes(state['labels'])
+        self.sessions = {}
+        self.session_sizes = {}
+        self.spilled = {session_id for session_id in state['spilled'] if os.path.isdir(self._session_dir(session_id))}
+
+        for (session_id, student_id), (kind, data) in state['streams'].items():
+            if kind == 'spilled':
+                path = self._stream_path(session_id, student_id)
+                count, tail = data
+                if session_id not in self.spilled or not os.path.exists(path):
+                    continue
+                stream = SpilledColumns(path, resume_count=count)
+                stream.extend(tail['timestamp'], tail['engagement'], tail['confidence'], tail['emotion'])
+            else:
+                stream = FrameColumns(max(len(data), FrameColumns.INITIAL_CAPACITY))
+                stream.extend(data['timestamp'], data['engagement'], data['confidence'], data['emotion'])
+            self.sessions.setdefault(session_id, {})[student_id] = stream
+            self.session_sizes[session_id] = self.session_sizes.get(session_id, 0) + stream.size
+
+        self.rollups = {}
+        for (session_id, student_id), rollup in state.get('rollups', {}).items():
+            self.rollups.setdefault(session_id, {})[student_id] = rollup
+
+    def compact(self, cutoff: float) -> int:
+        """
+        Fold in-memory frames older than cutoff into minute rollups
+
+        The cutoff is rounded down to a whole minute so no minute is split
+        across the two tiers. Spilled streams are already off-heap and stay raw.
+
+        Returns:
+            Number of frames compacted
+        """
+        return sum(self.compact_session(session_id, cutoff) for session_id in list(self.sessions))
+
+    def compact_session(self, session_id: str, cutoff: float) -> int:
+        """compact() for one session"""
+        students = self.sessions.get(session_id)
+        if not students or session_id in self.spilled:
+            return 0
+
+        boundary = (cutoff // 60) * 60
+        compacted = 0
+        for student_id, stream in list(students.items()):
+            view = stream.view()
+            old = view.timestamps < boundary
+            n_old = int(old.sum())
+            if not n_old:
+                continue
+
+            rollup = MinuteRollup.from_frames(view.timestamps[old], view.engagement[old], view.emotion[old])
+            session_rollups = self.rollups.setdefault(session_id, {})
+            session_rollups[student_id] = session_rollups.get(student_id, EMPTY_ROLLUP).merge(rollup)
+
+            stream.keep(~old)
+            compacted += n_old
+        self.session_sizes[session_id] = sum(stream.size for stream in students.values())
+        return compacted
+
+    def get_rollup(self, session_id: str, student_id: str) -> MinuteRollup:
+        return self.rollups.get(session_id, {}).get(student_id, EMPTY_ROLLUP)
+
+    def set_rollup(self, session_id: str, student_id: str, rollup: MinuteRollup):
+        self.rollups.setdefault(session_id, {})[student_id] = rollup
+
+    def spill_session(self, session_id: str):
+        """Move every stream of a session to memory-mapped files"""
+        students = self.sessions.get(session_id, {})
+        os.makedirs(self._session_dir(session_id), exist_ok=True)
+
+        for student_id, stream in list(students.items()):
+            if isinstance(stream, FrameColumns):
+                students[student_id] = SpilledColumns(self._stream_path(session_id, student_id), stream)
+
+        self.spilled.add(session_id)
+        logger.info(f"Session {session_id} spilled to disk ({self.session_sizes.get(session_id, 0)} frames)")
+
+    def get(self, session_id: str, student_id: str) -> FrameView:
+        stream = self.sessions.get(session_id, {}).get(student_id)
+        return stream.view() if stream is not None else EMPTY_VIEW
+
+    def session_views(self, session_id: str) -> Dict[str, FrameView]:
+        return {
+            student_id: stream.view()
+            for student_id, stream in self.sessions.get(session_id, {}).items()
+        }
+
+    def frame_count(self, session_id: str) -> int:
+        raw = sum(stream.size for stream in self.sessions.get(session_id, {}).values())
+        return raw + sum(rollup.frames for rollup in self.rollups.get(session_id, {}).values())
+
+    def drop_session(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self.session_sizes.pop(session_id, None)
+        self.rollups.pop(session_id, None)
+        if session_id in self.spilled:
+            self.spilled.discard(session_id)
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+    def memory_bytes(self) -> int:
+        raw = sum(
+            stream.nbytes()
+            for students in self.sessions.values()
+            for stream in students.values()
+        )
+        return raw + sum(
+            rollup.nbytes()
+            for students in self.rollups.values()
+            for rollup in students.values()
+        )
+
+    @staticmethod
+    def _fsync(path: str):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return  # session released since the capture
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _session_dir(self, session_id: str) -> str:
+        # Hashed: session ids come from clients, and '', '.' or '..' would name the spill root or above it
+        return os.path.join(self.spill_dir, hashlib.sha1(session_id.encode()).hexdigest())
+
+    def _stream_path(self, session_id: str, student_id: str) -> str:
+        return os.path.join(self._session_dir(session_id), quote(student_id, safe='') + '.frames')
@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+
+# Lower rank = served first
+RISK_CRITICAL = 0
+RISK_WARNING = 1
+RISK_DECLINING = 2
+RISK_NORMAL = 3
+RISK_LABELS = ['critical', 'warning', 'declining', 'normal']
+
+
+def risk_rank(prediction: Optional[Dict]) -> int:
+    """Map a predict_trend() result to a scheduling rank"""
+    if not prediction:
+        return RISK_NORMAL
+    if prediction.get('prediction') == 'critical':
+        return RISK_CRITICAL
+    if prediction.get('prediction') == 'warning':
+        return RISK_WARNING
+    if prediction.get('trend') == 'declining':
+        return RISK_DECLINING
+    return RISK_NORMAL
+
+
+class _SessionLane:
+    """Per-session risk-ordered heap plus fair-share accounting"""
+
+    __slots__ = ('session_id', 'heap', 'weight', 'virtual_time', 'served',
+                 'dropped', 'served_times', 'idle_since', 'ended')
+
+    def __init__(self, session_id: str, weight: float):
+        self.session_id = session_id
+        self.heap = []
+        self.weight = weight
+        self.virtual_time = 0.0
+        self.served = 0
+        self.dropped = 0
+        self.served_times = deque(maxlen=2048)
+        self.idle_since = time.perf_counter()
+        self.ended = False
+
+
+class FairShareScheduler(asyncio.Queue):
+    """
+    Inference queue that shares throughput fairly across sessions
+
+    Sessions are served by weighted fair queuing: every session has a virtual
+    clock that advances by 1/weight per served frame, and the session with the
+    smallest clock goes next, so a session with weight 2 gets twice the frames
+    of a weight 1 session while both are backlogged. Idle sessions rejoin at
+    the current virtual time and cannot bank credit.
+
+    Within a session, frames of at-risk students are served first. Each job is
+    keyed by enqueue_time + rank * aging_seconds, so a critical frame jumps
+    ahead of normal ones, but a normal frame that has waited RISK_NORMAL *
+    aging_seconds longer still wins. Nothing can starve.
+
+    Each session holds at most session_limit queued frames; beyond that its new
+    frames are dropped (and handed to on_drop) instead of blocking the
+    upstream stage for every other session.
+
+    Dequeueing only looks at sessions with queued frames. A session's lane
+    is removed once it has drained after drop_session(), or after
+    IDLE_LANE_SECONDS without frames, so the scheduler only keeps state for
+    sessions it is currently serving.
+    """
+
+    RATE_WINDOW_SECONDS = 10.0
+    IDLE_LANE_SECONDS = 300.0
+
+    def __init__(self, rank_of: Callable[[str], int], aging_seconds: float,
+                 session_limit: int, on_drop: Callable,
+                 weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        self.rank_of = rank_of
+        self.aging_seconds = aging_seconds
+        self.session_limit = session_limit
+        self.on_drop = on_drop
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.served = [0] * len(RISK_LABELS)
+        self.max_wait = [0.0] * len(RISK_LABELS)
+        super().__init__()
+
+    def set_weight(self, session_id: str, weight: float):
+        """Change a session's share of inference capacity"""
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        self.weights[session_id] = weight
+        if session_id in self.lanes:
+            self.lanes[session_id].weight = weight
+
+    def drop_session(self, session_id: str):
+        """Forget an ended session (its lane goes once its queued frames are served)"""
+        lane = self.lanes.get(session_id)
+        if lane is None:
+            return
+        if lane.heap:
+            lane.ended = True
+        else:
+            del self.lanes[session_id]
+
+    # asyncio.Queue storage hooks (same extension points as asyncio.PriorityQueue)
+    def _init(self, maxsize):
+        self._queue = None
+        self._counter = itertools.count()
+        self._size = 0
+        self.lanes: Dict[str, _SessionLane] = {}
+        self.active: Dict[str, _SessionLane] = {}  # lanes with queued frames
+        self.global_virtual_time = 0.0
+        self.next_idle_sweep = time.perf_counter() + self.IDLE_LANE_SECONDS
+        self.depth = [0] * len(RISK_LABELS)
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def _put(self, job):
+        now = time.perf_counter()
+        lane = self.lanes.get(job.session_id)
+        if lane is None:
+            if now >= self.next_idle_sweep:
+                self._drop_idle_lanes(now)
+            weight = self.weights.get(job.session_id, self.default_weight)
+            lane = self.lanes[job.session_id] = _SessionLane(job.session_id, weight)
+
+        if len(lane.heap) >= self.session_limit:
+            lane.dropped += 1
+            self.on_drop(job)
+            return
+
+        if not lane.heap:
+            lane.virtual_time = max(lane.virtual_time, self.global_virtual_time)
+            self.active[job.session_id] = lane
+
+        rank = self.rank_of(job.student_id)
+        heapq.heappush(lane.heap, (now + rank * self.aging_seconds, next(self._counter), rank, now, job))
+        self.depth[rank] += 1
+        self._size += 1
+
+    def _get(self):
+        lane = min(self.active.values(), key=lambda lane: lane.virtual_time)
+        _, _, rank, enqueued_at, job = heapq.heappop(lane.heap)
+        self._size -= 1
+
+        now = time.perf_counter()
+        if not lane.heap:
+            del self.active[lane.session_id]
+            lane.idle_since = now
+            if lane.ended:
+                del self.lanes[lane.session_id]
+        self.global_virtual_time = lane.virtual_time
+        lane.virtual_time += 1.0 / lane.weight
+        lane.served += 1
+        lane.served_times.append(now)
+
+        self.depth[rank] -= 1
+        self.served[rank] += 1
+        self.max_wait[rank] = max(self.max_wait[rank], now - enqueued_at)
+        return job
+
+    def _drop_idle_lanes(self, now: float):
+        """Remove lanes that have had no frames for IDLE_LANE_SECONDS"""
+        self.next_idle_sweep = now + self.IDLE_LANE_SECONDS
+        cutoff = now - self.IDLE_LANE_SECONDS
+        for session_id, lane in list(self.lanes.items()):
+            if not lane.heap and lane.idle_since < cutoff:
+                del self.lanes[session_id]
+
+    def get_stats(self) -> Dict:
+        return {
+            label: {
+                'queued': self.depth[rank],
+                'served': self.served[rank],
+                'max_wait_ms': round(self.max_wait[rank] * 1000, 1)
+            }
+            for rank, label in enumerate(RISK_LABELS)
+        }
+
+    def get_session_stats(self) -> Dict:
+        """Queue depth, served rate and drops for each session"""
+        now = time.perf_counter()
+        cutoff = now - self.RATE_WINDOW_SECONDS
+        stats = {}
+        for session_id, lane in self.lanes.items():
+            recent = sum(1 for t in lane.served_times if t >= cutoff)
+            stats[session_id] = {
+                'weight': lane.weight,
+                'queue_depth': len(lane.heap),
+                'served': lane.served,
+                'served_per_second': round(recent / self.RATE_WINDOW_SECONDS, 2),
+                'dropped': lane.dropped
+            }
+        return stats
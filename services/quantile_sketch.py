@@ -0,0 +1,92 @@
+import numpy as np
+from typing import Dict, Iterable, Optional
+
+from utils.config import Config
+
+
+def sketch_bin(value: float, bins: int = Config.QUANTILE_SKETCH_BINS) -> int:
+    """Bin of an engagement score in a sketch of the given width"""
+    return min(max(int(value * bins), 0), bins - 1)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of engagement scores
+
+    Engagement is bounded to [0, 1], so the sketch is a fixed array of
+    QUANTILE_SKETCH_BINS equal-width bin counts: an update is one increment,
+    merging two sketches adds their counts (across sessions, or across
+    workers as Redis HINCRBY), and memory stays constant however many frames
+    are folded in. Quantiles are interpolated inside their bin, so they are
+    within 1/bins of the exact value.
+    """
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts: Optional[np.ndarray] = None, bins: int = Config.QUANTILE_SKETCH_BINS):
+        self.counts = np.zeros(bins, dtype=np.int64) if counts is None else counts
+
+    @property
+    def bins(self) -> int:
+        return len(self.counts)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def add(self, value: float):
+        self.counts[sketch_bin(value, len(self.counts))] += 1
+
+    def add_many(self, values: np.ndarray, weights: Optional[np.ndarray] = None):
+        if not len(values):
+            return
+        index = np.clip((np.asarray(values, dtype=np.float64) * len(self.counts)).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(index, weights=weights, minlength=len(self.counts)).astype(np.int64)
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        self.counts += other.counts
+        return self
+
+    def copy(self) -> 'QuantileSketch':
+        return QuantileSketch(self.counts.copy())
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        """Values at quantiles qs (0..1); NaN when the sketch is empty"""
+        qs = np.asarray(list(qs), dtype=np.float64)
+        total = self.count
+        if not total:
+            return np.full(len(qs), np.nan)
+
+        cumulative = np.cumsum(self.counts)
+        target = np.clip(qs, 0.0, 1.0) * total
+        index = np.minimum(np.searchsorted(cumulative, target, side='left'), len(self.counts) - 1)
+        # Skip empty bins a zero target would otherwise land on
+        index = np.where(target == 0, np.argmax(self.counts > 0), index)
+        below = cumulative[index] - self.counts[index]
+        within = (target - below) / np.maximum(self.counts[index], 1)
+        return (index + np.clip(within, 0.0, 1.0)) / len(self.counts)
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def rank(self, value: float) -> float:
+        """Fraction of folded-in scores below value"""
+        total = self.count
+        if not total:
+            return 0.0
+        position = min(max(value, 0.0), 1.0) * len(self.counts)
+        whole = min(int(position), len(self.counts) - 1)
+        below = float(self.counts[:whole].sum()) + float(self.counts[whole]) * (position - whole)
+        return min(below / total, 1.0)
+
+    def to_bins(self) -> Dict[int, int]:
+        """Non-empty bins as {bin: count} (the Redis hash representation)"""
+        index = np.flatnonzero(self.counts)
+        return dict(zip(index.tolist(), self.counts[index].tolist()))
+
+    @classmethod
+    def from_bins(cls, bins: Dict, size: int = Config.QUANTILE_SKETCH_BINS) -> 'QuantileSketch':
+        sketch = cls(bins=size)
+        for index, count in bins.items():
+            sketch.counts[min(int(index), size - 1)] += int(count)
+        return sketch
@@ -0,0 +1,205 @@
+"""
+Bulk report generation across a process pool
+
+Renders the PDF and JSON report of every archived session that started in a
+date range (or of a list of sessions) on REPORT_BATCH_WORKERS processes.
+Each worker prepares its report styles, fonts and color map, and its own
+session store and analytics engine, once; sessions are then restored from
+the database, analysed and rendered one at a time, and freed again. Worker
+session stores spill into a temporary directory, never into the live
+server's DATA_DIR.
+
+Usage (nightly):
+    python -m services.report_batch [--start 2026-01-05] [--end 2026-01-05] [--out exports/nightly]
+    python -m services.report_batch --sessions math-101 physics-7
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from database.db import get_db_connection
+from utils.config import Config
+from utils.logger import logger
+
+
+SESSIONS_IN_RANGE_SQL = '''
+    SELECT session_id FROM classroom_sessions
+    WHERE start_time >= %s AND start_time < %s
+    ORDER BY start_time
+'''
+
+_worker: Dict = {}  # per-process resources, set up by _init_worker
+
+
+def sessions_between(start: date, end: date) -> List[str]:
+    """Archived sessions that started on local days start..end (inclusive)"""
+    first = datetime.combine(start, datetime.min.time()).astimezone()
+    last = datetime.combine(end + timedelta(days=1), datetime.min.time()).astimezone()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(SESSIONS_IN_RANGE_SQL, (first, last))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return [row['session_id'] for row in rows]
+
+
+def generate_reports(session_ids: Iterable[str], out_dir: str, formats: Iterable[str] = ('pdf', 'json'),
+                     workers: int = Config.REPORT_BATCH_WORKERS) -> Dict:
+    """
+    Render reports for many sessions in parallel
+
+    Args:
+        session_ids: Archived sessions to report on
+        out_dir: Directory for session_{id}.{pdf,json}
+        formats: Report formats per session
+        workers: Worker processes (0 = one per CPU)
+
+    Returns:
+        {sessions, reports, failed, workers, seconds, reports_per_second,
+         report_seconds: {mean, p50, p95, max}, results: [per session]}
+    """
+    session_ids = list(dict.fromkeys(session_ids))
+    formats = tuple(formats)
+    workers = min(workers or os.cpu_count() or 1, max(len(session_ids), 1))
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = []
+    # spawn: workers start clean instead of inheriting the caller's threads and sockets
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='report-batch-') as data_dir, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=_init_worker, initargs=(out_dir, data_dir)) as pool:
+        futures = [pool.submit(_render_session, session_id, formats) for session_id in session_ids]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'done':
+                logger.info(f"📄 {result['session_id']}: {result['seconds']:.2f}s")
+            else:
+                logger.error(f"❌ Report for {result['session_id']} {result['status']} {result.get('error', '')}".rstrip())
+    seconds = time.perf_counter() - start
+
+    order = {session_id: i for i, session_id in enumerate(session_ids)}
+    results.sort(key=lambda result: order[result['session_id']])
+    done = [result for result in results if result['status'] == 'done']
+    report_seconds = np.array([report['seconds'] for result in done for report in result['reports'].values()])
+    reports = len(report_seconds)
+    return {
+        'sessions': len(session_ids),
+        'reports': reports,
+        'failed': len(results) - len(done),
+        'workers': workers,
+        'seconds': round(seconds, 3),
+        'reports_per_second': round(reports / seconds, 2) if seconds else 0.0,
+        'report_seconds': {
+            'mean': round(float(report_seconds.mean()), 3),
+            'p50': round(float(np.percentile(report_seconds, 50)), 3),
+            'p95': round(float(np.percentile(report_seconds, 95)), 3),
+            'max': round(float(report_seconds.max()), 3)
+        } if reports else None,
+        'results': results
+    }
+
+
+# ----------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------
+
+def _init_worker(out_dir: str, data_dir: str):
+    """Prepare one worker's shared resources (once per process)"""
+    from services.analytics_engine import AnalyticsEngine
+    from services.report_generator import ReportGenerator
+    from services.session_archiver import SessionArchiver
+    from services.session_manager import SessionManager
+
+    # A private spill directory: release_frames() removes a session's files there
+    session_manager = SessionManager(data_dir=tempfile.mkdtemp(prefix='worker-', dir=data_dir))
+    analytics_engine = AnalyticsEngine(session_manager)
+    _worker.update(
+        session_manager=session_manager,
+        archiver=SessionArchiver(session_manager),
+        analytics_engine=analytics_engine,
+        generator=ReportGenerator(analytics_engine, exports_dir=out_dir)
+    )
+
+
+def _render_session(session_id: str, formats: tuple) -> Dict:
+    """
+    Restore, analyse and render one archived session
+
+    Returns:
+        {session_id, status, seconds, load_seconds, analytics_seconds,
+         reports: {format: {path, seconds}}}
+    """
+    session_manager = _worker['session_manager']
+    generator = _worker['generator']
+    result = {'session_id': session_id, 'reports': {}}
+    start = time.perf_counter()
+    try:
+        loaded = _worker['archiver'].load_archived(session_id)
+        if loaded is None:
+            result['status'] = 'missing'
+            return result
+        metadata, columns, rollups = loaded
+        session_manager.restore_archived(metadata, columns, rollups)
+        restored = time.perf_counter()
+        result['load_seconds'] = round(restored - start, 3)
+
+        session = session_manager.get_session_data(session_id)
+        analytics = _worker['analytics_engine'].generate_session_analytics(session_id)
+        result['analytics_seconds'] = round(time.perf_counter() - restored, 3)
+
+        for fmt in formats:
+            begin = time.perf_counter()
+            path = os.path.join(generator.exports_dir, f"session_{session_id}.{fmt}")
+            if fmt == 'pdf':
+                generator.generate_pdf_report(session_id, session, generator.report_analytics(analytics), path)
+            else:
+                generator.generate_json_report(session_id, session, analytics, path)
+            result['reports'][fmt] = {'path': path, 'seconds': round(time.perf_counter() - begin, 3)}
+        result['status'] = 'done'
+    except Exception as e:
+        result.update(status='failed', error=str(e))
+    finally:
+        session_manager.release_frames(session_id)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--start', type=date.fromisoformat, help='first day (default: today)')
+    parser.add_argument('--end', type=date.fromisoformat, help='last day (default: --start)')
+    parser.add_argument('--sessions', nargs='+', help='session ids instead of a date range')
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'json'], choices=['pdf', 'json'])
+    parser.add_argument('--out', help='output directory (default: exports/nightly/<start>)')
+    parser.add_argument('--workers', type=int, default=Config.REPORT_BATCH_WORKERS, help='0 = one per CPU')
+    args = parser.parse_args()
+
+    first = args.start or date.today()
+    session_ids = args.sessions or sessions_between(first, args.end or first)
+    out_dir = args.out or os.path.join('exports', 'nightly', first.isoformat())
+    logger.info(f"🌙 Generating reports for {len(session_ids)} sessions into {out_dir}")
+
+    summary = generate_reports(session_ids, out_dir, args.formats, args.workers)
+    timing = summary['report_seconds'] or {}
+    logger.success(
+        f"🗂️ {summary['reports']} reports for {summary['sessions']} sessions in {summary['seconds']:.1f}s "
+        f"on {summary['workers']} workers ({summary['reports_per_second']:.1f} reports/s, "
+        f"p50 {timing.get('p50', 0):.2f}s, p95 {timing.get('p95', 0):.2f}s, {summary['failed']} failed)"
+    )
+
+
+if __name__ == '__main__':
+    main()
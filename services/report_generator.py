@@ -6,6 +6,7 @@ from reportlab.lib import colors
 from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.pdfbase import pdfmetrics
 from datetime import datetime
 import json
 import os
@@ -13,28 +14,23 @@ import os
 class ReportGenerator:
     """
     Generate PDF and JSON reports for classroom sessions
+    
+    Paragraph and table styles, fonts and the emotion color map are prepared
+    once per generator and shared by every report it renders.
     """
     
-    def __init__(self, analytics_engine):
+    def __init__(self, analytics_engine, exports_dir: str = "exports"):
         self.analytics_engine = analytics_engine
-        self.exports_dir = "exports"
+        self.exports_dir = exports_dir
         os.makedirs(self.exports_dir, exist_ok=True)
+        self._prepare_resources()
     
-    def generate_pdf_report(self, session_id: str, session_data: dict, analytics: dict) -> str:
-        """
-        Generate comprehensive PDF report
-        
-        Returns:
-            path to generated PDF
-        """
-        filename = f"{self.exports_dir}/session_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
-        doc = SimpleDocTemplate(filename, pagesize=A4)
-        story = []
+    def _prepare_resources(self):
+        """Build the styles, fonts and colors every report uses"""
         styles = getSampleStyleSheet()
         
         # Custom styles
-        title_style = ParagraphStyle(
+        self.title_style = ParagraphStyle(
             'CustomTitle',
             parent=styles['Heading1'],
             fontSize=24,
@@ -43,7 +39,7 @@ class ReportGenerator:
             alignment=1  # Center
         )
         
-        heading_style = ParagraphStyle(
+        self.heading_style = ParagraphStyle(
             'CustomHeading',
             parent=styles['Heading2'],
             fontSize=16,
@@ -51,6 +47,79 @@ class ReportGenerator:
             spaceAfter=12
         )
         
+        self.info_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E0E7FF')),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+        ])
+        
+        self.metrics_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+        ])
+        
+        self.student_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+        ])
+        
+        # Color mapping
+        self.emotion_colors = {
+            'happy': colors.HexColor('#10B981'),
+            'surprise': colors.HexColor('#F59E0B'),
+            'neutral': colors.HexColor('#6B7280'),
+            'sad': colors.HexColor('#3B82F6'),
+            'fear': colors.HexColor('#8B5CF6'),
+            'angry': colors.HexColor('#EF4444'),
+            'disgust': colors.HexColor('#EC4899')
+        }
+        
+        # Load font metrics now rather than in the first report
+        for font in ('Helvetica', 'Helvetica-Bold'):
+            pdfmetrics.getFont(font)
+    
+    @staticmethod
+    def report_analytics(analytics: dict) -> dict:
+        """The parts of generate_session_analytics() the PDF report shows"""
+        return {
+            'emotion_distribution': analytics['emotion_distribution'],
+            'student_comparison': analytics['student_comparison'],
+            'peak_engagement': 95.0
+        }
+    
+    def generate_pdf_report(self, session_id: str, session_data: dict, analytics: dict, path: str = None) -> str:
+        """
+        Generate comprehensive PDF report
+        
+        Args:
+            path: Output file (default: a new timestamped file in exports/)
+        
+        Returns:
+            path to generated PDF
+        """
+        filename = path or f"{self.exports_dir}/session_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        
+        doc = SimpleDocTemplate(filename, pagesize=A4)
+        story = []
+        title_style = self.title_style
+        heading_style = self.heading_style
+        
         # Title
         story.append(Paragraph("AI Classroom Analytics Report", title_style))
         story.append(Spacer(1, 0.2*inch))
@@ -67,15 +136,7 @@ class ReportGenerator:
         ]
         
         t = Table(session_info, colWidths=[2*inch, 4*inch])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E0E7FF')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-        ]))
+        t.setStyle(self.info_table_style)
         story.append(t)
         story.append(Spacer(1, 0.3*inch))
         
@@ -91,16 +152,7 @@ class ReportGenerator:
         ]
         
         t2 = Table(metrics_data, colWidths=[2.5*inch, 2*inch, 1.5*inch])
-        t2.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-        ]))
+        t2.setStyle(self.metrics_table_style)
         story.append(t2)
         story.append(Spacer(1, 0.3*inch))
         
@@ -129,16 +181,7 @@ class ReportGenerator:
                 ])
             
             t3 = Table(student_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-            t3.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-            ]))
+            t3.setStyle(self.student_table_style)
             story.append(t3)
         
         # Build PDF
@@ -158,31 +201,23 @@ class ReportGenerator:
         pie.labels = list(data.keys())
         pie.slices.strokeWidth = 0.5
         
-        # Color mapping
-        colors_map = {
-            'happy': colors.HexColor('#10B981'),
-            'surprise': colors.HexColor('#F59E0B'),
-            'neutral': colors.HexColor('#6B7280'),
-            'sad': colors.HexColor('#3B82F6'),
-            'fear': colors.HexColor('#8B5CF6'),
-            'angry': colors.HexColor('#EF4444'),
-            'disgust': colors.HexColor('#EC4899')
-        }
-        
         for i, label in enumerate(pie.labels):
-            pie.slices[i].fillColor = colors_map.get(label, colors.grey)
+            pie.slices[i].fillColor = self.emotion_colors.get(label, colors.grey)
         
         drawing.add(pie)
         return drawing
     
-    def generate_json_report(self, session_id: str, session_data: dict, analytics: dict) -> str:
+    def generate_json_report(self, session_id: str, session_data: dict, analytics: dict, path: str = None) -> str:
         """
         Generate JSON report for API consumption
         
+        Args:
+            path: Output file (default: a new timestamped file in exports/)
+        
         Returns:
             path to JSON file
         """
-        filename = f"{self.exports_dir}/session_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        filename = path or f"{self.exports_dir}/session_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
         report = {
             'session_info': session_data,
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from utils.config import Config
+from utils.logger import logger
+
+
+REPORT_FORMATS = ('pdf', 'json')
+
+
+class ReportJobs:
+    """
+    Background report generation, one job per session version
+
+    A job is keyed by session, analytics version and format. The analytics
+    and session metadata are read on the event loop when it is submitted;
+    the ReportLab/JSON rendering runs on a pool of REPORT_WORKERS threads,
+    so the event loop keeps serving WebSockets meanwhile.
+
+    Submitting while the same report is queued or running joins that job.
+    A finished job's file is reused until the session changes (new frames,
+    archival). Archived sessions no longer change, so their reports stay
+    valid across restores from the database.
+
+    A superseded version's job and file are kept for grace_seconds after
+    the newer one is written, so downloads already under way complete.
+    Expired superseded jobs are evicted whenever a job finishes, and so
+    are the oldest finished jobs (past their grace period) beyond max_jobs.
+    """
+
+    def __init__(self, session_manager, analytics_engine, report_generator,
+                 workers: int = Config.REPORT_WORKERS,
+                 grace_seconds: float = Config.REPORT_GRACE_SECONDS,
+                 max_jobs: int = Config.REPORT_MAX_JOBS):
+        self.session_manager = session_manager
+        self.analytics_engine = analytics_engine
+        self.report_generator = report_generator
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reports')
+        self.grace_seconds = grace_seconds
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, Dict] = {}  # job_id -> status record
+        self.tasks: Dict[str, asyncio.Task] = {}  # job_id -> running job
+        self.latest: Dict[tuple, str] = {}  # (session_id, format) -> newest job_id
+        self.generated = 0
+        self.reused = 0
+        self.joined = 0
+        self.evicted = 0
+        self.seconds = 0.0
+
+    def submit(self, session_id: str, session: Dict, fmt: str = 'pdf') -> Dict:
+        """
+        Queue a report, or return the job already producing or holding it (call from the event loop)
+
+        Args:
+            session: The session's metadata (get_session_data)
+            fmt: 'pdf' or 'json'
+
+        Returns:
+            The job's status record
+        """
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(REPORT_FORMATS)}")
+
+        version = self._version(session_id, session)
+        job_id = f"{session_id}:{version if version is not None else 'live'}:{fmt}"
+        job = self.jobs.get(job_id)
+        if job is not None:
+            if job['status'] in ('queued', 'running'):
+                self.joined += 1
+                return job
+            if job['status'] == 'done' and version is not None and os.path.exists(job['path']):
+                self.reused += 1
+                return job
+
+        analytics = self.analytics_engine.generate_session_analytics(session_id)
+        if fmt == 'pdf':
+            analytics = self.report_generator.report_analytics(analytics)
+
+        job = self.jobs[job_id] = {
+            'job_id': job_id,
+            'session_id': session_id,
+            'version': version,
+            'format': fmt,
+            'status': 'queued',
+            'submitted_at': time.time()
+        }
+        task = asyncio.create_task(self._run(job, dict(session), analytics))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+        return job
+
+    async def wait(self, job_id: str) -> Dict:
+        """Wait for a job to finish (without cancelling it if the caller goes away)"""
+        job = self.jobs[job_id]
+        task = self.tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    @staticmethod
+    def describe(job: Dict) -> Dict:
+        """A job's status record as returned by the API (no server paths)"""
+        described = {key: value for key, value in job.items() if key != 'path'}
+        if job['status'] == 'done':
+            described['download_url'] = f"/api/reports/{job['job_id']}/download"
+        return described
+
+    def get_stats(self) -> Dict:
+        by_status: Dict[str, int] = {}
+        for job in self.jobs.values():
+            by_status[job['status']] = by_status.get(job['status'], 0) + 1
+        return {
+            'jobs': by_status,
+            'generated': self.generated,
+            'reused': self.reused,
+            'joined': self.joined,
+            'evicted': self.evicted,
+            'avg_generation_ms': round(self.seconds / self.generated * 1000, 1) if self.generated else 0.0
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _version(self, session_id: str, session: Dict):
+        if session.get('archived'):
+            return 'archived'
+        return self.session_manager.session_version(session_id)
+
+    async def _run(self, job: Dict, session: Dict, analytics: Dict):
+        job_id = job['job_id']
+        session_id = job['session_id']
+        suffix = f"v{job['version']}" if job['version'] is not None else 'live'
+        path = os.path.join(self.report_generator.exports_dir, f"session_{session_id}_{suffix}.{job['format']}")
+        render = (
+            self.report_generator.generate_pdf_report if job['format'] == 'pdf'
+            else self.report_generator.generate_json_report
+        )
+
+        job['status'] = 'running'
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, render, session_id, session, analytics, path)
+        except Exception as e:
+            logger.error(f"❌ Report {job_id} failed: {e}")
+            job.update(status='failed', error=str(e), finished_at=time.time())
+            self._evict(job['finished_at'])
+            return
+
+        seconds = time.perf_counter() - start
+        now = time.time()
+        job.update(status='done', path=path, seconds=round(seconds, 3), finished_at=now)
+        self.generated += 1
+        self.seconds += seconds
+
+        # Retire the version this one replaces, or this one if an even newer job finished first
+        key = (session_id, job['format'])
+        previous = self.jobs.get(self.latest.get(key))
+        if previous is None or previous['submitted_at'] <= job['submitted_at']:
+            self.latest[key] = job_id
+            if previous is not None and previous is not job and previous['status'] in ('done', 'failed'):
+                previous['superseded_at'] = now
+        else:
+            job['superseded_at'] = now
+        self._evict(now)
+        logger.info(f"📄 Report {job_id} ready in {seconds:.2f}s")
+
+    def _evict(self, now: float):
+        """Forget superseded jobs past their grace period, then the oldest finished ones beyond max_jobs"""
+        settled = now - self.grace_seconds
+        finished = [job for job in self.jobs.values() if job['status'] in ('done', 'failed')]
+        expired = [job for job in finished if job.get('superseded_at', now) < settled]
+        excess = len(self.jobs) - len(expired) - self.max_jobs
+        if excess > 0:
+            oldest = sorted(
+                (job for job in finished if 'superseded_at' not in job and job['finished_at'] < settled),
+                key=lambda job: job['finished_at']
+            )
+            expired += oldest[:excess]
+
+        for job in expired:
+            del self.jobs[job['job_id']]
+            key = (job['session_id'], job['format'])
+            if self.latest.get(key) == job['job_id']:
+                del self.latest[key]
+            if job.get('path'):
+                try:
+                    os.remove(job['path'])
+                except OSError:
+                    pass
+        self.evicted += len(expired)
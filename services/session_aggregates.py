@@ -0,0 +1,180 @@
+import numpy as np
+from typing import Dict, List
+
+from services.quantile_sketch import QuantileSketch
+
+
+class StudentAggregate:
+    """Running moments, minute totals and quantile sketch of one student's engagement"""
+
+    __slots__ = ('count', 'sum', 'sumsq', 'peak', 'positive', 'minutes', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.peak = float('-inf')
+        self.positive = 0
+        self.minutes: Dict[int, List] = {}  # minute -> [frames, engagement sum]
+        self.sketch = QuantileSketch()
+
+
+class SessionAggregates:
+    """
+    Analytics aggregates of one session, kept current as frames are logged
+
+    Holds emotion counters, per-minute class totals and per-student moments
+    and minute totals, so every dashboard metric can be read in
+    O(students + minutes) instead of rescanning frames. add() is the per-frame
+    path; add_many() and add_rollup() fold in replayed or restored data.
+
+    Each student also has a QuantileSketch of engagement for percentile
+    queries. Rolled-up minutes only keep totals, so add_rollup() counts
+    their frames at the minute's mean.
+    """
+
+    __slots__ = ('positive_codes', 'emotion_counts', 'minutes', 'students')
+
+    def __init__(self, positive_codes):
+        self.positive_codes = frozenset(positive_codes)
+        self.emotion_counts: List[int] = []  # emotion code -> frames
+        self.minutes: Dict[int, List] = {}  # minute -> [frames, engagement sum]
+        self.students: Dict[str, StudentAggregate] = {}
+
+    def add(self, student_id: str, timestamp: float, engagement: float, emotion: int):
+        student = self.students.get(student_id)
+        if student is None:
+            student = self.students[student_id] = StudentAggregate()
+
+        student.count += 1
+        student.sum += engagement
+        student.sumsq += engagement * engagement
+        if engagement > student.peak:
+            student.peak = engagement
+        if emotion in self.positive_codes:
+            student.positive += 1
+        student.sketch.add(engagement)
+
+        minute = int(timestamp // 60)
+        bucket = student.minutes.get(minute)
+        if bucket is None:
+            student.minutes[minute] = [1, engagement]
+        else:
+            bucket[0] += 1
+            bucket[1] += engagement
+
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            self.minutes[minute] = [1, engagement]
+        else:
+            bucket[0] += 1
+            bucket[1] += engagement
+
+        counts = self.emotion_counts
+        while len(counts) <= emotion:
+            counts.append(0)
+        counts[emotion] += 1
+
+    def add_many(self, student_id: str, timestamps: np.ndarray,
+                 engagement: np.ndarray, emotion: np.ndarray):
+        """Fold a block of raw frames in at once"""
+        if not len(timestamps):
+            return
+        engagement = engagement.astype(np.float64)
+        self._student(student_id).sketch.add_many(engagement)
+        minutes, inverse = np.unique((timestamps // 60).astype(np.int64), return_inverse=True)
+        self._fold(
+            student_id,
+            minutes,
+            np.bincount(inverse, minlength=len(minutes)),
+            np.bincount(inverse, weights=engagement, minlength=len(minutes)),
+            float(np.dot(engagement, engagement)),
+            float(engagement.max()),
+            np.bincount(emotion)
+        )
+
+    def add_rollup(self, student_id: str, rollup):
+        """Fold in a MinuteRollup of compacted frames"""
+        if not len(rollup):
+            return
+        self._student(student_id).sketch.add_many(rollup.sum / np.maximum(rollup.count, 1), weights=rollup.count)
+        self._fold(
+            student_id,
+            rollup.minute,
+            rollup.count,
+            rollup.sum,
+            float(rollup.sumsq.sum()),
+            float(rollup.max.max()),
+            rollup.hist.sum(axis=0)
+        )
+
+    def _student(self, student_id: str) -> StudentAggregate:
+        student = self.students.get(student_id)
+        if student is None:
+            student = self.students[student_id] = StudentAggregate()
+        return student
+
+    def _fold(self, student_id, minutes, counts, sums, sumsq, peak, emotion_counts):
+        student = self._student(student_id)
+
+        student.count += int(counts.sum())
+        student.sum += float(sums.sum())
+        student.sumsq += sumsq
+        student.peak = max(student.peak, peak)
+        student.positive += int(sum(
+            emotion_counts[code] for code in self.positive_codes if code < len(emotion_counts)
+        ))
+
+        for minute, count, total in zip(minutes.tolist(), counts.tolist(), sums.tolist()):
+            for buckets in (student.minutes, self.minutes):
+                bucket = buckets.get(minute)
+                if bucket is None:
+                    buckets[minute] = [int(count), total]
+                else:
+                    bucket[0] += int(count)
+                    bucket[1] += total
+
+        counts = self.emotion_counts
+        for code, n in enumerate(emotion_counts.tolist()):
+            if n:
+                while len(counts) <= code:
+                    counts.append(0)
+                counts[code] += int(n)
+
+    def sketches(self) -> Dict[str, QuantileSketch]:
+        """Copy of each student's engagement sketch (take it under the session's lock)"""
+        return {student_id: s.sketch.copy() for student_id, s in self.students.items()}
+
+    def summary(self) -> Dict:
+        """
+        Copy of the aggregates as arrays (take it under the session's lock)
+
+        Returns:
+            {'emotion_counts', 'minutes': (minute, frames, engagement sum) arrays,
+             'students': {student_id: {count, sum, sumsq, peak, positive, minutes}}}
+        """
+        return {
+            'emotion_counts': np.array(self.emotion_counts, dtype=np.int64),
+            'minutes': _minute_arrays(self.minutes),
+            'students': {
+                student_id: {
+                    'count': s.count,
+                    'sum': s.sum,
+                    'sumsq': s.sumsq,
+                    'peak': s.peak,
+                    'positive': s.positive,
+                    'minutes': _minute_arrays(s.minutes)
+                }
+                for student_id, s in self.students.items()
+            }
+        }
+
+
+def _minute_arrays(buckets: Dict[int, List]):
+    """Sorted (minutes, frame counts, engagement sums) arrays of minute buckets"""
+    minutes = sorted(buckets)
+    return (
+        np.array(minutes, dtype=np.int64),
+        np.array([buckets[m][0] for m in minutes], dtype=np.int64),
+        np.array([buckets[m][1] for m in minutes], dtype=np.float64)
+    )
@@ -0,0 +1,432 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from database.db import get_db_connection
+from services.frame_store import FrameView, MinuteRollup
+from utils.config import Config
+from utils.logger import logger
+
+
+COPY_IN_SQL = '''
+    COPY frame_data (session_id, student_id, timestamp, emotion, confidence, engagement_score, source)
+    FROM STDIN WITH (FORMAT csv)
+'''
+
+COPY_ROLLUPS_IN_SQL = '''
+    COPY frame_rollups (session_id, student_id, minute, frame_count, engagement_sum,
+                        engagement_sumsq, engagement_min, engagement_max, emotion_counts, source)
+    FROM STDIN WITH (FORMAT csv)
+'''
+
+COPY_ROLLUPS_OUT_SQL = '''
+    COPY (
+        SELECT student_id, EXTRACT(EPOCH FROM minute)::bigint / 60, frame_count, engagement_sum,
+               engagement_sumsq, engagement_min, engagement_max, emotion_counts
+        FROM frame_rollups WHERE session_id = {session_id}
+        ORDER BY student_id, minute
+    ) TO STDOUT WITH (FORMAT csv)
+'''
+
+COPY_OUT_SQL = '''
+    COPY (
+        SELECT student_id, EXTRACT(EPOCH FROM timestamp), engagement_score, confidence, emotion
+        FROM frame_data WHERE session_id = {session_id}
+        ORDER BY student_id, timestamp
+    ) TO STDOUT WITH (FORMAT csv)
+'''
+
+
+class ArchivePending(Exception):
+    """A session's frames are spread over several workers and not merged in the archive yet"""
+
+
+class SessionArchiver:
+    """
+    Moves ended sessions' frames from memory to Postgres
+
+    Archival runs on a dedicated thread: the session's frame columns are
+    turned into CSV in batches of ARCHIVE_BATCH_ROWS and streamed into
+    frame_data with COPY, all inside one transaction. Once committed, the
+    in-memory copy is freed. Minute rollups of compacted frames go to
+    frame_rollups the same way. Every archived time is a TIMESTAMPTZ, so
+    frame times (epoch seconds, written as UTC) and session times (local
+    ISO strings, written with the server's offset) compare correctly.
+    Analytics for an archived session restore its frames from the database
+    on demand (COPY TO STDOUT), keeping at most ARCHIVE_RESTORE_CACHE
+    restored sessions in memory.
+
+    With shared state each worker archives its own share of a session's
+    frames (rows tagged with its holder name as source) and restoring reads
+    every share back merged. Until every holder has archived, ensure_loaded()
+    raises ArchivePending instead of serving one worker's partial frames.
+    """
+
+    MERGE_POLL_SECONDS = 0.25
+
+    def __init__(self, session_manager):
+        self.session_manager = session_manager
+        self.shared = session_manager.shared  # SharedSessionState or None
+        self.source = self.shared.holder if self.shared else ''
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archiver')
+        self.batch_rows = Config.ARCHIVE_BATCH_ROWS
+        self.tasks = set()
+        self.jobs: Dict[str, Dict] = {}  # session_id -> last archival result
+        self.restored = OrderedDict()  # LRU of sessions restored from the database
+        self.merges: Dict[str, asyncio.Task] = {}  # session_id -> wait for every worker's share
+
+    def schedule(self, session_id: str):
+        """Archive a session in the background (call from the event loop)"""
+        if self.jobs.get(session_id, {}).get('status') in ('queued', 'running', 'archived'):
+            return
+        self.jobs[session_id] = {'status': 'queued'}
+        task = asyncio.create_task(self.archive(session_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def archive(self, session_id: str) -> Dict:
+        """
+        Copy a session's frames to Postgres, then free them from memory
+
+        Returns:
+            {'status', 'rows', 'seconds', 'rows_per_second'}
+        """
+        loop = asyncio.get_running_loop()
+        if self.shared:
+            # The session may have been ended on another worker a moment ago
+            await loop.run_in_executor(None, self.shared.refresh_session, session_id)
+        session = self.session_manager.get_session_data(session_id)
+        if not session:
+            return {'status': 'missing'}
+        # Column references are taken on the loop thread; the copy thread only reads them
+        metadata = dict(session)
+        views, rollups = self.session_manager.read_session_frames(session_id)
+        labels = np.array(self.session_manager.frame_store.emotions.labels, dtype=object)
+
+        # Frames this worker logged (the shared total counts every worker's)
+        local = self.session_manager.active_sessions.get(session_id) or {}
+        frames_missing = not any(len(frames) for frames in views.values()) and not rollups
+        if session.get('archived') or (local.get('total_frames_processed') and frames_missing):
+            # Copying now would replace the archived rows with nothing
+            logger.warning(f"⚠️ Session {session_id} is already archived or its frames are not loaded; skipped")
+            self.jobs[session_id] = {'status': 'skipped'}
+            if self.shared:
+                self.shared.release_holder(session_id)
+            return self.jobs[session_id]
+
+        self.jobs[session_id] = {'status': 'running'}
+        try:
+            result = await loop.run_in_executor(
+                self.executor, self._copy_session, metadata, views, rollups, labels
+            )
+        except Exception as e:
+            logger.error(f"❌ Archival of session {session_id} failed: {e}")
+            self.jobs[session_id] = {'status': 'failed', 'error': str(e)}
+            return self.jobs[session_id]
+
+        self.session_manager.release_frames(session_id)
+        if self.shared:
+            self.shared.release_holder(session_id)
+        self.restored.pop(session_id, None)
+        self.jobs[session_id] = result
+        logger.success(
+            f"📦 Archived session {session_id}: {result['rows']} frames "
+            f"in {result['seconds']}s ({result['rows_per_second']:.0f} rows/s)"
+        )
+        return result
+
+    async def ensure_loaded(self, session_id: str) -> bool:
+        """
+        Make an archived session's frames available to analytics
+
+        Returns:
+            False if the session is unknown both in memory and in the database
+
+        Raises:
+            ArchivePending: With shared state, while the session is live or
+                            some worker has not archived its share yet
+        """
+        if self.session_manager.holds_frames(session_id):
+            if not self.shared:
+                return True
+            raise ArchivePending(
+                f"Session {session_id} has frames on several workers; "
+                "frame-level analytics are available once it has ended and been archived"
+            )
+        if session_id in self.restored:
+            self.restored.move_to_end(session_id)
+            return True
+
+        loop = asyncio.get_running_loop()
+        session = self.session_manager.get_session_data(session_id)
+        if self.shared and session is not None:
+            pending = await loop.run_in_executor(None, self.shared.pending_holders, session_id)
+            if not session.get('end_time') or pending:
+                raise ArchivePending(
+                    f"Session {session_id} is still being archived by {pending} worker(s)"
+                    if session.get('end_time') else
+                    f"Session {session_id} is live; with several workers its frame-level "
+                    "analytics are available once it has ended and been archived"
+                )
+
+        try:
+            loaded = await loop.run_in_executor(None, self._load_session, session_id, session)
+        except Exception as e:
+            logger.error(f"❌ Could not restore session {session_id}: {e}")
+            return False
+        if loaded is None:
+            return False
+
+        metadata, columns, rollups = loaded
+        self.session_manager.restore_archived(metadata, columns, rollups)
+        self.restored[session_id] = True
+        while len(self.restored) > Config.ARCHIVE_RESTORE_CACHE:
+            evicted, _ = self.restored.popitem(last=False)
+            self.session_manager.release_frames(evicted)
+        return True
+
+    def merge(self, session_id: str) -> asyncio.Task:
+        """
+        Load an ended session once every worker has archived its share (shared state)
+
+        Runs in the background for up to SHARED_ARCHIVE_TIMEOUT; callers
+        may await the task for less. The task's result is ensure_loaded()'s,
+        or False on timeout.
+        """
+        task = self.merges.get(session_id)
+        if task is None:
+            task = self.merges[session_id] = asyncio.create_task(self._merge(session_id))
+            task.add_done_callback(lambda _: self.merges.pop(session_id, None))
+        return task
+
+    async def _merge(self, session_id: str) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.SHARED_ARCHIVE_TIMEOUT
+        while True:
+            try:
+                return await self.ensure_loaded(session_id)
+            except ArchivePending:
+                if loop.time() >= deadline:
+                    logger.warning(f"⚠️ Session {session_id} was not fully archived in time")
+                    return False
+                await asyncio.sleep(self.MERGE_POLL_SECONDS)
+
+    def load_archived(self, session_id: str):
+        """
+        Read an archived session from the database (blocking)
+
+        Returns:
+            (metadata, columns, rollups) for SessionManager.restore_archived(),
+            or None if the session was never archived
+        """
+        return self._load_session(session_id, None)
+
+    def get_stats(self) -> Dict:
+        archived = [job for job in self.jobs.values() if job.get('status') == 'archived']
+        rows = sum(job['rows'] for job in archived)
+        seconds = sum(job['seconds'] for job in archived)
+        return {
+            'archived_sessions': len(archived),
+            'archived_rows': rows,
+            'rows_per_second': round(rows / seconds, 1) if seconds else 0.0,
+            'restored_in_memory': list(self.restored),
+            'jobs': self.jobs
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Worker thread
+    # ------------------------------------------------------------------
+
+    def _copy_session(self, session: Dict, views: Dict[str, FrameView],
+                      rollups: Dict[str, MinuteRollup], labels: np.ndarray) -> Dict:
+        start = time.perf_counter()
+        session_id = session['session_id']
+        total_rows = 0
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if any(len(frames) for frames in views.values()) or rollups:
+                # Re-archiving replaces this worker's previous copy (only with frames to replace it by)
+                cursor.execute('DELETE FROM frame_data WHERE session_id = %s AND source = %s', (session_id, self.source))
+                cursor.execute('DELETE FROM frame_rollups WHERE session_id = %s AND source = %s', (session_id, self.source))
+            cursor.execute('''
+                INSERT INTO classroom_sessions
+                (session_id, teacher_id, subject, start_time, end_time,
+                 average_engagement, total_frames, metadata)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    end_time = EXCLUDED.end_time,
+                    average_engagement = EXCLUDED.average_engagement,
+                    total_frames = EXCLUDED.total_frames,
+                    metadata = EXCLUDED.metadata,
+                    archived_at = CURRENT_TIMESTAMP
+            ''', (
+                session_id,
+                session.get('teacher_id'),
+                session.get('subject'),
+                self._zoned(session.get('start_time')),
+                self._zoned(session.get('end_time')),
+                session.get('average_class_engagement', 0),
+                session.get('total_frames_processed', 0),
+                json.dumps(session)
+            ))
+
+            for student_id, frames in views.items():
+                for lo in range(0, len(frames), self.batch_rows):
+                    hi = min(lo + self.batch_rows, len(frames))
+                    buffer = self._csv_batch(session_id, student_id, frames, lo, hi, labels, self.source)
+                    cursor.copy_expert(COPY_IN_SQL, buffer)
+                    total_rows += hi - lo
+
+            if rollups:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for student_id, rollup in rollups.items():
+                    writer.writerows(self._rollup_rows(session_id, student_id, rollup, labels, self.source))
+                buffer.seek(0)
+                cursor.copy_expert(COPY_ROLLUPS_IN_SQL, buffer)
+                total_rows += sum(len(rollup) for rollup in rollups.values())
+
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        seconds = time.perf_counter() - start
+        return {
+            'status': 'archived',
+            'rows': total_rows,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(total_rows / seconds, 1) if seconds > 0 else 0.0
+        }
+
+    @staticmethod
+    def _zoned(value: Optional[str]) -> Optional[datetime]:
+        """A session time (naive local ISO string) with the server's UTC offset attached"""
+        return datetime.fromisoformat(value).astimezone() if value else None
+
+    @staticmethod
+    def _csv_batch(session_id: str, student_id: str, frames: FrameView,
+                   lo: int, hi: int, labels: np.ndarray, source: str = '') -> io.StringIO:
+        """CSV rows for frames[lo:hi], built column-wise"""
+        micros = np.round(frames.timestamps[lo:hi] * 1e6).astype('datetime64[us]')
+        timestamps = np.datetime_as_string(micros, unit='us', timezone='UTC').tolist()
+        emotions = labels[frames.emotion[lo:hi]].tolist()
+        confidence = frames.confidence[lo:hi].tolist()
+        engagement = frames.engagement[lo:hi].tolist()
+
+        n = hi - lo
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(
+            [session_id] * n, [student_id] * n, timestamps, emotions, confidence, engagement, [source] * n
+        ))
+        buffer.seek(0)
+        return buffer
+
+    @staticmethod
+    def _rollup_rows(session_id: str, student_id: str, rollup: MinuteRollup, labels: np.ndarray, source: str = ''):
+        minutes = np.datetime_as_string((rollup.minute * 60).astype('datetime64[s]'), unit='s', timezone='UTC').tolist()
+        for i, minute in enumerate(minutes):
+            counts = {
+                labels[code]: int(n)
+                for code, n in enumerate(rollup.hist[i][:len(labels)]) if n
+            }
+            yield (
+                session_id, student_id, minute, int(rollup.count[i]),
+                float(rollup.sum[i]), float(rollup.sumsq[i]),
+                float(rollup.min[i]), float(rollup.max[i]), json.dumps(counts), source
+            )
+
+    def _load_session(self, session_id: str, session: Dict):
+        """Read an archived session back as per-student columns"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if session is None:
+                cursor.execute('SELECT metadata FROM classroom_sessions WHERE session_id = %s', (session_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                session = row['metadata']
+
+            quoted = cursor.mogrify('%s', (session_id,)).decode()
+            buffer = io.StringIO()
+            cursor.copy_expert(COPY_OUT_SQL.format(session_id=quoted), buffer)
+            rollup_buffer = io.StringIO()
+            cursor.copy_expert(COPY_ROLLUPS_OUT_SQL.format(session_id=quoted), rollup_buffer)
+            cursor.close()
+        finally:
+            conn.close()
+
+        buffer.seek(0)
+        rows = list(csv.reader(buffer))
+        columns: Dict[str, List[np.ndarray]] = {}
+        if rows:
+            student_ids, timestamps, engagement, confidence, emotions = zip(*rows)
+            student_ids = np.array(student_ids, dtype=object)
+            # Rows arrive sorted by student, so each student is one contiguous run
+            starts = np.flatnonzero(np.r_[True, student_ids[1:] != student_ids[:-1]])
+            ends = np.append(starts[1:], len(rows))
+            timestamps = np.array(timestamps, dtype=np.float64)
+            engagement = np.array(engagement, dtype=np.float32)
+            confidence = np.array(confidence, dtype=np.float32)
+            emotions = np.array(emotions, dtype=object)
+            for lo, hi in zip(starts.tolist(), ends.tolist()):
+                columns[student_ids[lo]] = [
+                    timestamps[lo:hi], engagement[lo:hi], confidence[lo:hi], emotions[lo:hi]
+                ]
+
+        rollup_buffer.seek(0)
+        grouped: Dict[str, List] = {}
+        for row in csv.reader(rollup_buffer):
+            minute, count, total, sumsq, low, high = (
+                int(row[1]), int(row[2]), float(row[3]), float(row[4]), float(row[5]), float(row[6])
+            )
+            counts = json.loads(row[7])
+            rows = grouped.setdefault(row[0], [])
+            if rows and rows[-1][0] == minute:
+                # The same minute archived by several workers
+                last = rows[-1]
+                last[1] += count
+                last[2] += total
+                last[3] += sumsq
+                last[4] = min(last[4], low)
+                last[5] = max(last[5], high)
+                for label, n in counts.items():
+                    last[6][label] = last[6].get(label, 0) + n
+            else:
+                rows.append([minute, count, total, sumsq, low, high, counts])
+
+        rollups = {}
+        for student_id, rows in grouped.items():
+            counts = [row[6] for row in rows]
+            student_labels = sorted({label for c in counts for label in c})
+            hist = np.array(
+                [[c.get(label, 0) for label in student_labels] for c in counts], dtype=np.int64
+            ).reshape(len(rows), len(student_labels))
+            rollup = MinuteRollup(
+                np.array([row[0] for row in rows], dtype=np.int64),
+                np.array([row[1] for row in rows], dtype=np.int64),
+                np.array([row[2] for row in rows], dtype=np.float64),
+                np.array([row[3] for row in rows], dtype=np.float64),
+                np.array([row[4] for row in rows], dtype=np.float32),
+                np.array([row[5] for row in rows], dtype=np.float32),
+                hist
+            )
+            rollups[student_id] = (rollup, student_labels)
+        return session, columns, rollups
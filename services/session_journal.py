@@ -0,0 +1,330 @@
+import fcntl
+import glob
+import json
+import os
+import pickle
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from utils.config import Config
+from utils.logger import logger
+
+
+# Record header: event type + payload length
+HEADER = struct.Struct('<BI')
+
+EVENT_CREATE = 1
+EVENT_JOIN = 2
+EVENT_FRAMES = 3
+EVENT_END = 4
+EVENT_LABEL = 5
+EVENT_ARCHIVE = 6
+
+# One packed row per frame inside an EVENT_FRAMES block (21 bytes)
+FRAME_ROW = struct.Struct('<IdffB')
+FRAME_DTYPE = np.dtype([
+    ('stream', '<u4'),
+    ('timestamp', '<f8'),
+    ('engagement', '<f4'),
+    ('confidence', '<f4'),
+    ('emotion', 'u1')
+])
+
+
+_worker_dir_locks = []  # lock files held for the life of the process
+
+
+def claim_worker_dir(data_dir: str = Config.DATA_DIR) -> str:
+    """
+    Claim a data directory for this worker process alone
+
+    Uvicorn workers all see the same DATA_DIR, but each needs its own
+    journal and spill files. A worker takes the first DATA_DIR/worker-N
+    whose lock file it can lock exclusively and holds the lock until it
+    exits, so a restarted worker takes over (and recovers) the slot a
+    crashed one left behind.
+    """
+    slot = 0
+    while True:
+        path = os.path.join(data_dir, f'worker-{slot}')
+        os.makedirs(path, exist_ok=True)
+        handle = open(os.path.join(path, '.lock'), 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            slot += 1
+            continue
+        _worker_dir_locks.append(handle)
+        return path
+
+
+class SessionJournal:
+    """
+    Write-ahead log of session events for crash recovery
+
+    Events are appended to an in-memory buffer (frames as packed 21-byte rows)
+    and a background thread writes and fsyncs the buffer every
+    JOURNAL_FSYNC_INTERVAL seconds, so the frame path never touches the disk.
+    Consecutive frames are sealed into a single block that replays as one
+    numpy array.
+
+    Every JOURNAL_SNAPSHOT_EVENTS events the fsync thread asks the owner for
+    a compact snapshot (on_snapshot_due); the log then rotates to a new
+    generation file and older generations are deleted once the snapshot is
+    safely on disk. Recovery loads the latest snapshot and replays only the
+    generations written after it.
+
+    Streams of sessions the owner no longer expects frames for are dropped
+    from the stream id table at rotation, so it stays proportional to live
+    sessions. Ids are never reused; a frame for a dropped stream registers
+    it again with a fresh JOIN.
+    """
+
+    def __init__(self, data_dir: str = Config.DATA_DIR,
+                 fsync_interval: float = Config.JOURNAL_FSYNC_INTERVAL,
+                 snapshot_events: int = Config.JOURNAL_SNAPSHOT_EVENTS):
+        self.dir = os.path.join(data_dir, 'journal')
+        os.makedirs(self.dir, exist_ok=True)
+        self.snapshot_path = os.path.join(self.dir, 'snapshot.pkl')
+        self.fsync_interval = fsync_interval
+        self.snapshot_events = snapshot_events
+
+        self.stream_ids: Dict[Tuple[str, str], int] = {}
+        self.next_stream = 0
+        self.events_since_snapshot = 0
+        self.snapshot_in_progress = False
+
+        self._lock = threading.Lock()  # guards the in-memory buffers
+        self._io_lock = threading.Lock()  # serializes file writes and rotation
+        self._buffer = bytearray()
+        self._frames = bytearray()
+        self._rotated = None  # tail of the previous generation, not yet written
+        self._file = None
+        self.generation = 0
+
+        self._stop = threading.Event()
+        self._flusher = None
+        self._on_snapshot_due = None
+
+    # ------------------------------------------------------------------
+    # Recording (called on the frame path)
+    # ------------------------------------------------------------------
+
+    def record_create(self, session: Dict):
+        self._record(EVENT_CREATE, json.dumps(session).encode())
+
+    def record_join(self, session_id: str, student_id: str) -> int:
+        with self._lock:
+            stream = self.stream_ids.get((session_id, student_id))
+            if stream is None:
+                stream = self.stream_ids[(session_id, student_id)] = self.next_stream
+                self.next_stream += 1
+        self._record(EVENT_JOIN, json.dumps([session_id, student_id, stream]).encode())
+        return stream
+
+    def record_label(self, code: int, label: str):
+        self._record(EVENT_LABEL, json.dumps([code, label]).encode())
+
+    def record_end(self, session: Dict):
+        self._record(EVENT_END, json.dumps(session).encode())
+
+    def record_archive(self, session_id: str):
+        self._record(EVENT_ARCHIVE, json.dumps(session_id).encode())
+
+    def record_frame(self, session_id: str, student_id: str, timestamp: float,
+                     engagement: float, confidence: float, emotion: int):
+        stream = self.stream_ids.get((session_id, student_id))
+        if stream is None:
+            stream = self.record_join(session_id, student_id)  # dropped at the last rotation
+        row = FRAME_ROW.pack(stream, timestamp, engagement, confidence, emotion)
+        with self._lock:
+            self._frames += row
+            self.events_since_snapshot += 1
+
+    def snapshot_due(self) -> bool:
+        return not self.snapshot_in_progress and self.events_since_snapshot >= self.snapshot_events
+
+    def _record(self, event: int, payload: bytes):
+        with self._lock:
+            self._seal_frames()
+            self._buffer += HEADER.pack(event, len(payload))
+            self._buffer += payload
+            self.events_since_snapshot += 1
+
+    def _seal_frames(self):
+        """Turn pending frame rows into one EVENT_FRAMES block (lock held)"""
+        if self._frames:
+            self._buffer += HEADER.pack(EVENT_FRAMES, len(self._frames))
+            self._buffer += self._frames
+            self._frames = bytearray()
+
+    # ------------------------------------------------------------------
+    # Durability
+    # ------------------------------------------------------------------
+
+    def start(self, generation: int, on_snapshot_due: Optional[Callable[[], None]] = None):
+        """
+        Open the log generation to append to and start the fsync thread
+
+        Args:
+            on_snapshot_due: Called from the fsync thread once a snapshot is due
+        """
+        self.generation = generation
+        self._on_snapshot_due = on_snapshot_due
+        self._file = open(self._log_path(generation), 'ab')
+        self._flusher = threading.Thread(target=self._flush_loop, name='session-journal', daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        """Write and fsync everything recorded so far"""
+        with self._io_lock:
+            self._write_pending()
+
+    def rotate(self, finished_sessions=()) -> Tuple[int, Dict[Tuple[str, str], int]]:
+        """
+        Start a new generation
+
+        Only swaps buffers: events recorded so far belong to the old
+        generation, which the next flush writes out and closes before
+        opening the new file. Cheap enough to call while writers are paused.
+
+        Args:
+            finished_sessions: Ended or archived sessions whose streams to drop
+
+        Returns:
+            (new generation, stream ids so far); a snapshot taken now precedes it
+        """
+        finished_sessions = set(finished_sessions)
+        with self._lock:
+            self._seal_frames()
+            if finished_sessions:
+                self.stream_ids = {
+                    key: stream for key, stream in self.stream_ids.items() if key[0] not in finished_sessions
+                }
+            self._rotated = self._buffer
+            self._buffer = bytearray()
+            self.generation += 1
+            self.events_since_snapshot = 0
+            self.snapshot_in_progress = True
+            return self.generation, dict(self.stream_ids)
+
+    def write_snapshot(self, state: Dict, generation: int, stream_ids: Dict[Tuple[str, str], int]):
+        """Persist a snapshot atomically and drop the log generations it covers"""
+        start = time.perf_counter()
+        self.flush()  # finish the switch to the new generation first
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'generation': generation, 'stream_ids': stream_ids, 'state': state},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        for path in self._log_paths():
+            if self._generation_of(path) < generation:
+                os.remove(path)
+
+        self.snapshot_in_progress = False
+        logger.info(f"Session snapshot written in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def close(self):
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.flush()
+                if self._on_snapshot_due and self.snapshot_due():
+                    self._on_snapshot_due()
+            except Exception as e:
+                logger.error(f"Journal flush failed: {e}")
+
+    def _write_pending(self):
+        with self._lock:
+            self._seal_frames()
+            rotated, self._rotated = self._rotated, None
+            data = self._buffer
+            self._buffer = bytearray()
+            generation = self.generation
+        if rotated is not None:
+            self._file.write(rotated)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = open(self._log_path(generation), 'ab')
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+
+    def load(self) -> Tuple[Optional[Dict], Iterator[Tuple[int, object]], int]:
+        """
+        Read back the latest snapshot and the events logged after it
+
+        Returns:
+            (snapshot state or None, iterator of (event, payload), next generation)
+            Frame payloads are FRAME_DTYPE arrays; other payloads are decoded JSON.
+        """
+        generation = 0
+        state = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            generation = snapshot['generation']
+            self.stream_ids = snapshot['stream_ids']
+            self.next_stream = max(self.stream_ids.values(), default=-1) + 1
+            state = snapshot['state']
+
+        paths = [p for p in self._log_paths() if self._generation_of(p) >= generation]
+        next_generation = max([generation] + [self._generation_of(p) + 1 for p in paths])
+        return state, self._replay(paths), next_generation
+
+    def _replay(self, paths) -> Iterator[Tuple[int, object]]:
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                event, length = HEADER.unpack_from(data, offset)
+                offset += HEADER.size
+                if offset + length > len(data):
+                    logger.warning(f"Truncated journal record in {os.path.basename(path)} ignored")
+                    break
+                payload = data[offset:offset + length]
+                offset += length
+
+                if event == EVENT_FRAMES:
+                    yield event, np.frombuffer(payload, dtype=FRAME_DTYPE)
+                else:
+                    decoded = json.loads(payload)
+                    if event == EVENT_JOIN:
+                        session_id, student_id, stream = decoded
+                        self.stream_ids[(session_id, student_id)] = stream
+                        self.next_stream = max(self.next_stream, stream + 1)
+                    yield event, decoded
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.dir, f'journal-{generation:08d}.log')
+
+    def _log_paths(self):
+        return sorted(glob.glob(os.path.join(self.dir, 'journal-*.log')))
+
+    @staticmethod
+    def _generation_of(path: str) -> int:
+        return int(os.path.basename(path)[len('journal-'):-len('.log')])
@@ -1,15 +1,67 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+import threading
+import time
+import numpy as np
+from typing import Dict, Optional, Tuple
 import json
+from models.frame_result import FrameResult
+from services.frame_store import FrameStore, FrameView, MinuteRollup, POSITIVE_EMOTIONS
+from services.quantile_sketch import QuantileSketch
+from services.session_aggregates import SessionAggregates
+from services.session_journal import (
+    SessionJournal, EVENT_CREATE, EVENT_JOIN, EVENT_FRAMES, EVENT_END, EVENT_LABEL, EVENT_ARCHIVE
+)
+from utils.config import Config
+from utils.logger import logger
 
 class SessionManager:
     """
     Manages classroom sessions and stores data
+    
+    With a journal attached, every change is written ahead to the session
+    journal so recover() can rebuild sessions, rosters, frames and the
+    cross-session sketches after a crash (losing at most the last fsync interval of frames).
+    
+    With shared state attached, session metadata, rosters and rolling
+    per-student aggregates are mirrored to Redis so any worker can serve any
+    student or dashboard; raw frames stay with the worker that received them
+    (journaled and spilled under that worker's own data_dir). Ending a
+    session tells the other workers (end_local_share()), so each archives
+    its share and frame-level analytics run on the merged archive.
+    
+    Safe to call from many threads: each session hashes to one of
+    SESSION_LOCK_STRIPES locks, so frames for different sessions are logged
+    in parallel and only writers of the same stripe wait for each other.
+    Snapshots take every stripe (in order) to see a consistent state, but
+    only for a copy-on-write capture. Compaction runs every rollup_interval
+    on a maintenance thread (start_compaction()), never on the frame path.
     """
     
-    def __init__(self):
+    def __init__(self, journal: Optional[SessionJournal] = None, shared=None, data_dir: str = Config.DATA_DIR,
+                 spill_threshold: int = Config.SPILL_THRESHOLD_FRAMES,
+                 rollup_interval: float = Config.ROLLUP_INTERVAL_SECONDS):
+        """
+        Args:
+            spill_threshold: Frames per session before it spills to disk
+            rollup_interval: Seconds between compactions (inf keeps every frame raw)
+        """
         self.active_sessions = {}  # session_id -> session_data
-        self.student_data = {}  # student_id -> [frame_data]
+        self.rosters = {}  # session_id -> set of student_ids (O(1) membership)
+        self.frame_store = FrameStore(data_dir, spill_threshold)  # (session_id, student_id) -> frame columns
+        self.aggregates: Dict[str, SessionAggregates] = {}  # session_id -> running analytics
+        self.versions: Dict[str, int] = {}  # session_id -> bumped whenever its analytics change
+        self.sketches: Dict[str, QuantileSketch] = {}  # 'subject:{name}' / 'student:{id}' across sessions
+        self._sketch_lock = threading.Lock()
+        self.journal = journal
+        self.shared = shared  # SharedSessionState or None
+        self.rollup_interval = rollup_interval
+        self.stripes = [threading.Lock() for _ in range(max(1, Config.SESSION_LOCK_STRIPES))]
+        self.maintenance_lock = threading.Lock()  # one snapshot/compaction at a time
+        self._stop = threading.Event()
+        self._compactor = None
+    
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        return self.stripes[hash(session_id) % len(self.stripes)]
     
     def create_session(self, session_id: str, teacher_id: str, subject: str) -> Dict:
         """Create new classroom session"""
@@ -24,36 +76,105 @@ class SessionManager:
             'alerts_generated': 0
         }
         
-        self.active_sessions[session_id] = session
+        with self._lock_for(session_id):
+            if self.journal:
+                self.journal.record_create(session)
+            self._apply_create(session)
+        if self.shared:
+            self.shared.create_session(session)
         return session
     
     def add_student_to_session(self, session_id: str, student_id: str):
         """Register student in session"""
-        if session_id in self.active_sessions:
-            if student_id not in self.active_sessions[session_id]['students']:
-                self.active_sessions[session_id]['students'].append(student_id)
-            
-            if student_id not in self.student_data:
-                self.student_data[student_id] = []
+        roster = self.rosters.get(session_id)
+        if roster is not None and student_id in roster:
+            return  # fast path: already registered, no lock needed
+        
+        with self._lock_for(session_id):
+            roster = self.rosters.get(session_id)
+            if roster is None and self.shared:
+                roster = self._adopt_shared_session(session_id)
+            if roster is None or student_id in roster:
+                return
+            if self.journal:
+                self.journal.record_join(session_id, student_id)
+            self._apply_join(session_id, student_id)
+        if self.shared:
+            self.shared.add_student(session_id, student_id)
     
-    def log_frame_data(self, session_id: str, student_id: str, frame_data: Dict):
-        """Store processed frame data"""
-        if session_id in self.active_sessions:
+    def log_frame_data(self, session_id: str, student_id: str, frame_result: FrameResult):
+        """Append a processed frame to the session's columnar store"""
+        with self._lock_for(session_id):
+            self._log_frame_locked(session_id, student_id, frame_result)
+    
+    def _log_frame_locked(self, session_id: str, student_id: str, frame_result: FrameResult):
+        if session_id in self.active_sessions and not self.active_sessions[session_id].get('archived'):
             self.active_sessions[session_id]['total_frames_processed'] += 1
             
-            if student_id in self.student_data:
-                self.student_data[student_id].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'session_id': session_id,
-                    **frame_data
-                })
+            if student_id in self.rosters[session_id]:
+                code = self.frame_store.emotions.encode(
+                    frame_result.emotion,
+                    on_new=self.journal.record_label if self.journal else None
+                )
+                
+                if self.journal:
+                    self.journal.record_frame(
+                        session_id,
+                        student_id,
+                        frame_result.timestamp,
+                        frame_result.engagement_score,
+                        frame_result.confidence,
+                        code
+                    )
+                
+                self.frame_store.append(
+                    session_id,
+                    student_id,
+                    frame_result.timestamp,
+                    frame_result.engagement_score,
+                    frame_result.confidence,
+                    code
+                )
+                # Same float32 rounding as the stored column, so both agree exactly
+                self.aggregates[session_id].add(
+                    student_id, frame_result.timestamp, float(np.float32(frame_result.engagement_score)), code
+                )
+                self._touch(session_id)
+                
+                if self.shared:
+                    self.shared.record_frame(
+                        session_id,
+                        student_id,
+                        frame_result.timestamp,
+                        frame_result.engagement_score,
+                        frame_result.emotion
+                    )
     
     def end_session(self, session_id: str) -> Dict:
         """End session and return summary"""
+        with self._lock_for(session_id):
+            session, first_end = self._end_session_locked(session_id)
+        if not self.shared or 'error' in session:
+            return session
+        if first_end is not None:
+            self._end_shared_session(session, first_end)
+        return self.get_session_data(session_id)
+    
+    def _end_session_locked(self, session_id: str):
+        """
+        Returns:
+            (session or error, whether this is its first end; None if it was not ended now)
+        """
+        if session_id not in self.active_sessions and self.shared:
+            self._adopt_shared_session(session_id)
         if session_id not in self.active_sessions:
-            return {'error': 'Session not found'}
+            return {'error': 'Session not found'}, None
         
         session = self.active_sessions[session_id]
+        if session.get('archived'):
+            return session, None
+        
+        first_end = session.get('end_time') is None
         session['end_time'] = datetime.now().isoformat()
         
         # Calculate session statistics
@@ -61,30 +182,410 @@ class SessionManager:
         student_count = len(session['students'])
         
         for student_id in session['students']:
-            if student_id in self.student_data:
-                student_frames = self.student_data[student_id]
-                if student_frames:
-                    avg_engagement = sum([f.get('engagement_score', 0) for f in student_frames]) / len(student_frames)
-                    total_engagement += avg_engagement
+            frames = self.frame_store.get(session_id, student_id)
+            rollup = self.frame_store.get_rollup(session_id, student_id)
+            count = len(frames) + rollup.frames
+            if count:
+                total = float(frames.engagement.sum(dtype=np.float64)) + float(rollup.sum.sum())
+                total_engagement += total / count
         
         session['average_class_engagement'] = total_engagement / student_count if student_count > 0 else 0
         session['duration_minutes'] = self._calculate_duration(session['start_time'], session['end_time'])
         
-        return session
+        if first_end and not self.shared:
+            self._merge_session_sketches(session)
+        
+        if self.journal:
+            self.journal.record_end(session)
+        return session, first_end
+    
+    def _end_shared_session(self, session: Dict, first_end: bool):
+        """Fold every worker's students into an ended session (Redis round trips, no lock held)"""
+        session_id = session['session_id']
+        self.shared.flush()
+        student_stats = self.shared.get_student_stats(session_id)
+        if student_stats:
+            average = sum(s['average_engagement'] / 100 for s in student_stats.values()) / len(student_stats)
+            with self._lock_for(session_id):
+                session['average_class_engagement'] = average
+        self.shared.update_session(session)
+        if first_end:
+            # Merged in Redis so frames logged on every worker are included
+            self.shared.merge_session_sketches(session_id, session['subject'])
+        # Sent after the metadata update, in the same pipeline
+        self.shared.publish({'target': 'workers', 'type': 'session_ended', 'session_id': session_id})
+    
+    def end_local_share(self, session_id: str) -> Optional[Dict]:
+        """
+        End this worker's copy of a session ended on another worker
+        
+        Returns:
+            The local session, or None if this worker never held it
+        """
+        with self._lock_for(session_id):
+            if session_id not in self.active_sessions:
+                return None
+            session, _ = self._end_session_locked(session_id)
+            return session
+    
+    def holds_frames(self, session_id: str) -> bool:
+        """Whether this process holds a session's frames (not archived or restored)"""
+        session = self.active_sessions.get(session_id)
+        return session is not None and not session.get('archived')
+    
+    def _merge_session_sketches(self, session: Dict):
+        """Fold an ended session's engagement sketches into its subject's and students'"""
+        aggregates = self.aggregates.get(session['session_id'])
+        if aggregates is None:
+            return
+        with self._sketch_lock:
+            for student_id, sketch in aggregates.sketches().items():
+                for name in (f"student:{student_id}", f"subject:{session['subject']}"):
+                    target = self.sketches.get(name)
+                    if target is None:
+                        self.sketches[name] = sketch.copy()
+                    else:
+                        target.merge(sketch)
     
     def get_session_data(self, session_id: str) -> Optional[Dict]:
         """Retrieve session data"""
-        return self.active_sessions.get(session_id)
+        session = self.active_sessions.get(session_id)
+        if self.shared:
+            shared = self.shared.get_session(session_id)
+            if shared:
+                # Shared metadata, roster and totals win; local-only flags are kept
+                return {**session, **shared} if session else shared
+        return session
+    
+    def get_live_student_stats(self, session_id: str) -> Dict:
+        """Rolling per-student aggregates across all workers (shared state only)"""
+        return self.shared.get_student_stats(session_id) if self.shared else {}
+    
+    def get_student_session_data(self, session_id: str, student_id: str) -> FrameView:
+        """Get a student's raw frames in a session (column slices, no copy)
+        
+        Only the raw tier: frames older than RAW_RETENTION_SECONDS are in
+        get_student_rollup().
+        """
+        # Under the session's lock: reading a spilled stream flushes its tail
+        with self._lock_for(session_id):
+            return self.frame_store.get(session_id, student_id)
+    
+    def read_session_frames(self, session_id: str) -> Tuple[Dict[str, FrameView], Dict[str, MinuteRollup]]:
+        """Every student's raw frames and minute rollups, taken together so no frame is in both or neither"""
+        with self._lock_for(session_id):
+            return self.frame_store.session_views(session_id), dict(self.frame_store.rollups.get(session_id, {}))
+    
+    def read_aggregates(self, session_id: str) -> Optional[Dict]:
+        """Consistent copy of a session's running analytics aggregates"""
+        with self._lock_for(session_id):
+            aggregates = self.aggregates.get(session_id)
+            return aggregates.summary() if aggregates is not None else None
+    
+    def read_sketches(self, session_id: str) -> Dict[str, QuantileSketch]:
+        """Each student's engagement sketch for a session (every worker's frames with shared state)"""
+        if self.shared:
+            return self.shared.get_sketches(session_id)
+        with self._lock_for(session_id):
+            aggregates = self.aggregates.get(session_id)
+            return aggregates.sketches() if aggregates is not None else {}
+    
+    def read_sketch(self, name: str) -> QuantileSketch:
+        """
+        Engagement sketch accumulated over ended sessions
+        
+        Args:
+            name: 'subject:{subject}' or 'student:{student_id}'
+        """
+        if self.shared:
+            return self.shared.get_sketch(name)
+        with self._sketch_lock:
+            sketch = self.sketches.get(name)
+            return sketch.copy() if sketch is not None else QuantileSketch()
+    
+    def session_version(self, session_id: str) -> Optional[int]:
+        """Counter bumped by every change to a session's analytics (None if not held here)"""
+        return self.versions.get(session_id)
+    
+    def get_student_rollup(self, session_id: str, student_id: str) -> MinuteRollup:
+        """Get a student's per-minute aggregates of compacted frames"""
+        return self.frame_store.get_rollup(session_id, student_id)
+    
+    def compact_old_frames(self, now: Optional[float] = None) -> int:
+        """Fold frames older than the raw retention window into minute rollups"""
+        if not self.maintenance_lock.acquire(blocking=False):
+            return 0  # another thread is already on it
+        try:
+            now = now or time.time()
+            cutoff = now - Config.RAW_RETENTION_SECONDS
+            compacted = 0
+            for session_id in list(self.frame_store.sessions):
+                with self._lock_for(session_id):
+                    count = self.frame_store.compact_session(session_id, cutoff)
+                    if count:
+                        self._touch(session_id)  # topic difficulty drops to minute granularity
+                    compacted += count
+        finally:
+            self.maintenance_lock.release()
+        
+        if compacted:
+            logger.debug(f"Compacted {compacted} frames into minute rollups")
+        return compacted
+    
+    def start_compaction(self):
+        """Compact old frames every rollup_interval on a background thread"""
+        if self._compactor or self.rollup_interval == float('inf'):
+            return
+        self._compactor = threading.Thread(target=self._compaction_loop, name='session-compaction', daemon=True)
+        self._compactor.start()
+    
+    def _compaction_loop(self):
+        while not self._stop.wait(self.rollup_interval):
+            try:
+                self.compact_old_frames()
+            except Exception as e:
+                logger.error(f"Frame compaction failed: {e}")
+    
+    def emotion_label(self, code: int) -> str:
+        """Decode a stored emotion code"""
+        return self.frame_store.emotions.decode(code)
+    
+    def recover(self) -> Dict:
+        """
+        Rebuild sessions from the journal's last snapshot plus the log after it
+        
+        Returns:
+            Counts of recovered sessions, frames and replay time
+        """
+        if not self.journal:
+            return {'sessions': 0, 'frames': 0}
+        
+        start = time.perf_counter()
+        state, events, generation = self.journal.load()
+        
+        if state is not None:
+            self.active_sessions = state['sessions']
+            self.rosters = state['rosters']
+            self.frame_store.import_state(state['frames'])
+            self.sketches = state.get('sketches', {})  # older snapshots have none
+        
+        streams = {}  # stream id -> (session_id, student_id)
+        replayed = 0
+        for event, payload in events:
+            if event == EVENT_FRAMES:
+                if len(streams) != len(self.journal.stream_ids):
+                    streams = {stream: key for key, stream in self.journal.stream_ids.items()}
+                replayed += self._apply_frames(payload, streams)
+            elif event == EVENT_CREATE:
+                self._apply_create(payload)
+            elif event == EVENT_JOIN:
+                self._apply_join(payload[0], payload[1])
+            elif event == EVENT_LABEL:
+                self.frame_store.emotions.encode(payload[1])
+            elif event == EVENT_END:
+                session = self.active_sessions.get(payload['session_id'])
+                if session is not None:
+                    first_end = session.get('end_time') is None
+                    session.update(payload)
+                    if first_end and not self.shared:
+                        # Its frames so far are all replayed; archival may drop them next
+                        self._rebuild_aggregates(session['session_id'])
+                        self._merge_session_sketches(session)
+            elif event == EVENT_ARCHIVE:
+                self._apply_archive(payload)
+        
+        for session_id, session in self.active_sessions.items():
+            if not session.get('archived'):
+                self._rebuild_aggregates(session_id)
+        
+        self.journal.start(generation, on_snapshot_due=self.snapshot)
+        stats = {
+            'sessions': len(self.active_sessions),
+            'frames': sum(self.frame_store.session_sizes.values()),
+            'replayed_frames': replayed,
+            'seconds': round(time.perf_counter() - start, 3)
+        }
+        if stats['sessions']:
+            logger.success(
+                f"Recovered {stats['sessions']} sessions ({stats['frames']} frames, "
+                f"{replayed} replayed) in {stats['seconds']}s"
+            )
+        return stats
+    
+    def snapshot(self):
+        """
+        Start a new journal generation and persist current state in the background
+        
+        Runs on the journal's fsync thread once a snapshot is due. Every stripe
+        is held only while the log switches generation and state is captured
+        copy-on-write (session dicts, rosters, references to frame columns,
+        cross-session sketches);
+        packing frames, fsyncing spilled files and writing the snapshot run
+        on a separate thread without any lock.
+        """
+        if not self.maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            for lock in self.stripes:
+                lock.acquire()
+            try:
+                generation, stream_ids = self.journal.rotate(finished_sessions=[
+                    session_id for session_id, session in self.active_sessions.items()
+                    if session.get('end_time') or session.get('archived')
+                ])
+                state = {
+                    'sessions': {
+                        session_id: dict(session, students=list(session['students']))
+                        for session_id, session in self.active_sessions.items()
+                    },
+                    'rosters': {session_id: set(roster) for session_id, roster in self.rosters.items()},
+                    'frames': self.frame_store.export_state(),
+                    'sketches': self._copy_sketches()
+                }
+            finally:
+                for lock in self.stripes:
+                    lock.release()
+        finally:
+            self.maintenance_lock.release()
+        
+        threading.Thread(
+            target=self._write_snapshot,
+            args=(state, generation, stream_ids),
+            name='session-snapshot',
+            daemon=True
+        ).start()
+    
+    def _copy_sketches(self) -> Dict[str, QuantileSketch]:
+        with self._sketch_lock:
+            return {name: sketch.copy() for name, sketch in self.sketches.items()}
+    
+    def _write_snapshot(self, state: Dict, generation: int, stream_ids: Dict):
+        try:
+            state['frames'] = self.frame_store.pack_state(state['frames'])
+            self.journal.write_snapshot(state, generation, stream_ids)
+        except Exception as e:
+            logger.error(f"Session snapshot failed: {e}")
+        finally:
+            self.journal.snapshot_in_progress = False
+    
+    def close(self):
+        """Stop compaction and flush the journal on shutdown"""
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+        if self.journal:
+            self.journal.close()
+    
+    def release_frames(self, session_id: str):
+        """Free an archived session's frames (metadata stays for lookups)"""
+        with self._lock_for(session_id):
+            if self.journal:
+                self.journal.record_archive(session_id)
+            self._apply_archive(session_id)
+    
+    def restore_archived(self, session: Dict, columns: Dict, rollups: Optional[Dict] = None):
+        """
+        Load an archived session's frames back from the database
+        
+        Args:
+            session: Session metadata as archived
+            columns: student_id -> [timestamps, engagement, confidence, emotion labels]
+            rollups: student_id -> MinuteRollup with histogram columns as labels
+        """
+        session_id = session['session_id']
+        with self._lock_for(session_id):
+            self._restore_archived_locked(session, columns, rollups or {})
+    
+    def _restore_archived_locked(self, session: Dict, columns: Dict, rollups: Dict):
+        session_id = session['session_id']
+        session = self.active_sessions.setdefault(session_id, session)
+        session['archived'] = True
+        self.rosters[session_id] = set(session['students'])
+        
+        self.frame_store.drop_session(session_id)
+        for student_id, (timestamps, engagement, confidence, labels) in columns.items():
+            unique_labels, inverse = np.unique(labels.astype(str), return_inverse=True)
+            lookup = np.array([self.frame_store.emotions.encode(l) for l in unique_labels], dtype=np.uint8)
+            self.frame_store.extend(session_id, student_id, timestamps, engagement, confidence, lookup[inverse])
+        
+        for student_id, (rollup, labels) in rollups.items():
+            # Re-key histogram columns from archived labels to this store's codes
+            codes = [self.frame_store.emotions.encode(label) for label in labels]
+            width = max([MinuteRollup.HIST_WIDTH] + [code + 1 for code in codes])
+            hist = np.zeros((len(rollup), width), dtype=np.int64)
+            hist[:, codes] = rollup.hist
+            rollup.hist = hist
+            self.frame_store.set_rollup(session_id, student_id, rollup)
+        
+        self._rebuild_aggregates(session_id)
+    
+    def _adopt_shared_session(self, session_id: str):
+        """Start tracking locally a session created on another worker"""
+        shared = self.shared.get_session(session_id)
+        if shared is None:
+            return None
+        
+        session = dict(shared, students=[], total_frames_processed=0)
+        if self.journal:
+            self.journal.record_create(session)
+        self._apply_create(session)
+        self.shared.add_holder(session_id)
+        return self.rosters[session_id]
+    
+    def _apply_archive(self, session_id: str):
+        if session_id in self.active_sessions:
+            self.active_sessions[session_id]['archived'] = True
+        self.frame_store.drop_session(session_id)
+        self.aggregates.pop(session_id, None)
+        self._touch(session_id)
+    
+    def _apply_create(self, session: Dict):
+        self.active_sessions[session['session_id']] = session
+        self.rosters[session['session_id']] = set()
+        self.aggregates[session['session_id']] = self._new_aggregates()
+        self._touch(session['session_id'])
+    
+    def _new_aggregates(self) -> SessionAggregates:
+        return SessionAggregates(self.frame_store.emotions.codes_for(POSITIVE_EMOTIONS))
+    
+    def _rebuild_aggregates(self, session_id: str):
+        """Recompute a session's aggregates from its stored frames and rollups"""
+        aggregates = self._new_aggregates()
+        for student_id, frames in self.frame_store.session_views(session_id).items():
+            aggregates.add_many(student_id, frames.timestamps, frames.engagement, frames.emotion)
+        for student_id, rollup in self.frame_store.rollups.get(session_id, {}).items():
+            aggregates.add_rollup(student_id, rollup)
+        self.aggregates[session_id] = aggregates
+        self._touch(session_id)
+    
+    def _touch(self, session_id: str):
+        # Never reset, so a cached result can't match a recreated session by accident
+        self.versions[session_id] = self.versions.get(session_id, 0) + 1
+    
+    def _apply_join(self, session_id: str, student_id: str):
+        if student_id in self.rosters[session_id]:
+            return  # a stream registered again after its session ended
+        self.rosters[session_id].add(student_id)
+        self.active_sessions[session_id]['students'].append(student_id)
+        self._touch(session_id)
     
-    def get_student_session_data(self, session_id: str, student_id: str) -> List[Dict]:
-        """Get all frames for a student in a session"""
-        if student_id not in self.student_data:
-            return []
+    def _apply_frames(self, rows: np.ndarray, streams: Dict) -> int:
+        """Replay a block of journaled frames, one bulk append per stream"""
+        order = np.argsort(rows['stream'], kind='stable')
+        rows = rows[order]
+        ids, starts = np.unique(rows['stream'], return_index=True)
+        ends = np.append(starts[1:], len(rows))
         
-        return [
-            frame for frame in self.student_data[student_id]
-            if frame.get('session_id') == session_id
-        ]
+        for stream, lo, hi in zip(ids.tolist(), starts.tolist(), ends.tolist()):
+            session_id, student_id = streams[stream]
+            chunk = rows[lo:hi]
+            self.frame_store.extend(
+                session_id, student_id,
+                chunk['timestamp'], chunk['engagement'], chunk['confidence'], chunk['emotion']
+            )
+            if session_id in self.active_sessions:
+                self.active_sessions[session_id]['total_frames_processed'] += hi - lo
+        return len(rows)
     
     def _calculate_duration(self, start: str, end: str) -> float:
         """Calculate duration in minutes"""
@@ -0,0 +1,243 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from database.db import get_db_connection
+from utils.logger import logger
+
+
+DIMENSIONS = ('teacher', 'subject')
+TREND_GRAINS = ('day', 'week', 'month')
+
+UPSERT_DAILY_SQL = '''
+    INSERT INTO engagement_daily (dimension, key, day, sessions, frames, engagement_sum)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (dimension, key, day) DO UPDATE SET
+        sessions = engagement_daily.sessions + EXCLUDED.sessions,
+        frames = engagement_daily.frames + EXCLUDED.frames,
+        engagement_sum = engagement_daily.engagement_sum + EXCLUDED.engagement_sum
+'''
+
+UPSERT_HOUR_OF_WEEK_SQL = '''
+    INSERT INTO engagement_hour_of_week (dimension, key, hour_of_week, sessions, frames, engagement_sum)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (dimension, key, hour_of_week) DO UPDATE SET
+        sessions = engagement_hour_of_week.sessions + EXCLUDED.sessions,
+        frames = engagement_hour_of_week.frames + EXCLUDED.frames,
+        engagement_sum = engagement_hour_of_week.engagement_sum + EXCLUDED.engagement_sum
+'''
+
+TREND_SQL = '''
+    SELECT date_trunc(%s, day)::date AS period,
+           SUM(sessions)::integer AS sessions,
+           SUM(frames)::bigint AS frames,
+           SUM(engagement_sum) / NULLIF(SUM(frames), 0) AS average_engagement
+    FROM engagement_daily
+    WHERE dimension = %s AND key = %s AND day BETWEEN %s AND %s
+    GROUP BY period
+    ORDER BY period
+'''
+
+HOUR_OF_WEEK_SQL = '''
+    SELECT hour_of_week, sessions, frames,
+           engagement_sum / NULLIF(frames, 0) AS average_engagement
+    FROM engagement_hour_of_week
+    WHERE dimension = %s AND key = %s
+    ORDER BY hour_of_week
+'''
+
+
+class SessionRollups:
+    """
+    Cross-session engagement rollups per teacher and per subject
+
+    When a session ends, its per-minute class totals (already kept in the
+    session aggregates) are bucketed by local day and by hour of the week
+    (0 = Monday 00:00) and added into engagement_daily and
+    engagement_hour_of_week. Rows are keyed (dimension, key, bucket), so
+    semester trends and weekly patterns are primary-key range scans over a
+    handful of rows per day instead of scans over frames.
+
+    rollup_sessions records which sessions have been counted, in the same
+    transaction, so ending or scheduling a session twice does not count it
+    twice. With shared state a session is rolled up once every worker's
+    frames are merged in the archive (SessionArchiver.merge()).
+    """
+
+    def __init__(self, session_manager):
+        self.session_manager = session_manager
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rollups')
+        self.tasks = set()
+        self.rolled_up = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def schedule(self, session_id: str):
+        """Add an ended session to the rollup tables in the background (call from the event loop)"""
+        # Bucket now: archival frees the session's aggregates soon after it ends
+        buckets = self.session_buckets(session_id)
+        if buckets is None:
+            return
+        task = asyncio.create_task(self._write(buckets))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def session_buckets(self, session_id: str) -> Optional[Dict]:
+        """
+        Per-day and per-hour-of-week frame counts and engagement sums of a session
+
+        Returns:
+            {session_id, teacher_id, subject, start_day, start_hour_of_week,
+             days: {date: [frames, sum]}, hours: {hour_of_week: [frames, sum]}}
+        """
+        session = self.session_manager.get_session_data(session_id)
+        aggregates = self.session_manager.read_aggregates(session_id) if session else None
+        if aggregates is None:
+            return None
+
+        days: Dict[date, List] = {}
+        hours: Dict[int, List] = {}
+        minutes, counts, sums = aggregates['minutes']
+        for minute, count, total in zip(minutes.tolist(), counts.tolist(), sums.tolist()):
+            moment = datetime.fromtimestamp(minute * 60)
+            for buckets, bucket in ((days, moment.date()), (hours, moment.weekday() * 24 + moment.hour)):
+                acc = buckets.get(bucket)
+                if acc is None:
+                    buckets[bucket] = [count, total]
+                else:
+                    acc[0] += count
+                    acc[1] += total
+
+        # The session counts once, toward the day and hour it started in
+        start = datetime.fromisoformat(session['start_time'])
+        days.setdefault(start.date(), [0, 0.0])
+        hours.setdefault(start.weekday() * 24 + start.hour, [0, 0.0])
+        return {
+            'session_id': session_id,
+            'teacher_id': session.get('teacher_id'),
+            'subject': session.get('subject'),
+            'start_day': start.date(),
+            'start_hour_of_week': start.weekday() * 24 + start.hour,
+            'days': days,
+            'hours': hours
+        }
+
+    async def _write(self, buckets: Dict):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._upsert, buckets)
+        except Exception as e:
+            logger.error(f"❌ Rollup of session {buckets['session_id']} failed: {e}")
+
+    async def trend(self, dimension: str, key: str, start: date, end: date, grain: str = 'day') -> List[Dict]:
+        """
+        Engagement per day, week or month for a teacher or subject
+
+        Returns:
+            [{period, sessions, frames, average_engagement}] oldest first
+        """
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, self._query, TREND_SQL, (grain, dimension, key, start, end))
+        return [
+            {
+                'period': row['period'].isoformat(),
+                'sessions': row['sessions'],
+                'frames': row['frames'],
+                'average_engagement': self._percent(row['average_engagement'])
+            }
+            for row in rows
+        ]
+
+    async def hour_of_week(self, dimension: str, key: str) -> List[Dict]:
+        """
+        Engagement by hour of the week (0 = Monday 00:00) for a teacher or subject
+
+        Returns:
+            [{hour_of_week, weekday, hour, sessions, frames, average_engagement}]
+        """
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, self._query, HOUR_OF_WEEK_SQL, (dimension, key))
+        return [
+            {
+                'hour_of_week': row['hour_of_week'],
+                'weekday': row['hour_of_week'] // 24,
+                'hour': row['hour_of_week'] % 24,
+                'sessions': row['sessions'],
+                'frames': row['frames'],
+                'average_engagement': self._percent(row['average_engagement'])
+            }
+            for row in rows
+        ]
+
+    def get_stats(self) -> Dict:
+        return {
+            'sessions_rolled_up': self.rolled_up,
+            'sessions_skipped': self.skipped,
+            'avg_write_ms': round(self.seconds / self.rolled_up * 1000, 2) if self.rolled_up else 0.0
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Worker thread
+    # ------------------------------------------------------------------
+
+    def _upsert(self, buckets: Dict):
+        start = time.perf_counter()
+        keys = [
+            (dimension, key)
+            for dimension, key in (('teacher', buckets['teacher_id']), ('subject', buckets['subject']))
+            if key
+        ]
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO rollup_sessions (session_id) VALUES (%s) ON CONFLICT DO NOTHING',
+                (buckets['session_id'],)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                self.skipped += 1
+                return
+
+            daily = []
+            hourly = []
+            for dimension, key in keys:
+                for day, (frames, total) in buckets['days'].items():
+                    daily.append((dimension, key, day, int(day == buckets['start_day']), frames, total))
+                for hour, (frames, total) in buckets['hours'].items():
+                    hourly.append((dimension, key, hour, int(hour == buckets['start_hour_of_week']), frames, total))
+            cursor.executemany(UPSERT_DAILY_SQL, daily)
+            cursor.executemany(UPSERT_HOUR_OF_WEEK_SQL, hourly)
+
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        self.rolled_up += 1
+        self.seconds += time.perf_counter() - start
+
+    @staticmethod
+    def _query(sql: str, params) -> List[Dict]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _percent(value) -> Optional[float]:
+        return round(float(value) * 100, 1) if value is not None else None
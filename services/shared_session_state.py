@@ -0,0 +1,460 @@
+import asyncio
+import json
+import math
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database.redis_cache import RedisCache
+from services.quantile_sketch import QuantileSketch, sketch_bin
+from utils.config import Config
+from utils.logger import logger
+
+
+class SharedSessionState:
+    """
+    Session state shared by every uvicorn worker through Redis
+
+    Keys (refreshed to SHARED_STATE_TTL on every write):
+        session:{id}          JSON session metadata
+        session:{id}:roster   sorted set of student_ids scored by join time
+        session:{id}:stats    hash of rolling aggregates: 'frames' plus
+                              '{student_id}|count|sum|sumsq|emotion|ts'
+        session:{id}:sketch   hash of engagement sketch bins '{student_id}|{bin}'
+        session:{id}:holders  set of workers holding frames of the session
+                              that have not archived them yet
+        sketch:{name}         hash of bins accumulated over ended sessions
+                              ('subject:{subject}', 'student:{id}'; no TTL)
+
+    Session and roster writes, frame updates and dashboard events are
+    buffered locally and written every SHARED_STATE_FLUSH_MS in one pipeline
+    on the flush thread, so the event loop never waits for Redis on writes.
+    If a flush fails, its buffers are put back and go out with the next one.
+
+    get_session() answers from a local copy of each session this worker
+    uses, refreshed after every flush; only the first read of a session the
+    worker has not seen yet waits for Redis. A session Redis does not know
+    is remembered as missing for MISS_SECONDS, so requests or frames for an
+    unknown id cost at most one round trip per interval. The other reads
+    (student stats, sketches) fetch in one pipelined round trip and are
+    called off the event loop. Dashboard events are fanned out over pub/sub so a
+    teacher connected to any worker sees every student.
+
+    Raw frames stay with the worker that received them. When a session
+    ends, every holder archives its share (see SessionArchiver), and the
+    session's frames are complete once its holders set is empty.
+    """
+
+    CHANNEL = 'classroom:events'
+    WATCH_SECONDS = 300  # sessions not used for this long stop being refreshed
+    MAX_PENDING_EVENTS = 10000  # dashboard events kept while Redis is unreachable
+    MISS_SECONDS = 2.0  # unknown sessions are looked up again after this long
+
+    def __init__(self, cache: RedisCache,
+                 flush_interval: float = Config.SHARED_STATE_FLUSH_MS / 1000,
+                 ttl: int = Config.SHARED_STATE_TTL,
+                 holder: Optional[str] = None):
+        """
+        Args:
+            holder: Name of this worker's frames (its data slot, so a restarted
+                    worker archives what its predecessor held)
+        """
+        self.cache = cache
+        self.client = cache.client
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.worker_id = uuid.uuid4().hex[:8]
+        self.holder = holder or self.worker_id
+
+        self.pending: Dict[str, Dict[str, List]] = {}  # session -> student -> [count, sum, sumsq, emotion, ts]
+        self.pending_bins: Dict[str, Dict[str, int]] = {}  # session -> '{student}|{bin}' -> frames
+        self.pending_events: List[str] = []
+        self.pending_writes: List[Tuple] = []  # (pipeline method, args, kwargs) in order
+        self._buffer_lock = threading.Lock()  # frames may be logged from worker threads
+
+        self.sessions: Dict[str, Dict] = {}  # session_id -> last known get_session() result
+        self.used_at: Dict[str, float] = {}  # session_id -> last local use (refreshed while recent)
+        self.missing: Dict[str, float] = {}  # session_id -> when Redis last did not have it
+
+        self.flushes = 0
+        self.flushed_frames = 0
+        self.flush_seconds = 0.0
+
+        self._flusher = None
+        self._pubsub = None
+        self._listener = None
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def create_session(self, session: Dict):
+        session_id = session['session_id']
+        self._queue_writes(
+            ('set', (self._meta_key(session_id), self._encode_meta(session)), {'ex': self.ttl}),
+            ('delete', (self._roster_key(session_id), self._stats_key(session_id),
+                        self._sketch_key(session_id), self._holders_key(session_id)), {})
+        )
+        self.add_holder(session_id)
+        self._cache(session_id, dict(json.loads(self._encode_meta(session)), students=[], total_frames_processed=0))
+
+    def update_session(self, session: Dict):
+        session_id = session['session_id']
+        meta = self._encode_meta(session)
+        self._queue_writes(('set', (self._meta_key(session_id), meta), {'ex': self.ttl}))
+        cached = self.sessions.get(session_id)
+        if cached is not None:
+            self._cache(session_id, {**cached, **json.loads(meta)})
+
+    def add_student(self, session_id: str, student_id: str):
+        self._queue_writes(
+            ('zadd', (self._roster_key(session_id), {student_id: time.time()}), {'nx': True}),
+            ('expire', (self._roster_key(session_id), self.ttl), {})
+        )
+        cached = self.sessions.get(session_id)
+        if cached is not None and student_id not in cached['students']:
+            self._cache(session_id, dict(cached, students=cached['students'] + [student_id]))
+
+    def add_holder(self, session_id: str):
+        """Register this worker as holding frames of a session"""
+        self._queue_writes(
+            ('sadd', (self._holders_key(session_id), self.holder), {}),
+            ('expire', (self._holders_key(session_id), self.ttl), {})
+        )
+
+    def release_holder(self, session_id: str):
+        """This worker's frames of a session are archived"""
+        self._queue_writes(('srem', (self._holders_key(session_id), self.holder), {}))
+
+    def record_frame(self, session_id: str, student_id: str, timestamp: float,
+                     engagement: float, emotion: str):
+        """Fold one frame into the local buffer (written on the next flush)"""
+        with self._buffer_lock:
+            students = self.pending.get(session_id)
+            if students is None:
+                students = self.pending[session_id] = {}
+                self.used_at[session_id] = time.time()
+            acc = students.get(student_id)
+            if acc is None:
+                students[student_id] = [1, engagement, engagement * engagement, emotion, timestamp]
+            else:
+                acc[0] += 1
+                acc[1] += engagement
+                acc[2] += engagement * engagement
+                acc[3] = emotion
+                acc[4] = timestamp
+
+            bins = self.pending_bins.get(session_id)
+            if bins is None:
+                bins = self.pending_bins[session_id] = {}
+            field = f'{student_id}|{sketch_bin(engagement)}'
+            bins[field] = bins.get(field, 0) + 1
+
+    def publish(self, event: Dict):
+        """Queue an event for the other workers (sent on the next flush)"""
+        text = json.dumps({**event, 'origin': self.worker_id})
+        with self._buffer_lock:
+            self.pending_events.append(text)
+
+    def flush(self):
+        """Write buffered writes, aggregates and events in one pipeline (blocking)"""
+        buffers = self._take_buffers()
+        try:
+            self._write(*buffers)
+        except Exception:
+            self._restore_buffers(*buffers)
+            raise
+
+    def _queue_writes(self, *writes: Tuple):
+        with self._buffer_lock:
+            self.pending_writes.extend(writes)
+
+    def _take_buffers(self):
+        with self._buffer_lock:
+            writes, self.pending_writes = self.pending_writes, []
+            pending, self.pending = self.pending, {}
+            bins, self.pending_bins = self.pending_bins, {}
+            events, self.pending_events = self.pending_events, []
+        return writes, pending, bins, events
+
+    def _restore_buffers(self, writes: List[Tuple], pending: Dict, bins: Dict, events: List[str]):
+        """Put back what a failed flush took, ahead of anything buffered since"""
+        with self._buffer_lock:
+            self.pending_writes[:0] = writes
+            for session_id, students in pending.items():
+                current = self.pending.setdefault(session_id, {})
+                for student_id, acc in students.items():
+                    newer = current.get(student_id)
+                    if newer is None:
+                        current[student_id] = acc
+                    else:
+                        newer[0] += acc[0]
+                        newer[1] += acc[1]
+                        newer[2] += acc[2]  # the newer emotion and timestamp stay
+            for session_id, counts in bins.items():
+                current = self.pending_bins.setdefault(session_id, {})
+                for field, count in counts.items():
+                    current[field] = current.get(field, 0) + count
+            self.pending_events[:0] = events
+            del self.pending_events[:-self.MAX_PENDING_EVENTS]
+
+    def _write(self, writes: List[Tuple], pending: Dict, bins: Dict, events: List[str]):
+        if not writes and not pending and not events:
+            return
+
+        start = time.perf_counter()
+        pipe = self.cache.pipeline()
+        for method, args, kwargs in writes:
+            getattr(pipe, method)(*args, **kwargs)
+        frames = 0
+        for session_id, students in pending.items():
+            key = self._stats_key(session_id)
+            session_frames = 0
+            for student_id, (count, total, total_sq, emotion, ts) in students.items():
+                pipe.hincrby(key, f'{student_id}|count', count)
+                pipe.hincrbyfloat(key, f'{student_id}|sum', total)
+                pipe.hincrbyfloat(key, f'{student_id}|sumsq', total_sq)
+                pipe.hset(key, mapping={f'{student_id}|emotion': emotion, f'{student_id}|ts': ts})
+                session_frames += count
+            pipe.hincrby(key, 'frames', session_frames)
+            pipe.expire(key, self.ttl)
+            frames += session_frames
+
+        for session_id, counts in bins.items():
+            key = self._sketch_key(session_id)
+            for field, count in counts.items():
+                pipe.hincrby(key, field, count)
+            pipe.expire(key, self.ttl)
+
+        for event in events:
+            pipe.publish(self.CHANNEL, event)
+        pipe.execute()
+
+        self.flushes += 1
+        self.flushed_frames += frames
+        self.flush_seconds += time.perf_counter() - start
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        """
+        Session metadata with the roster and frame total across all workers
+
+        Served from the local copy (at most one flush interval old); a
+        session this worker has not used yet is fetched once.
+        """
+        now = time.time()
+        session = self.sessions.get(session_id)
+        if session is None:
+            if now - self.missing.get(session_id, 0.0) < self.MISS_SECONDS:
+                return None
+            session = self._fetch_sessions([session_id]).get(session_id)
+            if session is None:
+                self.missing[session_id] = now
+                return None
+            self._cache(session_id, session)
+        else:
+            self.used_at[session_id] = now
+        return dict(session, students=list(session['students']))
+
+    def refresh_session(self, session_id: str) -> Optional[Dict]:
+        """Re-read a session from Redis now (blocking), replacing the local copy"""
+        session = self._fetch_sessions([session_id]).get(session_id)
+        if session is not None:
+            self._cache(session_id, session)
+        return session
+
+    def pending_holders(self, session_id: str) -> int:
+        """Workers that still hold unarchived frames of a session (blocking)"""
+        return self.client.scard(self._holders_key(session_id))
+
+    def _fetch_sessions(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """Read sessions from Redis in one pipelined round trip (missing ones are left out)"""
+        pipe = self.cache.pipeline()
+        for session_id in session_ids:
+            pipe.get(self._meta_key(session_id))
+            pipe.zrange(self._roster_key(session_id), 0, -1)
+            pipe.hget(self._stats_key(session_id), 'frames')
+        results = pipe.execute()
+
+        sessions = {}
+        for i, session_id in enumerate(session_ids):
+            meta, roster, frames = results[3 * i:3 * i + 3]
+            if meta is not None:
+                sessions[session_id] = dict(json.loads(meta), students=roster, total_frames_processed=int(frames or 0))
+        return sessions
+
+    def _refresh_sessions(self):
+        """Re-read every session used recently (flush thread); forget the rest"""
+        now = time.time()
+        for session_id, missed in list(self.missing.items()):
+            if now - missed >= self.MISS_SECONDS:
+                self.missing.pop(session_id, None)
+        cutoff = now - self.WATCH_SECONDS
+        for session_id, used in list(self.used_at.items()):
+            if used < cutoff:
+                self.used_at.pop(session_id, None)
+                self.sessions.pop(session_id, None)
+        session_ids = list(self.used_at)
+        if not session_ids:
+            return
+        before = dict(self.sessions)
+        fetched = self._fetch_sessions(session_ids)
+        for session_id in session_ids:
+            # Skip sessions changed locally meanwhile (or not written yet): their
+            # writes go out with the next flush
+            if session_id in fetched and self.sessions.get(session_id) is before.get(session_id):
+                self.sessions[session_id] = fetched[session_id]
+
+    def _cache(self, session_id: str, session: Dict):
+        self.sessions[session_id] = session
+        self.used_at[session_id] = time.time()
+        self.missing.pop(session_id, None)
+
+    def get_student_stats(self, session_id: str) -> Dict:
+        """
+        Rolling per-student aggregates across all workers
+
+        Returns:
+            {student_id: {frames, average_engagement, engagement_std, last_emotion, last_seen}}
+        """
+        raw = self.client.hgetall(self._stats_key(session_id))
+        fields: Dict[str, Dict[str, str]] = {}
+        for name, value in raw.items():
+            student_id, sep, field = name.rpartition('|')
+            if sep:
+                fields.setdefault(student_id, {})[field] = value
+
+        stats = {}
+        for student_id, f in fields.items():
+            count = int(f.get('count', 0))
+            if not count:
+                continue
+            mean = float(f['sum']) / count
+            variance = max(float(f['sumsq']) / count - mean * mean, 0.0)
+            stats[student_id] = {
+                'frames': count,
+                'average_engagement': round(mean * 100, 1),
+                'engagement_std': round(math.sqrt(variance) * 100, 1),
+                'last_emotion': f.get('emotion'),
+                'last_seen': float(f.get('ts', 0))
+            }
+        return stats
+
+    def get_sketches(self, session_id: str) -> Dict[str, QuantileSketch]:
+        """Each student's engagement sketch for a session across all workers"""
+        return self._decode_sketches(self.client.hgetall(self._sketch_key(session_id)))
+
+    def get_sketch(self, name: str) -> QuantileSketch:
+        """Sketch accumulated over ended sessions ('subject:{subject}' or 'student:{id}')"""
+        return QuantileSketch.from_bins(self.client.hgetall(f'sketch:{name}'))
+
+    def merge_session_sketches(self, session_id: str, subject: str):
+        """Add an ended session's sketches into its subject's and students' (one pipeline)"""
+        sketches = self.get_sketches(session_id)
+        if not sketches:
+            return
+        subject_sketch = QuantileSketch()
+        pipe = self.cache.pipeline()
+        for student_id, sketch in sketches.items():
+            subject_sketch.merge(sketch)
+            for index, count in sketch.to_bins().items():
+                pipe.hincrby(f'sketch:student:{student_id}', index, count)
+        for index, count in subject_sketch.to_bins().items():
+            pipe.hincrby(f'sketch:subject:{subject}', index, count)
+        pipe.execute()
+
+    @staticmethod
+    def _decode_sketches(raw: Dict[str, str]) -> Dict[str, QuantileSketch]:
+        bins: Dict[str, Dict[str, str]] = {}
+        for name, count in raw.items():
+            student_id, sep, index = name.rpartition('|')
+            if sep:
+                bins.setdefault(student_id, {})[index] = count
+        return {student_id: QuantileSketch.from_bins(b) for student_id, b in bins.items()}
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, on_event: Callable[[Dict], Awaitable]):
+        """
+        Start the flush loop and the pub/sub listener (call inside the event loop)
+
+        Args:
+            on_event: Coroutine run on the loop for each event from another worker
+        """
+        loop = asyncio.get_running_loop()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+        def dispatch(message):
+            event = json.loads(message['data'])
+            if event.pop('origin', None) != self.worker_id:
+                asyncio.run_coroutine_threadsafe(on_event(event), loop)
+
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: dispatch})
+        self._listener = self._pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+        logger.info(f"Shared session state enabled (worker {self.worker_id})")
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+        if self._listener:
+            self._listener.stop()
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self._flush_and_refresh)
+
+    def _flush_and_refresh(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Shared state flush failed (retrying on the next one): {e}")
+            return
+        try:
+            self._refresh_sessions()
+        except Exception as e:
+            logger.error(f"Shared session refresh failed: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'worker_id': self.worker_id,
+            'flushes': self.flushes,
+            'flushed_frames': self.flushed_frames,
+            'avg_flush_ms': round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0
+        }
+
+    @staticmethod
+    def _encode_meta(session: Dict) -> str:
+        # Roster and frame totals live in their own keys
+        return json.dumps({
+            key: value for key, value in session.items()
+            if key not in ('students', 'total_frames_processed', 'archived')
+        })
+
+    @staticmethod
+    def _meta_key(session_id: str) -> str:
+        return f'session:{session_id}'
+
+    @staticmethod
+    def _roster_key(session_id: str) -> str:
+        return f'session:{session_id}:roster'
+
+    @staticmethod
+    def _stats_key(session_id: str) -> str:
+        return f'session:{session_id}:stats'
+
+    @staticmethod
+    def _sketch_key(session_id: str) -> str:
+        return f'session:{session_id}:sketch'
+
+    @staticmethod
+    def _holders_key(session_id: str) -> str:
+        return f'session:{session_id}:holders'
@@ -51,6 +51,12 @@ try:
 except Exception as e:
     tests.append(("ReportGenerator", False, str(e)))
 
+try:
+    from services.frame_pipeline import FramePipeline
+    tests.append(("FramePipeline", True, None))
+except Exception as e:
+    tests.append(("FramePipeline", False, str(e)))
+
 try:
     from services.gemini_advisor import GeminiAdvisor
     tests.append(("GeminiAdvisor", True, None))
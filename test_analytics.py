@@ -0,0 +1,149 @@
+"""
+Test session analytics against the original dict-per-frame engine
+
+Runs with pytest or directly: python test_analytics.py
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from models.frame_result import FrameResult
+from models.lstm_predictor import AnalyticsEngine as LegacyAnalyticsEngine
+from services.analytics_engine import AnalyticsEngine
+from services.session_manager import SessionManager
+
+SESSION_ID = 'analytics'
+STUDENTS = ['student-0', 'student-1', 'student-2']
+EMOTIONS = ['neutral', 'happy', 'sad', 'surprise']
+START = datetime(2026, 1, 5, 9, 0).timestamp()
+
+
+class LegacySessionView:
+    """The dict-per-frame session manager interface the legacy engine expects"""
+
+    def __init__(self, manager: SessionManager):
+        self.session = manager.get_session_data(SESSION_ID)
+        self.frames = {}
+        for student_id in self.session['students']:
+            columns = manager.get_student_session_data(SESSION_ID, student_id)
+            self.frames[student_id] = [
+                {
+                    'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                    'engagement_score': float(engagement),
+                    'emotion': manager.emotion_label(code)
+                }
+                for ts, engagement, code in zip(
+                    columns.timestamps.tolist(), columns.engagement.tolist(), columns.emotion.tolist()
+                )
+            ]
+
+    def get_session_data(self, session_id):
+        return self.session
+
+    def get_student_session_data(self, session_id, student_id):
+        return self.frames.get(student_id, [])
+
+
+def build_session(minutes: int = 5) -> SessionManager:
+    """Three students sending a frame every 10 seconds"""
+    manager = SessionManager(rollup_interval=float('inf'))
+    manager.create_session(SESSION_ID, 'teacher', 'math')
+    for student_id in STUDENTS:
+        manager.add_student_to_session(SESSION_ID, student_id)
+
+    rng = np.random.default_rng(3)
+    for step in range(minutes * 6):
+        for i, student_id in enumerate(STUDENTS):
+            manager.log_frame_data(SESSION_ID, student_id, FrameResult(
+                student_id, SESSION_ID,
+                emotion=EMOTIONS[int(rng.integers(len(EMOTIONS)))],
+                confidence=0.9,
+                engagement_score=float(rng.random()),
+                timestamp=START + step * 10 + i
+            ))
+    return manager
+
+
+def assert_close(actual: dict, expected: dict, tolerance: float = 0.11):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert abs(actual[key] - value) <= tolerance, (key, actual[key], value)
+
+
+def test_fused_analytics_match_the_legacy_engine():
+    manager = build_session()
+    legacy = LegacyAnalyticsEngine(LegacySessionView(manager))
+    analytics = AnalyticsEngine(manager).generate_session_analytics(SESSION_ID)
+
+    assert_close(analytics['emotion_distribution'], legacy.generate_emotion_distribution(SESSION_ID))
+
+    timeline = legacy.generate_engagement_timeline(SESSION_ID)
+    assert analytics['engagement_timeline']['timestamps'] == timeline['timestamps']
+    assert np.allclose(analytics['engagement_timeline']['engagement_scores'], timeline['engagement_scores'], atol=0.11)
+
+    comparison = legacy.generate_student_comparison(SESSION_ID)
+    assert analytics['student_comparison'].keys() == comparison.keys()
+    for student_id, metrics in comparison.items():
+        assert_close(analytics['student_comparison'][student_id], metrics)
+
+    # Every student has a frame in every minute, so the dense matrix has no gaps
+    heatmap = analytics['attention_heatmap']
+    assert heatmap['students'] == STUDENTS
+    assert heatmap['minutes'] == timeline['timestamps']
+    assert np.allclose(heatmap['values'], legacy.generate_attention_heatmap(SESSION_ID), atol=0.11)
+
+
+def test_topic_difficulty_matches_the_legacy_engine():
+    manager = build_session()
+    topics = [
+        {
+            'name': f'topic-{t}',
+            'start_time': datetime.fromtimestamp(START + t * 100).isoformat(),
+            'end_time': datetime.fromtimestamp(START + (t + 1) * 100 - 1).isoformat()
+        }
+        for t in range(3)
+    ]
+    legacy = LegacyAnalyticsEngine(LegacySessionView(manager))
+    analytics = AnalyticsEngine(manager).generate_session_analytics(SESSION_ID, topics)
+    assert_close(analytics['topic_difficulty'], legacy.generate_topic_difficulty(SESSION_ID, topics))
+
+
+def test_cached_analytics_are_recomputed_after_a_new_frame():
+    manager = build_session()
+    engine = AnalyticsEngine(manager)
+    first = engine.generate_session_analytics(SESSION_ID)
+    assert engine.generate_session_analytics(SESSION_ID) == first
+    assert (engine.hits, engine.misses) == (1, 1)
+
+    # A frame in a new minute bumps the session version
+    manager.log_frame_data(SESSION_ID, 'student-0', FrameResult(
+        'student-0', SESSION_ID, emotion='happy', engagement_score=1.0, timestamp=START + 3600
+    ))
+    refreshed = engine.generate_session_analytics(SESSION_ID)
+    assert engine.misses == 2
+    assert len(refreshed['engagement_timeline']['timestamps']) == len(first['engagement_timeline']['timestamps']) + 1
+    assert refreshed['student_comparison']['student-0']['participation'] == \
+        first['student_comparison']['student-0']['participation'] + 1
+
+
+def test_cache_evicts_the_least_recently_used_session():
+    manager = build_session()
+    manager.create_session('other', 'teacher', 'math')
+    engine = AnalyticsEngine(manager, cache_size=2)
+    engine.generate_session_analytics(SESSION_ID)
+    engine.generate_session_analytics('other')
+    engine.generate_session_analytics(SESSION_ID)  # now the most recent
+    engine.generate_session_analytics(SESSION_ID, topics=[])  # evicts 'other'
+    assert set(engine.cache) == {(SESSION_ID, ('analytics', None)), (SESSION_ID, ('analytics', ()))}
+    assert engine.evictions == 1
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
@@ -0,0 +1,113 @@
+"""
+Test the class ticker's ring-buffer window against a plain list of frames
+
+Runs with pytest or directly: python test_class_ticker.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from models.frame_result import FrameResult
+from services.class_ticker import ClassTicker, ClassWindow
+from services.frame_store import EmotionCodes
+
+WINDOW = 10
+AT_RISK = 0.3
+START = 1_800_000_000
+
+
+def naive_metrics(frames, now: float):
+    """Class metrics from every frame of the last WINDOW whole seconds"""
+    recent = [f for f in frames if int(f[1]) > int(now) - WINDOW]
+    if not recent:
+        return None
+    students = {}
+    for student_id, _, engagement, _ in recent:
+        students.setdefault(student_id, []).append(engagement)
+    return {
+        'frames': len(recent),
+        'engagement': sum(f[2] for f in recent) / len(recent),
+        'emotions': sorted(f[3] for f in recent),
+        'active_students': len(students),
+        'at_risk_students': sum(1 for scores in students.values() if np.mean(scores) < AT_RISK)
+    }
+
+
+def assert_matches(window: ClassWindow, frames, now: float):
+    expected = naive_metrics(frames, now)
+    metrics = window.metrics(now, AT_RISK)
+    if expected is None:
+        assert metrics is None
+        return
+    assert metrics['frames'] == expected['frames']
+    assert abs(metrics['engagement'] - expected['engagement']) < 1e-9
+    emotions = [code for code, count in enumerate(metrics['emotions'].tolist()) for _ in range(count)]
+    assert emotions == expected['emotions']
+    assert metrics['active_students'] == expected['active_students']
+    assert metrics['at_risk_students'] == expected['at_risk_students']
+
+
+def test_window_matches_naive_metrics_as_time_passes():
+    rng = np.random.default_rng(5)
+    window = ClassWindow(WINDOW, emotion_width=2, students=2)  # both grow on demand
+    frames = []
+    for step in range(400):
+        timestamp = START + step * 0.25
+        frame = (f'student-{int(rng.integers(5))}', timestamp, float(rng.random()), int(rng.integers(4)))
+        window.add(*frame)
+        frames.append(frame)
+        if step % 7 == 0:
+            assert_matches(window, frames, timestamp)
+
+
+def test_slots_expire_after_the_window():
+    window = ClassWindow(WINDOW)
+    frames = [('a', START, 0.9, 1), ('b', START + 3, 0.1, 2)]
+    for frame in frames:
+        window.add(*frame)
+    assert_matches(window, frames, START + WINDOW - 1)  # both inside
+    assert_matches(window, frames, START + WINDOW)  # the first has expired
+    assert window.metrics(START + WINDOW + 3, AT_RISK) is None
+
+    # A later lap reuses the slots without counting the old frames
+    frames.append(('a', START + 2 * WINDOW, 0.5, 0))
+    window.add(*frames[-1])
+    assert_matches(window, frames, START + 2 * WINDOW)
+
+
+def test_frames_older_than_a_reused_slot_are_ignored():
+    window = ClassWindow(WINDOW)
+    window.add('a', START + WINDOW, 0.5, 0)
+    window.add('a', START, 0.9, 0)  # same slot, a lap earlier
+    assert window.metrics(START + WINDOW, AT_RISK)['frames'] == 1
+
+
+def test_merged_shares_match_a_single_worker():
+    emotions = [EmotionCodes(), EmotionCodes()]
+    emotions[1].encode('sad')  # codes differ between workers
+    workers = [ClassTicker(codes, window=WINDOW) for codes in emotions]
+    single = ClassTicker(EmotionCodes(), window=WINDOW)
+    for step in range(40):
+        student_id = f'student-{step % 4}'
+        frame = FrameResult(
+            student_id, 'class', emotion=('happy', 'sad', 'neutral')[step % 3],
+            engagement_score=(step % 5) / 5, timestamp=START + step / 4
+        )
+        workers[step % 4 // 2].record('class', student_id, frame)
+        single.record('class', student_id, frame)
+
+    now = START + 10
+    workers[0].receive({'session_id': 'class', 'worker': 'other', 'share': workers[1].share('class', now)}, now)
+    merged = workers[0].tick_message('class', now)
+    assert merged == single.tick_message('class', now)
+    assert merged['active_students'] == 4
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
@@ -0,0 +1,88 @@
+"""
+Test LTTB downsampling against a straightforward per-bucket implementation
+
+Runs with pytest or directly: python test_downsampling.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.downsampling import lttb
+
+
+def naive_lttb(x, y, points):
+    """Largest-Triangle-Three-Buckets as usually written, one bucket at a time"""
+    n = len(x)
+    every = (n - 2) / (points - 2)
+    kept = [0]
+    a = 0
+    for i in range(points - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1 if i < points - 3 else n - 1
+        next_lo = hi
+        next_hi = min(int((i + 2) * every) + 1, n) if i < points - 3 else n
+        avg_x = sum(x[next_lo:next_hi]) / (next_hi - next_lo)
+        avg_y = sum(y[next_lo:next_hi]) / (next_hi - next_lo)
+
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def series(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64) * 60
+    y = np.clip(0.5 + 0.3 * np.sin(x / 3000) + rng.normal(0, 0.1, n), 0, 1)
+    return x, y
+
+
+def test_matches_naive_lttb():
+    for n, points in ((10, 3), (100, 7), (1000, 50), (1001, 999)):
+        x, y = series(n, seed=n)
+        assert lttb(x, y, points).tolist() == naive_lttb(x.tolist(), y.tolist(), points)
+
+
+def test_keeps_endpoints_and_point_count():
+    x, y = series(500)
+    for points in (3, 10, 64, 499):
+        kept = lttb(x, y, points)
+        assert len(kept) == points
+        assert kept[0] == 0 and kept[-1] == len(x) - 1
+        assert (np.diff(kept) > 0).all()
+
+
+def test_short_series_returned_whole():
+    x, y = series(20)
+    assert lttb(x, y, 20).tolist() == list(range(20))
+    assert lttb(x, y, 50).tolist() == list(range(20))
+
+
+def test_keeps_a_single_spike():
+    x, y = series(1000)
+    y[437] = 5.0
+    assert 437 in lttb(x, y, 20).tolist()
+
+
+def test_rejects_fewer_than_three_points():
+    x, y = series(100)
+    try:
+        lttb(x, y, 2)
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
@@ -0,0 +1,36 @@
+"""
+Test the frame store's on-disk spill layout
+
+Runs with pytest or directly: python test_frame_store.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.frame_store import FrameStore
+
+
+def test_dropping_session_never_removes_outside_its_own_directory():
+    with tempfile.TemporaryDirectory() as data_dir:
+        journal = os.path.join(data_dir, 'journal')
+        os.makedirs(journal)
+        store = FrameStore(data_dir=data_dir, spill_threshold=1)
+        for session_id in ['other', '', '.', '..', '../journal']:
+            store.append(session_id, 'student', 1.0, 0.5, 0.9, 0)
+            store.append(session_id, 'student', 2.0, 0.5, 0.9, 0)
+        assert store.spilled == {'other', '', '.', '..', '../journal'}
+
+        for session_id in ['', '.', '..', '../journal']:
+            store.drop_session(session_id)
+
+        assert os.path.isdir(journal)
+        assert store.get('other', 'student').timestamps.tolist() == [1.0, 2.0]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
@@ -0,0 +1,79 @@
+"""
+Test engagement quantile sketches against exact quantiles
+
+Runs with pytest or directly: python test_quantile_sketch.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.quantile_sketch import QuantileSketch
+
+QS = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+def sample(seed: int, size: int = 5000) -> np.ndarray:
+    """Skewed engagement scores in [0, 1]"""
+    return np.random.default_rng(seed).beta(2, 5, size)
+
+
+def assert_within_one_bin(sketch: QuantileSketch, values: np.ndarray):
+    exact = np.quantile(values, QS, method='inverted_cdf')
+    error = np.abs(sketch.quantiles(QS) - exact)
+    assert (error <= 1 / sketch.bins + 1e-9).all(), dict(zip(QS, error.tolist()))
+
+
+def test_quantiles_within_one_bin_of_exact():
+    values = sample(1)
+    for bins in (10, 100, 1000):
+        sketch = QuantileSketch(bins=bins)
+        sketch.add_many(values)
+        assert sketch.count == len(values)
+        assert_within_one_bin(sketch, values)
+
+
+def test_single_adds_match_bulk_adds():
+    values = sample(2, 500)
+    bulk = QuantileSketch()
+    bulk.add_many(values)
+    single = QuantileSketch()
+    for value in values.tolist():
+        single.add(value)
+    assert single.counts.tolist() == bulk.counts.tolist()
+
+
+def test_merged_sketch_matches_a_sketch_of_all_values():
+    parts = [sample(seed, 1000) for seed in range(3)]
+    merged = QuantileSketch()
+    for values in parts:
+        sketch = QuantileSketch()
+        sketch.add_many(values)
+        merged.merge(QuantileSketch.from_bins(sketch.to_bins()))  # as stored in Redis
+    whole = np.concatenate(parts)
+    assert merged.count == len(whole)
+    assert_within_one_bin(merged, whole)
+
+
+def test_rank_within_one_bin_of_exact():
+    values = sample(4)
+    sketch = QuantileSketch()
+    sketch.add_many(values)
+    for value in (0.05, 0.2, 0.5, 0.8):
+        exact = float((values < value).mean())
+        assert abs(sketch.rank(value) - exact) <= float((np.abs(values - value) < 1 / sketch.bins).mean())
+
+
+def test_empty_sketch():
+    sketch = QuantileSketch()
+    assert np.isnan(sketch.quantile(0.5))
+    assert sketch.rank(0.5) == 0.0
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
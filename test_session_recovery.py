@@ -0,0 +1,159 @@
+"""
+Test crash recovery from the session journal
+
+Runs with pytest or directly: python test_session_recovery.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models.frame_result import FrameResult
+from services.session_journal import SessionJournal
+from services.session_manager import SessionManager
+
+STUDENTS = ['student-0', 'student-1']
+
+
+def start_manager(data_dir: str, spill_threshold: int = 50) -> SessionManager:
+    """A manager over data_dir, recovered from whatever the journal holds"""
+    manager = SessionManager(
+        journal=SessionJournal(data_dir=data_dir, snapshot_events=10 ** 9),
+        data_dir=data_dir,
+        spill_threshold=spill_threshold,
+        rollup_interval=float('inf')
+    )
+    manager.recover()
+    return manager
+
+
+def log_frames(manager: SessionManager, session_id: str, count: int):
+    now = time.time()
+    for i in range(count):
+        student_id = STUDENTS[i % len(STUDENTS)]
+        manager.log_frame_data(session_id, student_id, FrameResult(
+            student_id, session_id, emotion='happy', confidence=0.9,
+            engagement_score=(i % 10) / 10, timestamp=now + i
+        ))
+
+
+def open_session(manager: SessionManager, session_id: str):
+    manager.create_session(session_id, 'teacher', 'math')
+    for student_id in STUDENTS:
+        manager.add_student_to_session(session_id, student_id)
+
+
+def wait_for_snapshot(manager: SessionManager):
+    manager.snapshot()
+    deadline = time.time() + 5
+    while manager.journal.snapshot_in_progress and time.time() < deadline:
+        time.sleep(0.01)
+    assert not manager.journal.snapshot_in_progress
+
+
+def test_recover_spilled_session_with_snapshot():
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = start_manager(data_dir)
+        open_session(manager, 'live')
+        log_frames(manager, 'live', 100)
+        wait_for_snapshot(manager)
+        log_frames(manager, 'live', 30)
+        expected = {s: manager.get_student_session_data('live', s).timestamps.copy() for s in STUDENTS}
+        manager.close()
+
+        recovered = start_manager(data_dir)
+        assert 'live' in recovered.frame_store.spilled
+        for student_id, timestamps in expected.items():
+            assert recovered.get_student_session_data('live', student_id).timestamps.tolist() == timestamps.tolist()
+        assert recovered.get_session_data('live')['total_frames_processed'] == 130
+        recovered.close()
+
+
+def test_recover_after_spilled_session_was_released():
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = start_manager(data_dir)
+        open_session(manager, 'archived')
+        open_session(manager, 'live')
+        log_frames(manager, 'archived', 100)
+        log_frames(manager, 'live', 10)
+        wait_for_snapshot(manager)
+        manager.end_session('archived')
+        manager.release_frames('archived')  # what archival does once the COPY commits
+        manager.close()
+
+        recovered = start_manager(data_dir)
+        assert recovered.get_session_data('archived')['archived']
+        assert recovered.frame_store.frame_count('archived') == 0
+        assert 'archived' not in recovered.frame_store.spilled
+        assert recovered.frame_store.frame_count('live') == 10
+        recovered.close()
+
+
+def test_recover_when_release_was_not_journaled():
+    """The spill files are gone but the archive event was lost with the last fsync interval"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = start_manager(data_dir)
+        open_session(manager, 'archived')
+        log_frames(manager, 'archived', 100)
+        wait_for_snapshot(manager)
+        manager.journal.record_archive = lambda session_id: None
+        manager.release_frames('archived')
+        manager.close()
+
+        recovered = start_manager(data_dir)
+        assert recovered.frame_store.frame_count('archived') == 0
+        assert 'archived' not in recovered.frame_store.spilled
+        log_frames(recovered, 'archived', 5)  # new frames go to memory, not into the removed directory
+        assert recovered.frame_store.frame_count('archived') == 5
+        recovered.close()
+
+
+def test_snapshot_drops_streams_of_ended_sessions():
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = start_manager(data_dir)
+        open_session(manager, 'ended')
+        open_session(manager, 'live')
+        log_frames(manager, 'ended', 10)
+        manager.end_session('ended')
+        wait_for_snapshot(manager)
+        assert {session_id for session_id, _ in manager.journal.stream_ids} == {'live'}
+
+        log_frames(manager, 'ended', 4)  # late frames register their streams again
+        log_frames(manager, 'live', 6)
+        manager.close()
+
+        recovered = start_manager(data_dir)
+        assert recovered.frame_store.frame_count('ended') == 14
+        assert recovered.frame_store.frame_count('live') == 6
+        assert recovered.get_session_data('ended')['students'] == STUDENTS
+        recovered.close()
+
+
+def test_recover_cross_session_sketches():
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = start_manager(data_dir)
+        open_session(manager, 'before')
+        log_frames(manager, 'before', 10)
+        manager.end_session('before')
+        manager.release_frames('before')  # its frames are gone; only the sketch remembers them
+        wait_for_snapshot(manager)
+        open_session(manager, 'after')
+        log_frames(manager, 'after', 6)
+        manager.end_session('after')  # folded in after the snapshot, so only in the log
+        expected = manager.read_sketch('subject:math').counts.copy()
+        manager.close()
+
+        recovered = start_manager(data_dir)
+        assert recovered.read_sketch('subject:math').count == 16
+        assert recovered.read_sketch('subject:math').counts.tolist() == expected.tolist()
+        assert recovered.read_sketch('student:student-0').count == 8
+        recovered.close()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name:<50} PASSED")
@@ -4,6 +4,17 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+
+def _parse_weights(value: str) -> dict:
+    """Parse 'session_a:2,session_b:0.5' into {session_id: weight}"""
+    weights = {}
+    for item in value.split(','):
+        if ':' in item:
+            session_id, weight = item.rsplit(':', 1)
+            weights[session_id.strip()] = float(weight)
+    return weights
+
+
 class Config:
     """Application configuration"""
     
@@ -16,9 +27,84 @@ class Config:
     MODEL_NAME = os.getenv("MODEL_NAME", "dima806/facial_emotions_image_detection")
     FRAME_PROCESSING_INTERVAL = int(os.getenv("FRAME_PROCESSING_INTERVAL", 2))
     
+    # Frame Pipeline (workers per stage, bounded queues between stages)
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 64))
+    PIPELINE_DECODE_WORKERS = int(os.getenv("PIPELINE_DECODE_WORKERS", 2))
+    PIPELINE_DETECT_WORKERS = int(os.getenv("PIPELINE_DETECT_WORKERS", 2))
+    PIPELINE_CLASSIFY_WORKERS = int(os.getenv("PIPELINE_CLASSIFY_WORKERS", 1))
+    PIPELINE_ANALYTICS_WORKERS = int(os.getenv("PIPELINE_ANALYTICS_WORKERS", 1))
+    CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", 8))
+    CLASSIFY_BATCH_WAIT_MS = int(os.getenv("CLASSIFY_BATCH_WAIT_MS", 10))
+    PRIORITY_AGING_SECONDS = float(os.getenv("PRIORITY_AGING_SECONDS", 2.0))
+    
+    # Fair-share Scheduling (split inference capacity across sessions)
+    SESSION_QUEUE_LIMIT = int(os.getenv("SESSION_QUEUE_LIMIT", 32))
+    DEFAULT_SESSION_WEIGHT = float(os.getenv("DEFAULT_SESSION_WEIGHT", 1.0))
+    SESSION_WEIGHTS = _parse_weights(os.getenv("SESSION_WEIGHTS", ""))
+    
+    # Admission Control (capacity 0 = use the emotion detector benchmark)
+    ADMISSION_CAPACITY_FPS = float(os.getenv("ADMISSION_CAPACITY_FPS", 0))
+    ADMISSION_TARGET_UTILIZATION = float(os.getenv("ADMISSION_TARGET_UTILIZATION", 0.85))
+    ADMISSION_MAX_INTERVAL = float(os.getenv("ADMISSION_MAX_INTERVAL", 10))
+    ADMISSION_RETRY_SECONDS = float(os.getenv("ADMISSION_RETRY_SECONDS", 30))
+    
+    # Adaptive Sampling (back off processing for students with stable engagement)
+    SAMPLER_ENABLED = os.getenv("SAMPLER_ENABLED", "True").lower() == "true"
+    SAMPLER_BASE_INTERVAL = float(os.getenv("SAMPLER_BASE_INTERVAL", 4))
+    SAMPLER_MAX_INTERVAL = float(os.getenv("SAMPLER_MAX_INTERVAL", 16))
+    SAMPLER_MIN_CONFIDENCE = float(os.getenv("SAMPLER_MIN_CONFIDENCE", 0.9))
+    SAMPLER_MAX_STD = float(os.getenv("SAMPLER_MAX_STD", 0.05))
+    SAMPLER_DIFF_THRESHOLD = float(os.getenv("SAMPLER_DIFF_THRESHOLD", 12.0))
+    
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./classroom.db")
     
+    # Session Storage (frames spill to memory-mapped files past the threshold)
+    DATA_DIR = os.getenv("DATA_DIR", "data")
+    SPILL_THRESHOLD_FRAMES = int(os.getenv("SPILL_THRESHOLD_FRAMES", 100000))
+    RAW_RETENTION_SECONDS = int(os.getenv("RAW_RETENTION_SECONDS", 600))  # older frames become minute rollups
+    ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", 60))
+    SESSION_LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", 64))
+    ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", 256))  # cached analytics results (LRU)
+    QUANTILE_SKETCH_BINS = int(os.getenv("QUANTILE_SKETCH_BINS", 200))  # engagement percentile resolution
+    
+    # Live class metrics (class_tick pushed to subscribed dashboards)
+    CLASS_TICK_INTERVAL = float(os.getenv("CLASS_TICK_INTERVAL", 1.0))
+    CLASS_TICK_WINDOW_SECONDS = int(os.getenv("CLASS_TICK_WINDOW_SECONDS", 30))
+    CLASS_TICK_AT_RISK = float(os.getenv("CLASS_TICK_AT_RISK", 0.3))  # window mean engagement below this
+    
+    # Reports (rendered on a worker pool, one cached file per session version)
+    REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+    REPORT_GRACE_SECONDS = float(os.getenv("REPORT_GRACE_SECONDS", 300))  # superseded files outlive downloads under way
+    REPORT_MAX_JOBS = int(os.getenv("REPORT_MAX_JOBS", 1000))  # finished jobs remembered beyond that are evicted
+    REPORT_BATCH_WORKERS = int(os.getenv("REPORT_BATCH_WORKERS", 0))  # nightly batch processes, 0 = one per CPU
+    
+    # Alerting (replay recorded sessions with services/alert_backtest.py to tune)
+    ALERT_CRITICAL_ENGAGEMENT = float(os.getenv("ALERT_CRITICAL_ENGAGEMENT", 0.3))
+    ALERT_WARNING_MINUTES = float(os.getenv("ALERT_WARNING_MINUTES", 5.0))  # predicted time to critical
+    ALERT_EMOTION_ENGAGEMENT = float(os.getenv("ALERT_EMOTION_ENGAGEMENT", 0.5))  # sad/fear below this
+    ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", 30))
+    PREDICTOR_WINDOW = int(os.getenv("PREDICTOR_WINDOW", 10))
+    PREDICTOR_SLOPE_THRESHOLD = float(os.getenv("PREDICTOR_SLOPE_THRESHOLD", 0.05))  # per frame
+    
+    # Session Journal (write-ahead log + snapshots for crash recovery)
+    JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "True").lower() == "true"
+    JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", 1.0))
+    JOURNAL_SNAPSHOT_EVENTS = int(os.getenv("JOURNAL_SNAPSHOT_EVENTS", 500000))
+    
+    # Session Archival (ended sessions are copied to Postgres and freed from memory)
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "True").lower() == "true"
+    ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", 50000))
+    ARCHIVE_RESTORE_CACHE = int(os.getenv("ARCHIVE_RESTORE_CACHE", 4))
+    SESSION_ROLLUPS_ENABLED = os.getenv("SESSION_ROLLUPS_ENABLED", "True").lower() == "true"  # per teacher/subject trends
+    
+    # Shared Session State (Redis; lets several uvicorn workers serve one class)
+    SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", "False").lower() == "true"
+    SHARED_STATE_FLUSH_MS = int(os.getenv("SHARED_STATE_FLUSH_MS", 100))
+    SHARED_STATE_TTL = int(os.getenv("SHARED_STATE_TTL", 86400))
+    SHARED_ARCHIVE_WAIT_SECONDS = float(os.getenv("SHARED_ARCHIVE_WAIT_SECONDS", 15))  # end_session waits for the merge
+    SHARED_ARCHIVE_TIMEOUT = float(os.getenv("SHARED_ARCHIVE_TIMEOUT", 600))  # then rollups give up on it
+    
     # Redis
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
@@ -1,16 +1,21 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Dict, List, Set
 import json
 
 class ConnectionManager:
     """
     Manage WebSocket connections for students and teachers
+    
+    With shared state attached, broadcasts are also published to the other
+    workers, which deliver them to the sockets they hold.
     """
     
-    def __init__(self):
+    def __init__(self, shared=None):
         self.active_students: Dict[str, WebSocket] = {}
         self.active_teachers: List[WebSocket] = []
         self.student_sessions: Dict[str, str] = {}  # student_id -> session_id
+        self.session_teachers: Dict[str, Set[WebSocket]] = {}  # session_id -> subscribed dashboards
+        self.shared = shared  # SharedSessionState or None
     
     async def connect_student(self, websocket: WebSocket, student_id: str, session_id: str):
         """Connect a student"""
@@ -37,6 +42,19 @@ class ConnectionManager:
         if websocket in self.active_teachers:
             self.active_teachers.remove(websocket)
             print(f"📊 Teacher dashboard disconnected")
+        for session_id in list(self.session_teachers):
+            self.unsubscribe_teacher(websocket, session_id)
+    
+    def subscribe_teacher(self, websocket: WebSocket, session_id: str):
+        """Have a dashboard receive a session's live class metrics"""
+        self.session_teachers.setdefault(session_id, set()).add(websocket)
+    
+    def unsubscribe_teacher(self, websocket: WebSocket, session_id: str):
+        dashboards = self.session_teachers.get(session_id)
+        if dashboards is not None:
+            dashboards.discard(websocket)
+            if not dashboards:
+                del self.session_teachers[session_id]
     
     async def send_to_student(self, student_id: str, message: dict):
         """Send message to specific student"""
@@ -49,11 +67,17 @@ class ConnectionManager:
     
     async def broadcast_to_teachers(self, message: dict):
         """Broadcast message to all teacher dashboards"""
+        if self.shared:
+            self.shared.publish({'target': 'teachers', 'message': message})
+        await self._send_to_local_teachers(message)
+    
+    async def _send_to_local_teachers(self, message: dict):
         dead_connections = []
+        text = json.dumps(message)  # Serialize once for every dashboard
         
         for websocket in self.active_teachers:
             try:
-                await websocket.send_text(json.dumps(message))
+                await websocket.send_text(text)
             except Exception as e:
                 print(f"❌ Error broadcasting to teacher: {e}")
                 dead_connections.append(websocket)
@@ -62,12 +86,38 @@ class ConnectionManager:
         for websocket in dead_connections:
             self.disconnect_teacher(websocket)
     
+    async def send_to_session_teachers(self, session_id: str, message: dict):
+        """Send message to the dashboards subscribed to a session on this worker"""
+        dashboards = self.session_teachers.get(session_id)
+        if not dashboards:
+            return
+        
+        text = json.dumps(message)
+        for websocket in list(dashboards):
+            try:
+                await websocket.send_text(text)
+            except Exception as e:
+                print(f"❌ Error sending to teacher: {e}")
+                self.disconnect_teacher(websocket)
+    
     async def broadcast_to_session(self, session_id: str, message: dict):
         """Send message to all students in a session"""
-        for student_id, s_id in self.student_sessions.items():
+        if self.shared:
+            self.shared.publish({'target': 'session', 'session_id': session_id, 'message': message})
+        await self._send_to_local_session(session_id, message)
+    
+    async def _send_to_local_session(self, session_id: str, message: dict):
+        for student_id, s_id in list(self.student_sessions.items()):
             if s_id == session_id:
                 await self.send_to_student(student_id, message)
     
+    async def deliver(self, event: dict):
+        """Deliver a broadcast published by another worker to local sockets"""
+        if event.get('target') == 'teachers':
+            await self._send_to_local_teachers(event['message'])
+        elif event.get('target') == 'session':
+            await self._send_to_local_session(event['session_id'], event['message'])
+    
     def get_session_students(self, session_id: str) -> List[str]:
         """Get all students in a session"""
         return [